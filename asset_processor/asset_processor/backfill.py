@@ -0,0 +1,109 @@
+import argparse
+import traceback
+
+import tiktoken
+from psycopg2.extras import execute_values
+
+from envs import OPENAI_MODEL
+from db import db
+from helpers.capture_exception import capture_exception
+from helpers.utils import get_content_hash
+from logger import logger
+
+
+# fills `num_tokens`, `content_hash` and `chunk_index` of the embeddings stored before the
+# processor started writing them. safe to stop and re-run, only rows without a content
+# hash (or chunk index) are touched
+def backfill_tokens_and_hashes(encoder, batch_size: int):
+    last_id = 0
+    total = 0
+    while True:
+        with db.connection() as conn:
+            with conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, owner_bot_id, chunk_text
+                    FROM public.embedding
+                    WHERE content_hash IS NULL AND id > %s
+                    ORDER BY id
+                    LIMIT %s;
+                """, (last_id, batch_size))
+                rows = cur.fetchall()
+                if len(rows) == 0:
+                    break
+
+                tokens = encoder.encode_batch([row[2] for row in rows])
+                values = [
+                    (row[0], row[1], len(tokens[i]), get_content_hash(row[2]))
+                    for i, row in enumerate(rows)
+                ]
+                execute_values(cur, """
+                    UPDATE public.embedding e
+                    SET num_tokens = v.num_tokens, content_hash = v.content_hash
+                    FROM (VALUES %s) AS v (id, owner_bot_id, num_tokens, content_hash)
+                    WHERE e.id = v.id AND e.owner_bot_id = v.owner_bot_id;
+                """, values)
+
+        last_id = rows[-1][0]
+        total += len(rows)
+        logger.info(f"backfilled token counts and hashes of {total} embeddings")
+
+
+def backfill_chunk_indexes(batch_size: int):
+    # chunks of an asset were inserted in order, so the ordinal follows the ids. assets are
+    # always stored whole, either all of their chunks have an index or none of them.
+    # embedding has no index on asset_id: the assets are read once along with their
+    # partition (owner bot), then updated a range of asset ids of one partition at a time
+    with db.transaction() as cur:
+        cur.execute("""
+            SELECT DISTINCT owner_bot_id, asset_id
+            FROM public.embedding
+            WHERE chunk_index IS NULL
+            ORDER BY owner_bot_id, asset_id;
+        """)
+        assets = cur.fetchall()
+
+    ranges = []
+    for owner_bot_id, asset_id in assets:
+        if len(ranges) > 0 and ranges[-1][0] == owner_bot_id and ranges[-1][3] < batch_size:
+            ranges[-1][2] = asset_id
+            ranges[-1][3] += 1
+        else:
+            ranges.append([owner_bot_id, asset_id, asset_id, 1])
+
+    total = 0
+    for owner_bot_id, first_asset_id, last_asset_id, _ in ranges:
+        with db.transaction() as cur:
+            cur.execute("""
+                UPDATE public.embedding e
+                SET chunk_index = o.chunk_index
+                FROM (
+                    SELECT id, owner_bot_id,
+                        row_number() OVER (PARTITION BY asset_id ORDER BY id) - 1 AS chunk_index
+                    FROM public.embedding
+                    WHERE owner_bot_id = %(owner_bot_id)s AND chunk_index IS NULL
+                    AND asset_id BETWEEN %(first_asset_id)s AND %(last_asset_id)s
+                ) o
+                WHERE e.owner_bot_id = %(owner_bot_id)s AND e.id = o.id;
+            """, {"owner_bot_id": owner_bot_id, "first_asset_id": first_asset_id,
+                  "last_asset_id": last_asset_id})
+            total += cur.rowcount
+
+        logger.info(f"backfilled chunk indexes of {total} embeddings")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Backfill token counts, content hashes and chunk indexes of stored embeddings")
+    parser.add_argument("--batch-size", type=int, default=500)
+    # assets per chunk index update
+    parser.add_argument("--asset-batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    try:
+        backfill_tokens_and_hashes(
+            tiktoken.encoding_for_model(OPENAI_MODEL), args.batch_size)
+        backfill_chunk_indexes(args.asset_batch_size)
+    except Exception as e:
+        capture_exception(e)
+        traceback.print_exc()
+        raise
@@ -1,42 +1,45 @@
-import string
+from concurrent.futures import ThreadPoolExecutor
+import signal
 import math
 import threading
 import datetime
 import os
 import json
-import re
+import hashlib
 import time
 import warnings
 import glob
 import traceback
 
 import sentry_sdk
-from openai import OpenAI
-from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import Docx2txtLoader
-from langchain_community.document_loaders.parsers.pdf import PDFPlumberParser
-from langchain_community.document_loaders.blob_loaders import Blob
 import amqpstorm
-from bs4 import BeautifulSoup
+from psycopg2.extras import execute_values
 
 from envs import (
     INPUT_QUEUE_NAME,
-    OPENAI_API_KEY,
     RABBITMQ_URL,
     TMP_FOLDER_PATH,
-    OPENAI_MODEL,
-    OPENAI_EMBEDDING_MODEL,
-    CHUNK_OVERLAP_TOKENS,
-    CHUNK_SIZE_TOKENS,
-    OPENAI_EMBEDDINGS_DIMS,
     PRACTICE_URL_SUCCESS_RATE,
+    EMBEDDING_CACHE_RETENTION_DAYS,
+    MAX_IN_FLIGHT_ASSETS,
     SENTRY_DSN,
     ENV
 )
 from db import db
+from db.copy import copy_embeddings
+from helpers.embedding_batcher import embedding_batcher
+from helpers.embedding_cache import embedding_cache
+from helpers.boilerplate import drop_seen_blocks, release_blocks, release_claims
+from helpers.parse import (
+    parse_pool,
+    extract_file_chunks,
+    extract_html_chunks,
+    extract_html_blocks,
+    split_documents
+)
 from helpers.schema import InputMessageSchema
 from helpers.utils import download_file_from_url
+from helpers.validators import get_page_validators, is_unchanged
 from helpers.scrape import scrape_url_smartproxy
 from logger import logger, set_prefix
 from helpers.capture_exception import capture_exception
@@ -46,15 +49,177 @@ sentry_sdk.init(
     environment=ENV
 )
 warnings.filterwarnings("ignore")
-connection = amqpstorm.UriConnection(RABBITMQ_URL)
-channel = connection.channel()
-
-channel.queue.declare(queue=INPUT_QUEUE_NAME, durable=True)
+# connected in main, the module is also imported by the parse worker processes
+connection = None
+channel = None
 
 if not os.path.exists(TMP_FOLDER_PATH):
     os.makedirs(TMP_FOLDER_PATH, exist_ok=True)
 
 
+def isnumber(x):
+    try:
+        return math.isfinite(x)
+    except:
+        return False
+
+
+def store_chunks(cur, chunks: list, asset_id: int, bot_id: int, chunk_indexes: list):
+    # returns how many of the chunks had to be embedded
+    content_hashes = [chunk.content_hash for chunk in chunks]
+
+    # create embeddings for the chunks that are not in the embedding cache yet
+    embeddings = embedding_cache.get_many(content_hashes)
+    missing = {chunk.content_hash: chunk for chunk in chunks
+               if chunk.content_hash not in embeddings}
+    if len(missing) > 0:
+        # batched (and shared with the other assets in flight) by the batcher
+        new_embeddings = dict(zip(missing.keys(), embedding_batcher.embed(
+            [chunk.text.replace("\n", " ") for chunk in missing.values()],
+            [chunk.num_tokens for chunk in missing.values()]
+        )))
+        embedding_cache.put_many(new_embeddings)
+        embeddings.update(new_embeddings)
+
+    # save the chunks and their embeddings to the db in a single COPY.
+    # embeddings are partitioned by the staging bot that owns the asset,
+    # which is the bot the backend queues assets for. the token count and
+    # the content hash are used by the backend to budget prompts and to
+    # dedupe identical chunks
+    copy_embeddings(cur, [
+        (
+            embeddings[chunk.content_hash],
+            chunk.text,
+            json.dumps(chunk.metadata) if chunk.metadata else "{}",
+            asset_id,
+            bot_id,
+            chunk.num_tokens,
+            chunk.content_hash,
+            chunk_index
+        )
+        for chunk, chunk_index in zip(chunks, chunk_indexes)
+    ])
+
+    return len(missing)
+
+
+def get_batches(cur, asset_data, asset_id: int, mime_type: str):
+    # downloads/scrapes the asset, parsing and splitting run in a worker process (see
+    # helpers/parse.py) which streams back the chunks in batches. returns the batches and,
+    # for sitemap pages, the blocks this visit claimed (see drop_seen_blocks)
+    if asset_data["type"] == "file":
+        # Download and save the file to the tmp folder.
+        file_path = download_file_from_url(
+            asset_data["value"], TMP_FOLDER_PATH, logger)
+
+        logger.info(
+            f"File with url {asset_data['value']} downloaded to {file_path}")
+
+        if file_path is None:
+            raise Exception(
+                f"Failed to download file from url: {asset_data['value']}")
+
+        logger.info(f"File mime type: {mime_type}")
+        return parse_pool.stream(extract_file_chunks, file_path, mime_type), []
+
+    # use proxy to get html from the url
+    html = scrape_url_smartproxy(asset_data["value"], logger)
+    if html is None:
+        raise Exception(
+            f"Failed to get html from url: {asset_data['value']}")
+
+    if isnumber(asset_data["parent_asset_id"]):
+        # a sitemap page: blocks already stored for a sibling page
+        # (site chrome, cookie banners) are not chunked again
+        pages = parse_pool.run(extract_html_blocks, html)
+        documents, claimed = drop_seen_blocks(
+            cur, pages, int(asset_data["parent_asset_id"]), asset_id)
+        return parse_pool.stream(split_documents, documents), claimed
+
+    return parse_pool.stream(extract_html_chunks, html), []
+
+
+def insert_chunks(cur, batches, asset_id: int, bot_id: int):
+    # chunks are embedded and inserted a batch at a time, as the worker parses the
+    # document. returns the content hash of the whole asset
+    asset_hash = hashlib.sha256()
+    num_chunks = 0
+    num_embedded = 0
+    for chunks in batches:
+        num_embedded += store_chunks(cur, chunks, asset_id, bot_id,
+                                     list(range(num_chunks, num_chunks + len(chunks))))
+        num_chunks += len(chunks)
+        for chunk in chunks:
+            asset_hash.update(chunk.content_hash.encode("utf-8"))
+
+    logger.info(
+        f"{num_chunks} chunks, {num_embedded} embedded, the rest from the embedding cache "
+        f"(cache stats: {embedding_cache.stats()})")
+
+    return asset_hash.hexdigest()
+
+
+def refresh_chunks(cur, batches, asset_id: int, bot_id: int):
+    # re-crawl of an asset: the stored chunks whose content hash is still there are kept (only
+    # their position is updated), new ones are embedded and inserted and the ones that are
+    # gone are deleted. returns the content hash of the whole asset
+    # refreshes of the same asset (a second refresh request, or messages processed in
+    # parallel) are serialised on the asset row, held until the transaction ends. a refresh
+    # that waited reads the chunks the previous one stored
+    cur.execute("SELECT id FROM public.asset WHERE id = %s FOR UPDATE;", (asset_id,))
+    cur.execute("""
+        SELECT id, content_hash, chunk_index
+        FROM public.embedding
+        WHERE owner_bot_id = %s AND asset_id = %s;
+    """, (bot_id, asset_id))
+    stored = {}
+    for id, content_hash, chunk_index in cur.fetchall():
+        stored.setdefault(content_hash, []).append((id, chunk_index))
+
+    asset_hash = hashlib.sha256()
+    num_chunks = 0
+    num_embedded = 0
+    num_inserted = 0
+    moved = []
+    for chunks in batches:
+        new_chunks = []
+        new_chunk_indexes = []
+        for chunk_index, chunk in enumerate(chunks, start=num_chunks):
+            asset_hash.update(chunk.content_hash.encode("utf-8"))
+            if len(stored.get(chunk.content_hash, [])) > 0:
+                id, stored_chunk_index = stored[chunk.content_hash].pop()
+                if stored_chunk_index != chunk_index:
+                    moved.append((id, chunk_index))
+            else:
+                new_chunks.append(chunk)
+                new_chunk_indexes.append(chunk_index)
+
+        if len(new_chunks) > 0:
+            num_embedded += store_chunks(cur, new_chunks,
+                                         asset_id, bot_id, new_chunk_indexes)
+            num_inserted += len(new_chunks)
+        num_chunks += len(chunks)
+
+    if len(moved) > 0:
+        execute_values(cur, f"""
+            UPDATE public.embedding e SET chunk_index = v.chunk_index
+            FROM (VALUES %s) AS v (id, chunk_index)
+            WHERE e.owner_bot_id = {int(bot_id)} AND e.id = v.id;
+        """, moved)
+
+    gone = [id for rows in stored.values() for id, _ in rows]
+    if len(gone) > 0:
+        cur.execute("""
+            DELETE FROM public.embedding WHERE owner_bot_id = %s AND id = ANY(%s);
+        """, (bot_id, gone))
+
+    logger.info(
+        f"{num_chunks} chunks, {num_chunks - num_inserted} unchanged, {num_inserted} new "
+        f"({num_embedded} embedded), {len(gone)} deleted")
+
+    return asset_hash.hexdigest()
+
+
 def handle_message(message):
     try:
         input_msg = message.body
@@ -69,6 +234,13 @@ def handle_message(message):
     bot_id = parsed_msg['bot_id']
     asset_id = parsed_msg['asset_id']
     mime_type = parsed_msg.get('mime_type')
+    # re-crawl of an asset processed before, see refresh_chunks
+    refresh = parsed_msg.get('refresh', False)
+    # lastmod of the page in its sitemap, for sitemap pages
+    lastmod = parsed_msg.get('lastmod')
+    # re-parsed even when unchanged, sent when the blocks of a removed sitemap page have
+    # to be stored with a sibling page
+    force = parsed_msg.get('force', False)
     set_prefix(logger, f"bot_id={bot_id}, asset_id={asset_id}")
     try:
         # If the bot status is `FAILED`, do not process the asset.
@@ -85,7 +257,7 @@ def handle_message(message):
 
         # Get all assets for the bot from the db.
         bot_assets = db.query(f"""
-                              SELECT a.id, a.status, a.type, a.value, a.parent_asset_id
+                              SELECT a.id, a.status, a.type, a.value, a.parent_asset_id, a.asset_metadata
                               FROM public.asset a
                               WHERE a.id IN (
                                 SELECT ba.asset_id
@@ -116,144 +288,88 @@ def handle_message(message):
             logger.info(f"Bot is in PROGRESS now")
 
         asset_data = asset_data.iloc[0]
-        if asset_data["status"] != "PENDING":
+        # a refresh only re-crawls assets that were processed successfully
+        if refresh and asset_data["status"] != "SUCCESS":
+            raise Exception(
+                f"Asset with id {asset_id} is not SUCCESS. Skipping refresh of asset {asset_id}")
+        if not refresh and asset_data["status"] != "PENDING":
             raise Exception(
                 f"Asset with id {asset_id} is not PENDING. Skipping processing of asset {asset_id}")
 
+        # sitemap blocks claimed by this visit, committed before the asset's chunks
+        claimed = []
         try:
-            with db.connection:
-                with db.connection.cursor() as cur:
-                    logger.info("Processing asset")
-
-                    if asset_data["type"] == "file":
-                        # Download and save the file to the tmp folder.
-                        file_path = download_file_from_url(
-                            asset_data["value"], TMP_FOLDER_PATH, logger)
-
+            with db.connection() as conn:
+                with conn, conn.cursor() as cur:
+                    logger.info(
+                        "Refreshing asset" if refresh else "Processing asset")
+
+                    asset_metadata = dict(asset_data["asset_metadata"]) \
+                        if isinstance(asset_data["asset_metadata"], dict) else {}
+                    # http validators of the page, stored so that a refresh can skip it
+                    # without scraping when it has not changed
+                    validators = get_page_validators(
+                        asset_data["value"]) if asset_data["type"] == "url" else {}
+
+                    is_modified = not (refresh and not force and is_unchanged(
+                        asset_metadata, validators, lastmod))
+                    if not is_modified:
                         logger.info(
-                            f"File with url {asset_data['value']} downloaded to {file_path}")
-
-                        if file_path is None:
-                            raise Exception(
-                                f"Failed to download file from url: {asset_data['value']}")
-
-                        # get the mime type of the file
-                        # if file is pdf, use the pdf text extractor
-                        # if file is doc/docx, use the doc text extractor
-                        # raise exception for other file types
-                        logger.info(f"File mime type: {mime_type}")
-                        if mime_type == "application/pdf":
-                            logger.debug(f"Processing pdf file {file_path}")
-                            with open(file_path, 'rb') as file:
-                                blob = Blob(data=file.read(), source=file_path)
-                            parser = PDFPlumberParser(extract_images=False)
-                            documents = parser.lazy_parse(blob)
-                        elif mime_type in ["application/msword", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"]:
-                            logger.debug(f"Processing doc file {file_path}")
-                            loader = Docx2txtLoader(file_path)
-                            documents = loader.lazy_load()
-                        else:
-                            raise Exception(
-                                f"Invalid mimetype {mime_type} for file {file_path}")
+                            "Asset not modified since it was last crawled. Keeping its chunks")
                     else:
-                        # use proxy to get html from the url
-                        html = scrape_url_smartproxy(
-                            asset_data["value"], logger)
-                        if html is None:
-                            raise Exception(
-                                f"Failed to get html from url: {asset_data['value']}")
-                        # create documents from the html with the necessary metadata
-                        soup = BeautifulSoup(html, 'html.parser')
-                        # extract title, meta description, meta keywords
-                        description = soup.find(
-                            'meta', attrs={'name': 'description'})
-                        keywords = soup.find(
-                            'meta', attrs={'name': 'keywords'})
-                        metadata = {
-                            'title': soup.title.string if soup.title else '',
-                            'description': description['content'] if description else '',
-                            'keywords': keywords['content'] if keywords else ''
-                        }
-
-                        # find page content in body (exclude img, script, style, svg, iframe, video, audio, object, embed, canvas)
-                        excluded_tags = ['img', 'script', 'style', 'svg',
-                                         'iframe', 'video', 'audio', 'object', 'embed', 'canvas']
-                        for tag in excluded_tags:
-                            for el in soup.find_all(tag):
-                                el.extract()
-
-                        main_content_containers = [
-                            'main', 'body'
-                        ]
-                        main = None
-                        for selector in main_content_containers:
-                            main = soup.select_one(selector)
-                            if main:
-                                break
-
-                        if main:
-                            content = main.get_text()
+                        batches, claimed = get_batches(
+                            cur, asset_data, asset_id, mime_type)
+                        if refresh:
+                            content_hash = refresh_chunks(
+                                cur, batches, asset_id, bot_id)
                         else:
-                            content = soup.get_text()
-
-                        content = re.sub(r'\n{2,}', '\n', content)
-                        content = re.sub(r'\t{2,}', ' ', content)
-                        content = re.sub(r' +', ' ', content)
-
-                        documents = [
-                            Document(page_content=content, metadata=metadata)]
-
-                    # use the documents to chunk the text
-                    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-                        model_name=OPENAI_MODEL,
-                        chunk_size=CHUNK_SIZE_TOKENS, chunk_overlap=CHUNK_OVERLAP_TOKENS)
-
-                    chunks = splitter.split_documents(documents)
-
-                    # create embeddings for the chunks and save them to the db
-                    openai_client = OpenAI(api_key=OPENAI_API_KEY)
-                    embeddings = openai_client.embeddings.create(input=[
-                        chunk.page_content.replace("\n", " ") for chunk in chunks
-                    ], model=OPENAI_EMBEDDING_MODEL, dimensions=OPENAI_EMBEDDINGS_DIMS).data
-
-                    for i, chunk in enumerate(chunks):
-                        page_content = chunk.page_content.replace("'", "''")
-                        # remove non-printable characters
-                        page_content = ''.join(
-                            filter(lambda x: x in string.printable, page_content))
-
-                        if chunk.metadata is not None:
-                            for k, v in chunk.metadata.items():
-                                if isinstance(k, str):
-                                    k = k.replace("'", "''")
-                                if isinstance(v, str):
-                                    v = v.replace("'", "''")
-                                chunk.metadata[k] = v
-
-                        query = f"""
-                        INSERT INTO public.embedding (embedding, chunk_text, chunk_metadata, asset_id)
-                        VALUES ('{embeddings[i].embedding}', '{page_content}', '{json.dumps(chunk.metadata) if chunk.metadata else {}}', {asset_id});
-                        """
-                        cur.execute(query)
+                            content_hash = insert_chunks(
+                                cur, batches, asset_id, bot_id)
+                        asset_metadata["content_hash"] = content_hash
+
+                    asset_metadata.pop("etag", None)
+                    asset_metadata.pop("last_modified", None)
+                    asset_metadata.update(validators)
+                    if lastmod is not None:
+                        asset_metadata["lastmod"] = lastmod
+                    asset_metadata["crawled_at"] = datetime.datetime.utcnow(
+                    ).isoformat()
 
                     logger.info(
                         f"Asset processed successfully. Marking the asset as SUCCESS")
-                    cur.execute(
-                        f"UPDATE public.asset SET status = 'SUCCESS' WHERE id = {asset_id};")
+                    cur.execute("""
+                        UPDATE public.asset SET status = 'SUCCESS', asset_metadata = %s
+                        WHERE id = %s;
+                    """, (json.dumps(asset_metadata), asset_id))
+
+                    if is_modified and (refresh or bot_data["status"] == "SUCCESS"):
+                        # the bot (and its live bot, the assets are shared) answers from
+                        # the changed asset, touching them invalidates their cached answers
+                        cur.execute("""
+                            UPDATE public.bot SET updated_at = now()
+                            WHERE id = %s OR id = (SELECT associated_bot_id FROM public.bot WHERE id = %s);
+                        """, (bot_id, bot_id))
 
         except Exception as e:
             capture_exception(
                 e, metadata={"asset_id": asset_id, "bot_id": bot_id})
             traceback.print_exc()
-            logger.error("Marking the asset as FAILED")
-            db.execute(
-                f"UPDATE public.asset SET status = 'FAILED' WHERE id = {asset_id};")
-
-        def isnumber(x):
-            try:
-                return math.isfinite(x)
-            except:
-                return False
+            if refresh:
+                # the chunks of the previous crawl are still there (the transaction rolled back)
+                logger.error("Failed to refresh the asset. Keeping its chunks")
+            else:
+                logger.error("Marking the asset as FAILED")
+                db.execute(
+                    f"UPDATE public.asset SET status = 'FAILED' WHERE id = {asset_id};")
+            if not refresh and isnumber(asset_data["parent_asset_id"]):
+                with db.transaction() as cur:
+                    release_blocks(
+                        cur, int(asset_data["parent_asset_id"]), [asset_id])
+            elif len(claimed) > 0:
+                # the kept chunks do not have the blocks this refresh claimed
+                with db.transaction() as cur:
+                    release_claims(
+                        cur, int(asset_data["parent_asset_id"]), asset_id, claimed)
 
         try:
             ########## Update the bot status ##########
@@ -349,12 +465,60 @@ def cleartemp():
         time.sleep(120)
 
 
+def cleanup_embedding_cache():
+    # delete embedding cache entries that have not been used for a while, once a day
+    while True:
+        try:
+            with db.transaction() as cur:
+                embedding_cache.delete_unused(
+                    cur, EMBEDDING_CACHE_RETENTION_DAYS)
+        except Exception as e:
+            capture_exception(e)
+            traceback.print_exc()
+
+        time.sleep(24 * 60 * 60)
+
+
+# assets are processed on a pool of MAX_IN_FLIGHT_ASSETS threads, the rabbitmq prefetch
+# count makes sure there are never more messages than threads. every message is acked by
+# the thread that processed it
+executor = ThreadPoolExecutor(
+    max_workers=MAX_IN_FLIGHT_ASSETS, thread_name_prefix="asset")
+is_shutting_down = threading.Event()
+
+
+def on_message(message):
+    if is_shutting_down.is_set():
+        # delivered before the consumer was cancelled, leave it for another worker
+        message.reject(requeue=True)
+        return
+
+    executor.submit(handle_message, message)
+
+
+def shutdown(signum, frame):
+    # stop taking new messages, the assets in flight are drained in main
+    logger.info(f"received signal {signum}, draining the assets in flight")
+    is_shutting_down.set()
+    channel.stop_consuming()
+
+
 def main():
+    global connection, channel
+    connection = amqpstorm.UriConnection(RABBITMQ_URL)
+    channel = connection.channel()
+
+    channel.queue.declare(queue=INPUT_QUEUE_NAME, durable=True)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
     try:
-        logger.info("Starting asset processor")
-        channel.basic.qos(prefetch_count=1)
+        logger.info(
+            f"Starting asset processor ({MAX_IN_FLIGHT_ASSETS} assets in flight)")
+        channel.basic.qos(prefetch_count=MAX_IN_FLIGHT_ASSETS)
         channel.basic.consume(
-            handle_message, queue=INPUT_QUEUE_NAME, no_ack=False)
+            on_message, queue=INPUT_QUEUE_NAME, no_ack=False)
 
         logger.info(f'waiting for messages on {INPUT_QUEUE_NAME}')
 
@@ -362,11 +526,15 @@ def main():
         # to prevent the connection from closing
         threading.Thread(target=heartbeat, daemon=True).start()
         threading.Thread(target=cleartemp, daemon=True).start()
+        threading.Thread(target=cleanup_embedding_cache, daemon=True).start()
 
         channel.start_consuming()
     except Exception as e:
         capture_exception(e)
         traceback.print_exc()
     finally:
+        # wait for the assets in flight, their messages are acked before the channel closes
+        executor.shutdown(wait=True)
+        logger.info("all assets in flight are done, closing the connection")
         channel.close()
         connection.close()
@@ -0,0 +1,92 @@
+"""Embedding insertion: one string formatted INSERT per chunk vs a single binary COPY.
+
+Inserts `--chunks` synthetic chunks (random 512 dim vectors, ~2 KB of text) for a
+throwaway asset with both writers, each inside a transaction that is rolled back, and
+reports the time taken. Run against a dev database.
+
+Usage (inside the asset processor container):
+
+    poetry run python -m benchmarks.copy_insert --chunks 2000 --iterations 3
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+import uuid
+
+import numpy as np
+
+from db import db
+from db.copy import copy_embeddings
+from envs import OPENAI_EMBEDDINGS_DIMS
+
+
+WORDS = ("appointment insurance provider hours clinic doctor office location parking "
+         "referral billing payment surgery consultation follow-up visit schedule").split()
+
+# rows of the default partition, no bot partition needed
+OWNER_BOT_ID = 0
+
+
+def synthetic_rows(asset_id: int, num_chunks: int):
+    rows = []
+    for i in range(num_chunks):
+        text = " ".join(random.choices(WORDS, k=300))
+        rows.append((
+            np.random.rand(int(OPENAI_EMBEDDINGS_DIMS)).astype(
+                np.float32).tolist(),
+            text,
+            json.dumps({"title": "benchmark", "page": i}),
+            asset_id,
+            OWNER_BOT_ID,
+            400,
+            uuid.uuid4().hex * 2,
+            i
+        ))
+
+    return rows
+
+
+def insert_rows(cur, rows: list):
+    # the old writer
+    for embedding, chunk_text, chunk_metadata, asset_id, owner_bot_id, num_tokens, \
+            content_hash, chunk_index in rows:
+        cur.execute(f"""
+        INSERT INTO public.embedding (embedding, chunk_text, chunk_metadata, asset_id, owner_bot_id, num_tokens, content_hash, chunk_index)
+        VALUES ('{embedding}', '{chunk_text.replace("'", "''")}', '{chunk_metadata.replace("'", "''")}', {asset_id}, {owner_bot_id}, {num_tokens}, '{content_hash}', {chunk_index});
+        """)
+
+
+def measure(writer, num_chunks: int):
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO public.asset (guid, type, value, status)
+                VALUES (%s, 'url', 'https://copy-insert-benchmark.example', 'PENDING')
+                RETURNING id;
+            """, (uuid.uuid4().hex,))
+            rows = synthetic_rows(cur.fetchone()[0], num_chunks)
+
+            t1 = time.perf_counter()
+            writer(cur, rows)
+            elapsed = time.perf_counter() - t1
+
+        conn.rollback()
+    return elapsed * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=3)
+    args = parser.parse_args()
+
+    for name, writer in [("insert per chunk", insert_rows), ("binary copy", copy_embeddings)]:
+        latencies = [measure(writer, args.chunks) for _ in range(args.iterations)]
+        print(f"{name:>16}: p50 {statistics.median(latencies):9.1f} ms "
+              f"({args.chunks} chunks, {args.iterations} iterations)")
+
+
+if __name__ == "__main__":
+    main()
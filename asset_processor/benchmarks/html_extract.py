@@ -0,0 +1,60 @@
+"""HTML to text throughput: the selectolax extractor vs the original BeautifulSoup one.
+
+Runs both extractors of helpers/extract.py over a saved corpus of pages (by default
+benchmarks/fixtures/html_pages.json, pages of a made up clinic site with the usual site
+chrome, scripts and styles) and reports pages/s, MB/s and how much of the text was split
+off as boilerplate. `--corpus` also takes a directory of saved .html files.
+
+Usage:
+
+    poetry run python -m benchmarks.html_extract --repeat 50
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+from helpers.extract import EXTRACTORS
+
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(
+    __file__), "fixtures", "html_pages.json")
+
+
+def load_corpus(path: str):
+    if os.path.isdir(path):
+        pages = []
+        for file_path in sorted(glob.glob(os.path.join(path, "*.html"))):
+            with open(file_path, encoding="utf-8", errors="ignore") as f:
+                pages.append(f.read())
+        return pages
+
+    with open(path) as f:
+        return [page["html"] for page in json.load(f)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    size_mb = sum(len(page.encode("utf-8")) for page in pages) / 1024 / 1024
+
+    for name, extract in EXTRACTORS.items():
+        t1 = time.perf_counter()
+        for _ in range(args.repeat):
+            results = [extract(page) for page in pages]
+        elapsed = time.perf_counter() - t1
+
+        content_chars = sum(len(content) for content, _, _ in results)
+        boilerplate_chars = sum(len(boilerplate) for _, boilerplate, _ in results)
+        print(f"{name:>10}: {len(pages) * args.repeat / elapsed:8.1f} pages/s "
+              f"{size_mb * args.repeat / elapsed:6.1f} MB/s, "
+              f"{content_chars} content + {boilerplate_chars} boilerplate chars per pass")
+
+
+if __name__ == "__main__":
+    main()
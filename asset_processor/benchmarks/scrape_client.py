@@ -0,0 +1,55 @@
+"""Scraping throughput: the pooled, rate limited client against the local stub.
+
+Starts the stub api (benchmarks/scrape_stub.py) in process and scrapes `--pages` urls from
+`--threads` threads with the scrape client, then reports the throughput, how many pages
+were scraped and the client's latency histogram.
+
+Usage:
+
+    poetry run python -m benchmarks.scrape_client --pages 200 --threads 8 --error-rate 0.1
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import logging
+import threading
+import time
+
+from benchmarks.scrape_stub import make_server
+from helpers.scrape import ScrapeClient
+from logger import logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--rate-per-second", type=float, default=20)
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.latency_ms, args.error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = ScrapeClient(url=f"http://localhost:{args.port}/v2/scrape", auth="stub",
+                          max_concurrency=args.max_concurrency,
+                          rate_per_second=args.rate_per_second)
+    logger.setLevel(logging.WARNING)
+
+    urls = [f"https://clinic.example/page-{i}" for i in range(args.pages)]
+    t1 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        pages = list(executor.map(lambda url: client.scrape(url, logger), urls))
+    elapsed = time.perf_counter() - t1
+    server.shutdown()
+
+    scraped = sum(1 for page in pages if page is not None)
+    print(f"{scraped}/{args.pages} pages in {elapsed:.1f}s "
+          f"({args.pages / elapsed:.1f} pages/s)")
+    print(client.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Local stand-in for the smartproxy scraper api, to work on scraping offline.
+
+Answers `POST /v2/scrape` like the real api (`{"results": [{"content": ..., "task_id": ...}]}`)
+with a small html page about the requested url. The latency and the share of 429s and 500s
+are configurable, so retries, timeouts and the rate limiter can be exercised.
+
+Usage:
+
+    poetry run python -m benchmarks.scrape_stub --port 8089 --latency-ms 300 --error-rate 0.1
+
+then set SMARTPROXY_URL=http://localhost:8089/v2/scrape
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import random
+import time
+import uuid
+
+
+PAGE = """<html><head><title>{url}</title>
+<meta name="description" content="stub page"></head>
+<body><nav>home | about | contact</nav><main><h1>{url}</h1>
+<p>Our clinic is open Monday to Friday, 8am to 6pm. Call us to book an appointment.</p>
+</main><footer>copyright</footer></body></html>"""
+
+
+def make_server(port: int, latency_ms: float = 300, error_rate: float = 0.0):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("content-length", 0)))
+            url = json.loads(body or b"{}").get("url", "")
+            # latency of a real page render varies a lot
+            time.sleep(random.expovariate(1000 / latency_ms) if latency_ms > 0 else 0)
+
+            if random.random() < error_rate:
+                status = random.choice([429, 500])
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("retry-after", "1")
+                self.end_headers()
+                return
+
+            data = json.dumps({"results": [{
+                "content": PAGE.format(url=url),
+                "status_code": 200,
+                "task_id": uuid.uuid4().hex
+            }]}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer(("0.0.0.0", port), Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.latency_ms, args.error_rate)
+    print(f"serving on :{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,65 @@
-import psycopg2
-from envs import DB_HOST, DATABASE_NAME, DB_PASSWORD, DB_PORT, DB_USERNAME
+from contextlib import contextmanager
+import threading
+
+from psycopg2.pool import ThreadedConnectionPool
+from envs import DB_HOST, DATABASE_NAME, DB_PASSWORD, DB_PORT, DB_USERNAME, DB_POOL_SIZE
 import pandas.io.sql as sqlio
 
 
 class DB:
-    def __init__(self) -> None:
-        self.connection = psycopg2.connect(
-            database=DATABASE_NAME, user=DB_USERNAME,
-            password=DB_PASSWORD, host=DB_HOST, port=DB_PORT
-        )
-        self.connection.autocommit = False
+    # connections are pooled, every query/transaction checks one out for its duration so
+    # that several assets can be processed concurrently
+    def __init__(self, pool_size: int = DB_POOL_SIZE) -> None:
+        self.pool_size = pool_size
+        # created on first use, processes that only import the module (e.g. the parse
+        # workers) never connect
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        # the pool raises instead of waiting when it is exhausted
+        self.available = threading.BoundedSemaphore(pool_size)
 
-    def query(self, query: str):
-        data = sqlio.read_sql_query(query, self.connection)
-        data = data.reset_index(drop=True)
-        return data
+    def get_pool(self):
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ThreadedConnectionPool(
+                    1, self.pool_size,
+                    database=DATABASE_NAME, user=DB_USERNAME,
+                    password=DB_PASSWORD, host=DB_HOST, port=DB_PORT
+                )
+            return self.pool
 
-    def execute(self, query: str):
-        cursor = self.connection.cursor()
+    @contextmanager
+    def connection(self):
+        # an uncommitted transaction is rolled back when the connection is returned
+        self.available.acquire()
         try:
-            cursor.execute(query)
-            self.connection.commit()
+            pool = self.get_pool()
+            conn = pool.getconn()
+            try:
+                conn.autocommit = False
+                yield conn
+            finally:
+                pool.putconn(conn, close=conn.closed != 0)
         finally:
-            cursor.close()
+            self.available.release()
+
+    @contextmanager
+    def transaction(self):
+        # yields a cursor, commits when the block succeeds and rolls back otherwise
+        with self.connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    yield cur
+
+    def query(self, query: str):
+        with self.connection() as conn:
+            data = sqlio.read_sql_query(query, conn)
+            data = data.reset_index(drop=True)
+            return data
+
+    def execute(self, query: str):
+        with self.transaction() as cur:
+            cur.execute(query)
 
 
 db = DB()
@@ -0,0 +1,68 @@
+import io
+import struct
+
+import numpy as np
+
+
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+
+EMBEDDING_COLUMNS = ("embedding", "chunk_text", "chunk_metadata", "asset_id",
+                     "owner_bot_id", "num_tokens", "content_hash", "chunk_index")
+
+
+def encode_vector(embedding):
+    # pgvector's binary format: int16 dimensions, int16 unused, big-endian float4 values
+    values = np.asarray(embedding, dtype=">f4")
+    return struct.pack(">hh", len(values), 0) + values.tobytes()
+
+
+def decode_vector(value: bytes):
+    # the same binary format, as returned by `vector_send(embedding)`
+    dims, _ = struct.unpack_from(">hh", value)
+    return np.frombuffer(value, dtype=">f4", offset=4, count=dims).astype(np.float32)
+
+
+def encode_text(value: str):
+    # text, varchar and json are sent as their utf-8 text in the binary format too
+    return value.encode("utf-8")
+
+
+def encode_int(value: int):
+    return struct.pack(">i", int(value))
+
+
+def write_field(buffer: io.BytesIO, value: bytes):
+    if value is None:
+        buffer.write(struct.pack(">i", -1))
+    else:
+        buffer.write(struct.pack(">i", len(value)))
+        buffer.write(value)
+
+
+def copy_rows(cur, table: str, columns: tuple, encoders: tuple, rows: list):
+    # streams all the rows through a single binary COPY on the cursor's connection (and
+    # transaction). every row is a tuple in the order of columns, encoded by the encoder of
+    # its column, None for a null
+    buffer = io.BytesIO()
+    buffer.write(PGCOPY_HEADER)
+    field_count = struct.pack(">h", len(columns))
+    for row in rows:
+        buffer.write(field_count)
+        for encode, value in zip(encoders, row):
+            write_field(buffer, encode(value) if value is not None else None)
+
+    buffer.write(PGCOPY_TRAILER)
+    buffer.seek(0)
+
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary);", buffer)
+
+
+def copy_embeddings(cur, rows: list):
+    # every row is a tuple in the order of EMBEDDING_COLUMNS:
+    # (embedding, chunk_text, chunk_metadata (json text), asset_id, owner_bot_id,
+    #  num_tokens, content_hash, chunk_index)
+    copy_rows(cur, "public.embedding", EMBEDDING_COLUMNS,
+              (encode_vector, encode_text, encode_text, encode_int,
+               encode_int, encode_int, encode_text, encode_int), rows)
@@ -1,3 +1,4 @@
+import math
 import os
 import sys
 
@@ -18,6 +19,56 @@ DB_HOST = os.environ.get('DB_HOST')
 DB_PORT = os.environ.get('DB_PORT')
 DATABASE_NAME = os.environ.get('DATABASE_NAME')
 
+# how many assets a worker processes at the same time (also the rabbitmq prefetch count)
+MAX_IN_FLIGHT_ASSETS = int(os.environ.get('MAX_IN_FLIGHT_ASSETS', 4))
+# one connection per asset in flight (its transaction) plus the short transactions of the
+# embedding cache and the background jobs
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', MAX_IN_FLIGHT_ASSETS + 2))
+
+def get_cpu_count():
+    # the cpus this process may run on, capped by the cpu quota of the container (cgroup v2
+    # or v1). os.cpu_count() is the cpus of the host
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+
+    quota_files = [("/sys/fs/cgroup/cpu.max", None),
+                   ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us")]
+    for quota_file, period_file in quota_files:
+        try:
+            with open(quota_file) as f:
+                values = f.read().split()
+            if period_file is not None:
+                with open(period_file) as f:
+                    values.append(f.read().strip())
+            quota, period = values[0], values[1]
+            if quota not in ("max", "-1"):
+                count = min(count, max(1, math.ceil(int(quota) / int(period))))
+            break
+        except (OSError, ValueError, IndexError):
+            continue
+
+    return count
+
+
+# documents are parsed and split in worker processes, at most PARSE_MAX_PROCESSES of them parsing
+# at a time. a task is killed after PARSE_TIMEOUT_SECONDS, or when it uses more than
+# PARSE_MAX_MEMORY_MB of address space (0 disables the cap)
+PARSE_MAX_PROCESSES = int(os.environ.get('PARSE_MAX_PROCESSES', get_cpu_count()))
+PARSE_TIMEOUT_SECONDS = int(os.environ.get('PARSE_TIMEOUT_SECONDS', 300))
+PARSE_MAX_MEMORY_MB = int(os.environ.get('PARSE_MAX_MEMORY_MB', 2048))
+# chunks of a document are parsed, embedded and inserted in batches of this many, so that
+# memory stays flat however large the document is
+CHUNK_BATCH_SIZE = int(os.environ.get('CHUNK_BATCH_SIZE', 256))
+
+# html to text extractor of scraped pages, `selectolax` or `bs4` (see helpers/extract.py)
+HTML_EXTRACTOR = os.environ.get('HTML_EXTRACTOR', 'selectolax')
+
+# a text block of a sitemap page that was stored for a sibling page already is dropped
+# once it was seen on this many pages (site chrome is dropped from the second page on)
+BOILERPLATE_MIN_PAGES = int(os.environ.get('BOILERPLATE_MIN_PAGES', 3))
+
 # config
 TMP_FOLDER_PATH = os.environ.get('TMP_FOLDER_PATH', './tmp')
 ENV = os.environ.get('ENV', 'development')
@@ -34,11 +85,42 @@ OPENAI_EMBEDDING_MODEL = os.environ.get(
     'OPENAI_EMBEDDING_MODEL', 'text-embedding-3-large')
 OPENAI_EMBEDDINGS_DIMS = os.environ.get('OPENAI_EMBEDDINGS_DIMS', 512)
 
+# embedding requests: chunks (of all the assets in flight) are sent in batches of at most
+# this many inputs / tokens, with up to EMBEDDING_MAX_PARALLEL_REQUESTS batches in flight
+EMBEDDING_BATCH_MAX_ITEMS = int(os.environ.get('EMBEDDING_BATCH_MAX_ITEMS', 512))
+EMBEDDING_BATCH_MAX_TOKENS = int(
+    os.environ.get('EMBEDDING_BATCH_MAX_TOKENS', 100000))
+EMBEDDING_MAX_PARALLEL_REQUESTS = int(
+    os.environ.get('EMBEDDING_MAX_PARALLEL_REQUESTS', 4))
+EMBEDDING_MAX_RETRIES = int(os.environ.get('EMBEDDING_MAX_RETRIES', 5))
+# how long the batcher waits for chunks of other assets before sending a batch
+EMBEDDING_BATCH_WAIT_MS = int(os.environ.get('EMBEDDING_BATCH_WAIT_MS', 50))
+# chunk embeddings not used for this many days are deleted from the embedding cache
+EMBEDDING_CACHE_RETENTION_DAYS = int(
+    os.environ.get('EMBEDDING_CACHE_RETENTION_DAYS', 90))
+
 # smartproxy
 SMARTPROXY_AUTH = os.environ.get('SMARTPROXY_AUTH')
+# point it at the stub (benchmarks/scrape_stub.py) to work offline
+SMARTPROXY_URL = os.environ.get(
+    'SMARTPROXY_URL', 'https://scraper-api.smartproxy.com/v2/scrape')
+# at most this many scrape calls in flight and started per second (0 = no rate limit)
+SCRAPE_MAX_CONCURRENCY = int(os.environ.get('SCRAPE_MAX_CONCURRENCY', 8))
+SCRAPE_RATE_LIMIT_PER_SECOND = float(
+    os.environ.get('SCRAPE_RATE_LIMIT_PER_SECOND', 10))
+# headless rendering is slow, the read timeout has to cover it
+SCRAPE_CONNECT_TIMEOUT_SECONDS = float(
+    os.environ.get('SCRAPE_CONNECT_TIMEOUT_SECONDS', 5))
+SCRAPE_READ_TIMEOUT_SECONDS = float(
+    os.environ.get('SCRAPE_READ_TIMEOUT_SECONDS', 90))
+SCRAPE_MAX_RETRIES = int(os.environ.get('SCRAPE_MAX_RETRIES', 3))
 
 SENTRY_DSN = os.environ.get('SENTRY_DSN', '')
 
+if DB_POOL_SIZE <= MAX_IN_FLIGHT_ASSETS:
+    logger.error('DB_POOL_SIZE must be greater than MAX_IN_FLIGHT_ASSETS')
+    sys.exit(1)
+
 if TMP_FOLDER_PATH is None:
     logger.error('missing env var TMP_FOLDER_PATH')
     sys.exit(1)
@@ -95,11 +177,16 @@ if PRACTICE_URL_SUCCESS_RATE > 1 or PRACTICE_URL_SUCCESS_RATE < 0:
     logger.error('PRACTICE_URL_SUCCESS_RATE should be between 0 and 1')
     sys.exit(1)
 
+if HTML_EXTRACTOR not in ['selectolax', 'bs4']:
+    logger.error('HTML_EXTRACTOR should be selectolax or bs4')
+    sys.exit(1)
+
 if CHUNK_OVERLAP_TOKENS >= CHUNK_SIZE_TOKENS:
     logger.error('CHUNK_OVERLAP_TOKENS should be less than CHUNK_SIZE_TOKENS')
     sys.exit(1)
 
 SMARTPROXY_AUTH = SMARTPROXY_AUTH.strip()
+SMARTPROXY_URL = SMARTPROXY_URL.strip()
 OPENAI_API_KEY = OPENAI_API_KEY.strip()
 DB_USERNAME = DB_USERNAME.strip()
 DB_PASSWORD = DB_PASSWORD.strip()
@@ -0,0 +1,202 @@
+import hashlib
+from typing import NamedTuple
+
+import numpy as np
+from langchain_core.documents import Document
+from psycopg2.extras import execute_values
+
+from envs import BOILERPLATE_MIN_PAGES
+
+
+# a block is a line of the page text, short lines (menu items, opening hours) are grouped
+# until the block has at least BLOCK_MIN_WORDS words
+BLOCK_MIN_WORDS = 8
+SHINGLE_SIZE = 3
+# minhash signatures of 64 permutations in 8 bands of 8 rows: blocks with a jaccard
+# similarity of ~0.8 and more share a band, unrelated ones almost never do
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 8
+# universal hashing of the 32 bit shingle hashes, modulo a prime above 2^32. the seed is
+# fixed, the fingerprints of pages processed by different workers (and deploys) must match
+PRIME = np.uint64(4294967311)
+_random = np.random.RandomState(20240601)
+PERMUTATION_A = _random.randint(1, 1 << 31, size=NUM_PERMUTATIONS).astype(np.uint64)
+PERMUTATION_B = _random.randint(0, 1 << 31, size=NUM_PERMUTATIONS).astype(np.uint64)
+
+
+class Block(NamedTuple):
+    text: str
+    # ((band, band_hash), ...)
+    band_hashes: tuple
+
+
+def split_blocks(text: str):
+    blocks = []
+    lines = []
+    num_words = 0
+    for line in text.split("\n"):
+        line = line.strip()
+        if line == "":
+            continue
+        lines.append(line)
+        num_words += len(line.split())
+        if num_words >= BLOCK_MIN_WORDS:
+            blocks.append("\n".join(lines))
+            lines = []
+            num_words = 0
+
+    if len(lines) > 0:
+        blocks.append("\n".join(lines))
+
+    return blocks
+
+
+def get_band_hashes(text: str):
+    words = text.lower().split()
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE])
+                for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = np.array([
+        int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+        for shingle in shingles
+    ], dtype=np.uint64)
+    signature = ((np.outer(hashes, PERMUTATION_A) + PERMUTATION_B) % PRIME).min(axis=0)
+
+    rows = NUM_PERMUTATIONS // NUM_BANDS
+    return tuple(
+        (band, int.from_bytes(hashlib.blake2b(
+            signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest(), "little", signed=True))
+        for band in range(NUM_BANDS)
+    )
+
+
+def fingerprint_documents(documents):
+    # [(metadata, [Block])], one per document of the page
+    return [
+        (document.metadata, [Block(text, get_band_hashes(text))
+                             for text in split_blocks(document.page_content)])
+        for document in documents
+    ]
+
+
+def drop_seen_blocks(cur, pages: list, parent_asset_id: int, asset_id: int,
+                     min_pages: int = BOILERPLATE_MIN_PAGES):
+    # records the blocks of a sitemap page in `public.sitemap_block` and returns the page's
+    # documents without the blocks already stored for a sibling page: site chrome as soon
+    # as one sibling has it, other blocks once they were seen on `min_pages` pages. also
+    # returns the blocks this call claimed for the page (see release_claims)
+    band_hashes = sorted({band_hash for _, blocks in pages
+                          for block in blocks for band_hash in block.band_hashes})
+    if len(band_hashes) == 0:
+        return [], []
+
+    # the page's first visit of a block counts it, a retry or refresh of the page does not.
+    # rows are locked in (band, band_hash) order, sibling pages processed concurrently
+    # would deadlock otherwise. claimed_before is read from the statement's snapshot, the
+    # claims the page had before this call
+    rows = execute_values(cur, f"""
+        WITH blocks (band, band_hash) AS (VALUES %s),
+        claimed_before AS (
+            SELECT band, band_hash
+            FROM public.sitemap_block
+            WHERE parent_asset_id = {int(parent_asset_id)} AND first_asset_id = {int(asset_id)}
+        ),
+        visits AS (
+            INSERT INTO public.sitemap_block_asset (parent_asset_id, band, band_hash, asset_id)
+            SELECT {int(parent_asset_id)}, band, band_hash, {int(asset_id)}
+            FROM blocks
+            ORDER BY band, band_hash
+            ON CONFLICT DO NOTHING
+            RETURNING band, band_hash
+        )
+        upserted AS (
+            INSERT INTO public.sitemap_block (parent_asset_id, band, band_hash, first_asset_id, asset_count)
+            SELECT {int(parent_asset_id)}, b.band, b.band_hash, {int(asset_id)},
+                CASE WHEN v.band IS NULL THEN 0 ELSE 1 END
+            FROM blocks b
+            LEFT JOIN visits v ON v.band = b.band AND v.band_hash = b.band_hash
+            ORDER BY b.band, b.band_hash
+            ON CONFLICT (parent_asset_id, band, band_hash) DO UPDATE
+            SET asset_count = sitemap_block.asset_count + EXCLUDED.asset_count,
+                first_asset_id = COALESCE(sitemap_block.first_asset_id, EXCLUDED.first_asset_id)
+            RETURNING band, band_hash, first_asset_id, asset_count
+        )
+        SELECT u.band, u.band_hash, u.first_asset_id, u.asset_count,
+            u.first_asset_id = {int(asset_id)} AND c.band IS NULL
+        FROM upserted u
+        LEFT JOIN claimed_before c ON c.band = u.band AND c.band_hash = u.band_hash;
+    """, band_hashes, template="(%s::smallint, %s::bigint)", page_size=len(band_hashes), fetch=True)
+    # nothing else has been written in the asset's transaction yet. committed right away so
+    # that sibling pages processed concurrently see the blocks and do not wait on the rows
+    cur.connection.commit()
+    claims = {(row[0], row[1]): (row[2], row[3]) for row in rows}
+    claimed = sorted((row[0], row[1]) for row in rows if row[4])
+
+    def is_seen(block: Block, is_boilerplate: bool):
+        for band_hash in block.band_hashes:
+            first_asset_id, asset_count = claims[band_hash]
+            if first_asset_id is not None and first_asset_id != asset_id and \
+                    (is_boilerplate or asset_count >= min_pages):
+                return True
+        return False
+
+    documents = []
+    for metadata, blocks in pages:
+        kept = [block.text for block in blocks
+                if not is_seen(block, metadata.get('boilerplate', False))]
+        if len(kept) > 0:
+            documents.append(Document(page_content="\n".join(kept), metadata=metadata))
+
+    return documents, claimed
+
+
+def release_blocks(cur, parent_asset_id: int, asset_ids: list):
+    # for pages whose chunks are not stored (failed) or not part of the bot anymore: they do
+    # not count for their blocks anymore, and the blocks they were the first to have are
+    # stored by the next sibling page instead. rows are locked in the same order as above
+    cur.execute("""
+        WITH visits AS (
+            DELETE FROM public.sitemap_block_asset
+            WHERE parent_asset_id = %(parent_asset_id)s AND asset_id = ANY(%(asset_ids)s)
+            RETURNING band, band_hash
+        ),
+        released AS (
+            SELECT band, band_hash, count(*) AS num_assets
+            FROM visits
+            GROUP BY band, band_hash
+        ),
+        locked AS (
+            SELECT b.band, b.band_hash, r.num_assets
+            FROM public.sitemap_block b
+            JOIN released r ON r.band = b.band AND r.band_hash = b.band_hash
+            WHERE b.parent_asset_id = %(parent_asset_id)s
+            ORDER BY b.band, b.band_hash
+            FOR UPDATE OF b
+        )
+        UPDATE public.sitemap_block b
+        SET asset_count = GREATEST(b.asset_count - l.num_assets, 0),
+            first_asset_id = CASE WHEN b.first_asset_id = ANY(%(asset_ids)s)
+                THEN NULL ELSE b.first_asset_id END
+        FROM locked l
+        WHERE b.parent_asset_id = %(parent_asset_id)s AND b.band = l.band AND b.band_hash = l.band_hash;
+    """, {"parent_asset_id": parent_asset_id, "asset_ids": list(asset_ids)})
+
+
+def release_claims(cur, parent_asset_id: int, asset_id: int, blocks: list):
+    # for a page whose new chunks were not stored (a failed refresh, its previous chunks are
+    # kept): the blocks it claimed in that visit are stored by the next sibling page instead.
+    # its visits stay, the page still has the blocks. rows are locked in the same order as above
+    if len(blocks) == 0:
+        return
+
+    execute_values(cur, f"""
+        UPDATE public.sitemap_block b SET first_asset_id = NULL
+        FROM (
+            SELECT s.band, s.band_hash
+            FROM public.sitemap_block s
+            JOIN (VALUES %s) AS v (band, band_hash) ON s.band = v.band AND s.band_hash = v.band_hash
+            WHERE s.parent_asset_id = {int(parent_asset_id)} AND s.first_asset_id = {int(asset_id)}
+            ORDER BY s.band, s.band_hash
+            FOR UPDATE OF s
+        ) l
+        WHERE b.parent_asset_id = {int(parent_asset_id)} AND b.band = l.band AND b.band_hash = l.band_hash;
+    """, sorted(blocks), template="(%s::smallint, %s::bigint)", page_size=len(blocks))
@@ -0,0 +1,182 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import queue
+import random
+import threading
+import time
+
+import openai
+from openai import OpenAI
+
+from envs import (
+    OPENAI_API_KEY,
+    OPENAI_EMBEDDING_MODEL,
+    OPENAI_EMBEDDINGS_DIMS,
+    EMBEDDING_BATCH_MAX_ITEMS,
+    EMBEDDING_BATCH_MAX_TOKENS,
+    EMBEDDING_BATCH_WAIT_MS,
+    EMBEDDING_MAX_PARALLEL_REQUESTS,
+    EMBEDDING_MAX_RETRIES
+)
+from helpers.capture_exception import capture_exception
+from logger import logger
+
+
+# errors worth retrying, anything else (e.g. a bad request) fails the batch right away
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError
+)
+
+
+class EmbeddingRequest:
+    def __init__(self, texts: list):
+        self.future = Future()
+        self.embeddings = [None] * len(texts)
+        self.remaining = len(texts)
+        self.lock = threading.Lock()
+
+    def set_embedding(self, index: int, embedding):
+        with self.lock:
+            self.embeddings[index] = embedding
+            self.remaining -= 1
+            is_done = self.remaining == 0
+
+        if is_done and not self.future.done():
+            self.future.set_result(self.embeddings)
+
+    def set_exception(self, e: Exception):
+        with self.lock:
+            if not self.future.done():
+                self.future.set_exception(e)
+
+
+class EmbeddingBatcher:
+    # every `embed` call queues its texts, a dispatcher thread groups the queued texts (of
+    # all the assets being processed at the time) into batches bounded by item count and
+    # tokens, and sends them concurrently. a batch that fails is retried on its own with
+    # exponential backoff, and only fails the requests that have texts in it. a batch
+    # rejected by the api (4xx) is split and every request's texts are sent on their own,
+    # so that one asset's bad text does not fail the assets it shared the batch with
+    def __init__(self, max_items: int = EMBEDDING_BATCH_MAX_ITEMS,
+                 max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+                 max_parallel_requests: int = EMBEDDING_MAX_PARALLEL_REQUESTS,
+                 max_retries: int = EMBEDDING_MAX_RETRIES,
+                 wait_ms: int = EMBEDDING_BATCH_WAIT_MS):
+        self.max_items = max_items
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.wait_seconds = wait_ms / 1000
+        # the batches are retried here, not by the client
+        self.client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_parallel_requests, thread_name_prefix="embedding-batch")
+        # (request, index, text, num_tokens)
+        self.items = queue.Queue()
+        self.dispatcher = None
+        self.dispatcher_lock = threading.Lock()
+
+    def embed(self, texts: list, token_counts: list):
+        # blocks until all the texts are embedded, returns the embeddings in order
+        if len(texts) == 0:
+            return []
+        # rejected by the api, and would fail the whole batch it is sent in
+        if any(text.strip() == "" for text in texts):
+            raise Exception("Cannot embed an empty text")
+
+        self.start()
+        request = EmbeddingRequest(texts)
+        for i, (text, num_tokens) in enumerate(zip(texts, token_counts)):
+            self.items.put((request, i, text, num_tokens))
+
+        return request.future.result()
+
+    def start(self):
+        with self.dispatcher_lock:
+            if self.dispatcher is None:
+                self.dispatcher = threading.Thread(
+                    target=self.dispatch, daemon=True, name="embedding-dispatcher")
+                self.dispatcher.start()
+
+    def dispatch(self):
+        while True:
+            items = [self.items.get()]
+            # give the other in-flight assets a moment to queue their chunks too
+            deadline = time.monotonic() + self.wait_seconds
+            while True:
+                timeout = deadline - time.monotonic()
+                try:
+                    items.append(self.items.get(
+                        timeout=timeout) if timeout > 0 else self.items.get_nowait())
+                except queue.Empty:
+                    break
+
+            for batch in self.split(items):
+                self.executor.submit(self.send, batch)
+
+    def split(self, items: list):
+        batch = []
+        batch_tokens = 0
+        for item in items:
+            num_tokens = item[3]
+            if len(batch) > 0 and (len(batch) >= self.max_items or
+                                   batch_tokens + num_tokens > self.max_tokens):
+                yield batch
+                batch = []
+                batch_tokens = 0
+
+            batch.append(item)
+            batch_tokens += num_tokens
+
+        if len(batch) > 0:
+            yield batch
+
+    def send(self, batch: list):
+        attempt = 0
+        while True:
+            try:
+                data = self.client.embeddings.create(
+                    input=[item[2] for item in batch],
+                    model=OPENAI_EMBEDDING_MODEL,
+                    dimensions=OPENAI_EMBEDDINGS_DIMS
+                ).data
+                break
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.fail(batch, e)
+                    return
+
+                # exponential backoff with full jitter
+                delay = random.uniform(0, min(30, 2 ** attempt))
+                logger.warning(
+                    f"embedding batch of {len(batch)} failed ({e}), retry {attempt} in {delay:.1f}s")
+                time.sleep(delay)
+            except openai.APIStatusError as e:
+                requests = {item[0] for item in batch}
+                if 400 <= e.status_code < 500 and len(requests) > 1:
+                    logger.warning(
+                        f"embedding batch of {len(batch)} rejected ({e}), sending its "
+                        f"{len(requests)} requests on their own")
+                    for request in requests:
+                        self.executor.submit(
+                            self.send, [item for item in batch if item[0] is request])
+                    return
+
+                self.fail(batch, e)
+                return
+            except Exception as e:
+                self.fail(batch, e)
+                return
+
+        for item, embedding in zip(batch, data):
+            item[0].set_embedding(item[1], embedding.embedding)
+
+    def fail(self, batch: list, e: Exception):
+        capture_exception(e, metadata={"batch_size": len(batch)})
+        for request in {item[0] for item in batch}:
+            request.set_exception(e)
+
+
+embedding_batcher = EmbeddingBatcher()
@@ -0,0 +1,119 @@
+import threading
+
+from db import db
+from db.copy import copy_rows, decode_vector, encode_text, encode_vector
+from envs import OPENAI_EMBEDDING_MODEL, OPENAI_EMBEDDINGS_DIMS
+from logger import logger
+
+
+class EmbeddingCache:
+    # persistent cache of chunk embeddings (`public.embedding_cache`), keyed by the embedding
+    # model, the dimensions and the content hash of the chunk text. the same page or pdf is
+    # attached to many bots (staging and live, several bots per client, re-added urls), its
+    # chunks only have to be embedded once.
+    # the cache is written in short transactions of its own (in content hash order), not in
+    # the transaction of the asset: assets sharing chunks would lock each other's rows until
+    # they commit, and deadlock when they touch them in a different order
+    def __init__(self, model: str = OPENAI_EMBEDDING_MODEL, dims: int = OPENAI_EMBEDDINGS_DIMS):
+        self.model = model
+        self.dims = int(dims)
+        self.counters = {"hits": 0, "misses": 0}
+        self.lock = threading.Lock()
+
+    def get_many(self, content_hashes: list):
+        # returns {content_hash: embedding (float32 array)} of the cached chunks. the vectors
+        # are read in pgvector's binary format (see db/copy.py), not parsed from their text
+        if len(content_hashes) == 0:
+            return {}
+
+        with db.transaction() as cur:
+            cur.execute("""
+                SELECT content_hash, vector_send(embedding), last_used_at < now() - interval '1 day'
+                FROM public.embedding_cache
+                WHERE model = %s AND dims = %s AND content_hash = ANY(%s);
+            """, (self.model, self.dims, list(set(content_hashes))))
+            rows = cur.fetchall()
+
+        embeddings = {row[0]: decode_vector(row[1]) for row in rows}
+
+        # last_used_at drives the retention, it is refreshed at most once a day to avoid
+        # rewriting hot rows on every hit
+        stale = sorted(row[0] for row in rows if row[2])
+        if len(stale) > 0:
+            with db.transaction() as cur:
+                cur.execute("""
+                    UPDATE public.embedding_cache c SET last_used_at = now()
+                    FROM (
+                        SELECT content_hash FROM public.embedding_cache
+                        WHERE model = %s AND dims = %s AND content_hash = ANY(%s)
+                        ORDER BY content_hash
+                        FOR UPDATE SKIP LOCKED
+                    ) s
+                    WHERE c.model = %s AND c.dims = %s AND c.content_hash = s.content_hash;
+                """, (self.model, self.dims, stale, self.model, self.dims))
+
+        hits = sum(1 for content_hash in content_hashes if content_hash in embeddings)
+        with self.lock:
+            self.counters["hits"] += hits
+            self.counters["misses"] += len(content_hashes) - hits
+
+        return embeddings
+
+    def put_many(self, embeddings: dict):
+        # {content_hash: embedding}, chunks cached concurrently by another worker are kept
+        if len(embeddings) == 0:
+            return
+
+        # the vectors are staged with a binary COPY (a temp table of the pooled connection,
+        # emptied on commit) and inserted from there, COPY cannot skip the conflicts itself
+        with db.transaction() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS embedding_cache_staging (
+                    content_hash VARCHAR(64) NOT NULL,
+                    embedding vector NOT NULL
+                ) ON COMMIT DELETE ROWS;
+            """)
+            copy_rows(cur, "embedding_cache_staging", ("content_hash", "embedding"),
+                      (encode_text, encode_vector),
+                      [(content_hash, embeddings[content_hash])
+                       for content_hash in sorted(embeddings)])
+            cur.execute("""
+                INSERT INTO public.embedding_cache (model, dims, content_hash, embedding)
+                SELECT %s, %s, content_hash, embedding
+                FROM embedding_cache_staging
+                ORDER BY content_hash
+                ON CONFLICT (model, dims, content_hash) DO NOTHING;
+            """, (self.model, self.dims))
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "lookups": lookups,
+                "hit_rate": self.counters["hits"] / lookups if lookups > 0 else 0.0
+            }
+
+    def delete_unused(self, cur, retention_days: int, batch_size: int = 1000):
+        # deletes in batches so that the cleanup never holds many row locks for long
+        total = 0
+        while True:
+            cur.execute("""
+                DELETE FROM public.embedding_cache
+                WHERE ctid IN (
+                    SELECT ctid FROM public.embedding_cache
+                    WHERE last_used_at < now() - make_interval(days => %s)
+                    LIMIT %s
+                );
+            """, (int(retention_days), batch_size))
+            cur.connection.commit()
+            total += cur.rowcount
+            if cur.rowcount < batch_size:
+                break
+
+        logger.info(
+            f"deleted {total} embedding cache entries unused for {retention_days} days")
+        return total
+
+
+embedding_cache = EmbeddingCache()
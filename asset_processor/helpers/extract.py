@@ -0,0 +1,118 @@
+import re
+
+from bs4 import BeautifulSoup
+from selectolax.parser import HTMLParser
+
+from envs import HTML_EXTRACTOR
+
+
+# page content in the body excludes these tags
+EXCLUDED_TAGS = ['img', 'script', 'style', 'svg',
+                 'iframe', 'video', 'audio', 'object', 'embed', 'canvas']
+# site chrome, repeated on every page of a site. kept apart from the page content so that
+# it can be chunked on its own (and skipped when a sibling page already stored it). headers
+# and footers of an article or of the main element belong to the content
+BOILERPLATE_SELECTOR = ('nav, header, footer, aside, [role="navigation"], '
+                        '[role="banner"], [role="contentinfo"]')
+CONTENT_TAGS = {'main', 'article'}
+
+# a single pass for the whitespace clean up: runs of newlines become one newline, runs of
+# spaces and tab pairs become one space
+WHITESPACE_PATTERN = re.compile(r'\n{2,}|(?:\t{2,}| )+')
+
+
+def clean_whitespace(text: str):
+    return WHITESPACE_PATTERN.sub(lambda m: '\n' if m.group()[0] == '\n' else ' ', text)
+
+
+def extract_html_selectolax(html: str):
+    # returns (content, boilerplate, metadata) of the page
+    tree = HTMLParser(html)
+
+    title = tree.css_first('title')
+    description = tree.css_first('meta[name="description"]')
+    keywords = tree.css_first('meta[name="keywords"]')
+    metadata = {
+        'title': title.text() if title else '',
+        'description': (description.attributes.get('content') or '') if description else '',
+        'keywords': (keywords.attributes.get('content') or '') if keywords else ''
+    }
+
+    # one traversal for all the excluded tags. nodes come in document order, removing them
+    # in reverse removes nested ones before their ancestors
+    for node in reversed(tree.css(', '.join(EXCLUDED_TAGS))):
+        node.decompose()
+
+    main = tree.css_first('main') or tree.body
+    if main is None:
+        return clean_whitespace(tree.root.text() if tree.root else ''), '', metadata
+
+    # site chrome outside of the content, the ones nested in another are skipped for the text
+    nodes = [node for node in main.css(BOILERPLATE_SELECTOR)
+             if node.mem_id != main.mem_id and
+             not has_ancestor(node, main, lambda parent: parent.tag in CONTENT_TAGS)]
+    matched = {node.mem_id for node in nodes}
+    boilerplate = [node.text() for node in nodes
+                   if not has_ancestor(node, main, lambda parent: parent.mem_id in matched)]
+    for node in reversed(nodes):
+        node.decompose()
+
+    return clean_whitespace(main.text()), clean_whitespace('\n'.join(boilerplate)), metadata
+
+
+def has_ancestor(node, container, predicate):
+    # whether an ancestor of the node below the container matches
+    parent = node.parent
+    while parent is not None and parent.mem_id != container.mem_id:
+        if predicate(parent):
+            return True
+        parent = parent.parent
+
+    return False
+
+
+def extract_html_bs4(html: str):
+    # the original extractor, kept to compare against. same output shape as the one above
+    soup = BeautifulSoup(html, 'html.parser')
+    # extract title, meta description, meta keywords
+    description = soup.find('meta', attrs={'name': 'description'})
+    keywords = soup.find('meta', attrs={'name': 'keywords'})
+    metadata = {
+        'title': soup.title.string if soup.title else '',
+        'description': description['content'] if description else '',
+        'keywords': keywords['content'] if keywords else ''
+    }
+
+    for el in soup.find_all(EXCLUDED_TAGS):
+        el.extract()
+
+    main = soup.select_one('main') or soup.select_one('body')
+    if main is None:
+        return clean_whitespace(soup.get_text()), '', metadata
+
+    boilerplate = []
+    for el in main.select(BOILERPLATE_SELECTOR):
+        # already removed with an enclosing one
+        if el.decomposed:
+            continue
+        parents = []
+        for parent in el.parents:
+            if parent is main:
+                break
+            parents.append(parent.name)
+        if CONTENT_TAGS.intersection(parents):
+            continue
+        boilerplate.append(el.get_text())
+        el.decompose()
+
+    return clean_whitespace(main.get_text()), clean_whitespace('\n'.join(boilerplate)), metadata
+
+
+EXTRACTORS = {
+    'selectolax': extract_html_selectolax,
+    'bs4': extract_html_bs4
+}
+
+
+def extract_html(html: str):
+    return EXTRACTORS[HTML_EXTRACTOR](html)
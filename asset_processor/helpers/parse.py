@@ -0,0 +1,220 @@
+import multiprocessing
+import resource
+import string
+import threading
+import time
+import traceback
+from typing import NamedTuple
+
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import Docx2txtLoader
+import pdfplumber
+import tiktoken
+
+from envs import (
+    OPENAI_MODEL,
+    CHUNK_OVERLAP_TOKENS,
+    CHUNK_SIZE_TOKENS,
+    CHUNK_BATCH_SIZE,
+    PARSE_MAX_PROCESSES,
+    PARSE_TIMEOUT_SECONDS,
+    PARSE_MAX_MEMORY_MB
+)
+from helpers.boilerplate import fingerprint_documents
+from helpers.extract import extract_html
+from helpers.utils import get_content_hash
+
+
+DOC_MIME_TYPES = ["application/msword",
+                  "application/vnd.openxmlformats-officedocument.wordprocessingml.document"]
+
+encoder = tiktoken.encoding_for_model(OPENAI_MODEL)
+
+
+class Chunk(NamedTuple):
+    text: str
+    metadata: dict
+    num_tokens: int
+    content_hash: str
+
+
+def parse_file(file_path: str, mime_type: str):
+    # if file is pdf, use the pdf text extractor
+    # if file is doc/docx, use the doc text extractor
+    # raise exception for other file types
+    if mime_type == "application/pdf":
+        return parse_pdf(file_path)
+    elif mime_type in DOC_MIME_TYPES:
+        loader = Docx2txtLoader(file_path)
+        return loader.lazy_load()
+
+    raise Exception(f"Invalid mimetype {mime_type} for file {file_path}")
+
+
+def parse_pdf(file_path: str):
+    # page by page, straight from the file (the same documents langchain's PDFPlumberParser
+    # builds). a page's layout is released once its text is extracted, so memory does not
+    # grow with the number of pages
+    with pdfplumber.open(file_path) as pdf:
+        pdf_metadata = {key: value for key, value in pdf.metadata.items()
+                        if type(value) in [str, int]}
+        total_pages = len(pdf.pages)
+        for page in pdf.pages:
+            metadata = {
+                "source": file_path,
+                "file_path": file_path,
+                "page": page.page_number - 1,
+                "total_pages": total_pages,
+                **pdf_metadata
+            }
+            yield Document(page_content=page.extract_text(), metadata=metadata)
+            page.close()
+
+
+def parse_html(html: str):
+    # the page content, and the site chrome (nav, header, footer) as a document of its own
+    content, boilerplate, metadata = extract_html(html)
+    documents = [Document(page_content=content, metadata=metadata)]
+    if boilerplate.strip() != '':
+        documents.append(Document(page_content=boilerplate,
+                         metadata={**metadata, 'boilerplate': True}))
+
+    return documents
+
+
+def split_documents(documents, batch_size: int = CHUNK_BATCH_SIZE):
+    # splits one document (page) at a time and yields the chunks in batches of batch_size
+    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        model_name=OPENAI_MODEL,
+        chunk_size=CHUNK_SIZE_TOKENS, chunk_overlap=CHUNK_OVERLAP_TOKENS)
+
+    batch = []
+    for document in documents:
+        chunks = splitter.split_documents([document])
+
+        # remove non-printable characters. chunks left without text (e.g. all non-ascii)
+        # are dropped, the embeddings api rejects empty input
+        chunks = [(''.join(filter(lambda x: x in string.printable, chunk.page_content)), chunk)
+                  for chunk in chunks]
+        chunks = [(text, chunk) for text, chunk in chunks if text.strip() != '']
+        texts = [text for text, _ in chunks]
+        token_counts = [len(tokens) for tokens in encoder.encode_batch(texts)]
+
+        batch.extend(
+            Chunk(text, chunk.metadata, num_tokens, get_content_hash(text))
+            for (text, chunk), num_tokens in zip(chunks, token_counts)
+        )
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            batch = batch[batch_size:]
+
+    if len(batch) > 0:
+        yield batch
+
+
+def extract_file_chunks(file_path: str, mime_type: str):
+    return split_documents(parse_file(file_path, mime_type))
+
+
+def extract_html_chunks(html: str):
+    return split_documents(parse_html(html))
+
+
+def extract_html_blocks(html: str):
+    # for sitemap pages: the page's documents as fingerprinted blocks, the consumer drops the
+    # blocks stored for a sibling page already (see helpers/boilerplate.py) and then splits
+    yield fingerprint_documents(parse_html(html))
+
+
+def run_task(sender, max_memory_bytes: int, fn, args):
+    # entrypoint of the worker process. the batches `fn` yields (and then the traceback if it
+    # fails) go back over the pipe, sending blocks while the consumer is busy with the
+    # previous ones, so a large document is never held in memory at once on either side
+    try:
+        if max_memory_bytes > 0:
+            resource.setrlimit(resource.RLIMIT_AS,
+                               (max_memory_bytes, max_memory_bytes))
+        for batch in fn(*args):
+            sender.send(("batch", batch))
+        sender.send(("done", None))
+    except BaseException:
+        sender.send(("failed", traceback.format_exc()))
+    finally:
+        sender.close()
+
+
+class ParsePool:
+    # parsing and splitting are cpu bound (pdfplumber, bs4, the splitter) and would hold the
+    # gil of the consumer, stalling the other assets in flight and the amqp heartbeats. every
+    # task runs in its own process, forked from a forkserver that has the parsers imported
+    # already, so that a task over its timeout or memory cap is killed without taking the
+    # worker (or the other tasks) down with it
+    def __init__(self, max_processes: int = PARSE_MAX_PROCESSES,
+                 timeout_seconds: int = PARSE_TIMEOUT_SECONDS,
+                 max_memory_mb: int = PARSE_MAX_MEMORY_MB):
+        self.timeout_seconds = timeout_seconds
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self.context = multiprocessing.get_context("forkserver")
+        self.context.set_forkserver_preload(["__main__", "helpers.parse"])
+        self.slots = threading.BoundedSemaphore(max_processes)
+
+    def run(self, fn, *args):
+        # for tasks that yield a single result
+        return list(self.stream(fn, *args))[0]
+
+    def stream(self, fn, *args):
+        # runs the generator `fn` in a worker process and yields its batches. the timeout
+        # only counts the time spent waiting for the worker, not the time the caller takes
+        # with the batches. the slot is only held while waiting for the worker: while the
+        # caller embeds and stores a batch the worker parses at most the next one and then
+        # blocks on the pipe, so the slots do not cap the assets in flight
+        self.slots.acquire()
+        has_slot = True
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=run_task, args=(sender, self.max_memory_bytes, fn, args), daemon=True)
+        try:
+            process.start()
+            sender.close()
+            remaining = self.timeout_seconds
+            while True:
+                if not has_slot:
+                    self.slots.acquire()
+                    has_slot = True
+
+                t1 = time.monotonic()
+                if not receiver.poll(max(remaining, 0)):
+                    raise Exception(
+                        f"{fn.__name__} did not finish within {self.timeout_seconds} seconds")
+                remaining -= time.monotonic() - t1
+
+                try:
+                    kind, payload = receiver.recv()
+                except EOFError:
+                    process.join()
+                    raise Exception(
+                        f"{fn.__name__} worker process died with exit code {process.exitcode}")
+
+                if kind == "done":
+                    break
+                if kind == "failed":
+                    raise Exception(
+                        f"{fn.__name__} failed in the worker process\n{payload}")
+
+                self.slots.release()
+                has_slot = False
+                yield payload
+        finally:
+            # also reached when the caller stops early (e.g. embedding failed)
+            if process.is_alive():
+                process.kill()
+            if process.pid is not None:
+                process.join()
+            process.close()
+            receiver.close()
+            if has_slot:
+                self.slots.release()
+
+
+parse_pool = ParsePool()
@@ -5,3 +5,7 @@ class InputMessageSchema(Schema):
     asset_id = fields.Int(required=True, valudate=validate.Range(min=1))
     bot_id = fields.Int(required=True, valudate=validate.Range(min=1))
     mime_type = fields.Str(required=False)
+    refresh = fields.Bool(required=False, load_default=False)
+    lastmod = fields.Str(required=False, allow_none=True)
+    # re-parse on refresh even when the page did not change
+    force = fields.Bool(required=False, load_default=False)
@@ -1,6 +1,9 @@
 from logging import Logger
+import hashlib
 import traceback
 import os
+import re
+import unicodedata
 import wget
 from urllib.parse import urlparse
 from pathlib import Path
@@ -38,3 +41,14 @@ def download_file_from_url(url: str, folder_path: str, logger: Logger):
         traceback.print_exc()
         remove_file(file_path)
         return
+
+
+def normalise_chunk_text(text: str):
+    # the content hash only ignores differences that do not change what gets embedded
+    # (unicode forms and whitespace), casing is kept
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def get_content_hash(text: str):
+    return hashlib.sha256(normalise_chunk_text(text).encode("utf-8")).hexdigest()
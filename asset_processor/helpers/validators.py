@@ -0,0 +1,48 @@
+import requests
+
+from envs import ENV
+
+
+# a HEAD request straight to the site, it only has to return headers
+VALIDATORS_TIMEOUT = (3, 5)
+
+session = requests.Session()
+
+
+def get_page_validators(url: str):
+    # the http validators (ETag, Last-Modified) of the page, {} when the site has none or
+    # the request failed. weak etags are kept as is, they are only compared for equality
+    if ENV == "development":
+        url = url.replace("localhost", "localstack")
+
+    try:
+        response = session.head(
+            url, timeout=VALIDATORS_TIMEOUT, allow_redirects=True)
+    except requests.RequestException:
+        return {}
+
+    if not response.ok:
+        return {}
+
+    validators = {}
+    if response.headers.get("etag"):
+        validators["etag"] = response.headers["etag"]
+    if response.headers.get("last-modified"):
+        validators["last_modified"] = response.headers["last-modified"]
+
+    return validators
+
+
+def is_unchanged(asset_metadata: dict, validators: dict, lastmod: str = None):
+    # whether the page is the one processed last time, going by the sitemap lastmod or the
+    # validators. a page without any of them is never considered unchanged
+    if lastmod is not None and asset_metadata.get("lastmod") == lastmod:
+        return True
+
+    if "etag" in validators:
+        return asset_metadata.get("etag") == validators["etag"]
+
+    if "last_modified" in validators:
+        return asset_metadata.get("last_modified") == validators["last_modified"]
+
+    return False
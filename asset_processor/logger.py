@@ -1,25 +1,33 @@
 import os
 import logging
+import threading
 from logging import Logger
 
 
+# the prefix (e.g. the bot and asset ids) is per thread, assets are processed concurrently
+_context = threading.local()
+
+
+class PrefixFilter(logging.Filter):
+    def filter(self, record):
+        record.prefix = getattr(_context, "prefix", record.name)
+        return True
+
+
 def get_logger(name, level=logging.DEBUG):
     logger = logging.getLogger(name)
     logger.setLevel(level)
     formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        '%(asctime)s - %(prefix)s - %(levelname)s - %(message)s')
     ch = logging.StreamHandler()
     ch.setFormatter(formatter)
+    ch.addFilter(PrefixFilter())
     logger.addHandler(ch)
     return logger
 
 
 def set_prefix(logger: Logger, prefix):
-    formatter = logging.Formatter(
-        f'%(asctime)s - {prefix} - %(levelname)s - %(message)s')
-    for handler in logger.handlers:
-        handler.setFormatter(formatter)
-
+    _context.prefix = prefix
     return logger
 
 
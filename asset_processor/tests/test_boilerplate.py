@@ -0,0 +1,21 @@
+from helpers.boilerplate import split_blocks
+
+
+def test_split_blocks_groups_short_lines():
+    text = ("Opening hours\n"
+            "The clinic is open from Monday to Friday between nine and five.\n"
+            "\n"
+            "Call\n"
+            "us\n"
+            "today\n")
+
+    # short lines are grouped until a block has enough words, the rest is a block of its own
+    assert split_blocks(text) == [
+        "Opening hours\nThe clinic is open from Monday to Friday between nine and five.",
+        "Call\nus\ntoday",
+    ]
+
+
+def test_split_blocks_without_text():
+    assert split_blocks("") == []
+    assert split_blocks("\n  \n") == []
@@ -0,0 +1,92 @@
+import struct
+
+import numpy as np
+
+from db.copy import (
+    EMBEDDING_COLUMNS,
+    PGCOPY_HEADER,
+    PGCOPY_TRAILER,
+    copy_embeddings,
+    decode_vector,
+    encode_vector
+)
+
+
+class CopyCursor:
+    # records what copy_embeddings streams to the database
+    def copy_expert(self, sql, buffer):
+        self.sql = sql
+        self.data = buffer.read()
+
+
+def read_copy_rows(data: bytes):
+    # decodes the binary COPY stream back into rows of raw field values (None for nulls)
+    assert data.startswith(PGCOPY_HEADER)
+    assert data.endswith(PGCOPY_TRAILER)
+    offset = len(PGCOPY_HEADER)
+    rows = []
+    while True:
+        (field_count,) = struct.unpack_from(">h", data, offset)
+        offset += 2
+        if field_count == -1:
+            break
+        row = []
+        for _ in range(field_count):
+            (length,) = struct.unpack_from(">i", data, offset)
+            offset += 4
+            if length == -1:
+                row.append(None)
+                continue
+            row.append(data[offset:offset + length])
+            offset += length
+        rows.append(row)
+
+    assert offset == len(data)
+    return rows
+
+
+def test_copy_embeddings_round_trip():
+    rows = [
+        ([0.5, -1.25, 3.0], "first chunk", '{"page": 1}', 7, 3, 12, "abc", 0),
+        ([0.0, 1.0, 2.0], "second chunk ü", None, 7, 3, None, None, None),
+    ]
+    cur = CopyCursor()
+
+    copy_embeddings(cur, rows)
+
+    assert f"({', '.join(EMBEDDING_COLUMNS)})" in cur.sql
+    assert "FORMAT binary" in cur.sql
+    decoded = read_copy_rows(cur.data)
+    assert len(decoded) == 2
+    assert all(len(row) == len(EMBEDDING_COLUMNS) for row in decoded)
+
+    embedding, chunk_text, chunk_metadata, asset_id, owner_bot_id, num_tokens, \
+        content_hash, chunk_index = decoded[0]
+    assert decode_vector(embedding).tolist() == [0.5, -1.25, 3.0]
+    assert chunk_text.decode("utf-8") == "first chunk"
+    assert chunk_metadata.decode("utf-8") == '{"page": 1}'
+    assert [struct.unpack(">i", value)[0]
+            for value in (asset_id, owner_bot_id, num_tokens, chunk_index)] == [7, 3, 12, 0]
+    assert content_hash == b"abc"
+
+    assert decoded[1][1].decode("utf-8") == "second chunk ü"
+    assert decoded[1][2] is None
+    assert decoded[1][5:] == [None, None, None]
+
+
+def test_copy_embeddings_without_rows():
+    cur = CopyCursor()
+
+    copy_embeddings(cur, [])
+
+    assert cur.data == PGCOPY_HEADER + PGCOPY_TRAILER
+
+
+def test_vector_binary_round_trip():
+    # vector_send(embedding) returns the format encode_vector writes
+    embedding = [0.5, -1.25, 3.0, 1e-8]
+
+    decoded = decode_vector(encode_vector(embedding))
+
+    assert decoded.dtype == np.float32
+    assert decoded.tolist() == np.asarray(embedding, dtype=np.float32).tolist()
@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from helpers.embedding_batcher import EmbeddingBatcher
+
+
+class EmbeddingsClient:
+    # stands in for `OpenAI().embeddings`: rejects any input with a "bad" text like the api
+    # rejects a bad item, embeds the rest as [len(text)]
+    def __init__(self):
+        self.inputs = []
+
+    def create(self, input, model, dimensions):
+        self.inputs.append(input)
+        if any("bad" in text for text in input):
+            response = httpx.Response(
+                400, request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"))
+            raise openai.BadRequestError("invalid input", response=response, body=None)
+
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[len(text)]) for text in input])
+
+
+def make_batcher():
+    batcher = EmbeddingBatcher(max_items=10, max_tokens=1000, wait_ms=200)
+    batcher.client = SimpleNamespace(embeddings=EmbeddingsClient())
+    return batcher
+
+
+def test_rejected_batch_only_fails_the_bad_request():
+    batcher = make_batcher()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        good = executor.submit(batcher.embed, ["one", "three"], [1, 1])
+        bad = executor.submit(batcher.embed, ["a bad text", "fine"], [3, 1])
+
+        assert good.result(timeout=10) == [[3], [5]]
+        with pytest.raises(openai.BadRequestError):
+            bad.result(timeout=10)
+
+    # sent together first, then every request on its own
+    assert len(batcher.client.embeddings.inputs[0]) == 4
+
+
+def test_empty_text_is_not_queued():
+    batcher = make_batcher()
+
+    with pytest.raises(Exception, match="empty text"):
+        batcher.embed(["text", " "], [1, 0])
+
+    assert batcher.client.embeddings.inputs == []
@@ -0,0 +1,37 @@
+from helpers.extract import extract_html_selectolax
+
+
+PAGE = """
+<html>
+  <head><title>Opening hours</title></head>
+  <body>
+    <header><nav><a href="/">Home</a><a href="/services">Services</a></nav></header>
+    <div class="content">
+      <h1>Opening hours</h1>
+      <p>The clinic is open from Monday to Friday between nine and five.</p>
+      <script>track()</script>
+    </div>
+    <footer>Clinic Street 1, call 555 0100 for an appointment today</footer>
+  </body>
+</html>
+"""
+
+
+def test_page_chrome_is_split_off_the_content():
+    # without a main element the site chrome in the body is split off the content
+    content, boilerplate, metadata = extract_html_selectolax(PAGE)
+
+    assert metadata["title"] == "Opening hours"
+    assert "Home" in boilerplate and "Clinic Street 1" in boilerplate
+    assert "Home" not in content and "Clinic Street 1" not in content
+    assert "track()" not in content
+    assert "The clinic is open from Monday to Friday" in content
+
+
+def test_main_element_keeps_only_its_content():
+    page = PAGE.replace('<div class="content">', "<main>").replace("</div>", "</main>")
+
+    content, _, _ = extract_html_selectolax(page)
+
+    assert "The clinic is open from Monday to Friday" in content
+    assert "Home" not in content and "Clinic Street 1" not in content
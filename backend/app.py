@@ -1,3 +1,5 @@
+import threading
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
@@ -10,6 +12,9 @@ from settings import SENTRY_DSN, FLASK_ENV
 # setup db
 db = SQLAlchemy()
 
+_bare_app = None
+_bare_app_lock = threading.Lock()
+
 
 def create_app(**config_overrides):
     sentry_sdk.init(
@@ -72,3 +77,16 @@ def create_app(**config_overrides):
     app.register_blueprint(session_router)
 
     return app
+
+
+def get_bare_app():
+    # bare app shared by the work that runs outside of the request's app context
+    # (e.g. streaming answers). created lazily so that every gunicorn worker builds its
+    # own after the fork, and then reused along with its db connection pool
+    global _bare_app
+    if _bare_app is None:
+        with _bare_app_lock:
+            if _bare_app is None:
+                _bare_app = create_app(bare=True)
+
+    return _bare_app
@@ -102,3 +102,38 @@ class Asset(db.Model):
 
     def __repr__(self):
         return f"<Asset {self.value[:20]}>"
+
+
+class SitemapBlock(db.Model):
+    # minhash (lsh band) fingerprints of the text blocks of the child pages of a sitemap,
+    # written by the asset processor. a block already stored for a sibling page (site chrome,
+    # cookie banners, repeated call to actions) is not chunked or embedded again
+    __tablename__ = "sitemap_block"
+
+    parent_asset_id = db.Column(db.Integer, db.ForeignKey(
+        'asset.id', ondelete='CASCADE'), primary_key=True)
+    band = db.Column(db.SmallInteger, primary_key=True)
+    band_hash = db.Column(db.BigInteger, primary_key=True)
+    # the page whose chunks include the block, null when that page failed
+    first_asset_id = db.Column(db.Integer, nullable=True)
+    # number of sibling pages the band was seen on, see SitemapBlockAsset
+    asset_count = db.Column(db.Integer, nullable=False, server_default='1')
+
+    def __repr__(self):
+        return f"<SitemapBlock {self.parent_asset_id} {self.band}:{self.band_hash}>"
+
+
+class SitemapBlockAsset(db.Model):
+    # the pages a sitemap block was seen on, so that `SitemapBlock.asset_count` counts
+    # distinct pages and not visits (pages are processed again on retries and refreshes)
+    __tablename__ = "sitemap_block_asset"
+
+    parent_asset_id = db.Column(db.Integer, db.ForeignKey(
+        'asset.id', ondelete='CASCADE'), primary_key=True)
+    band = db.Column(db.SmallInteger, primary_key=True)
+    band_hash = db.Column(db.BigInteger, primary_key=True)
+    asset_id = db.Column(db.Integer, db.ForeignKey(
+        'asset.id', ondelete='CASCADE'), primary_key=True)
+
+    def __repr__(self):
+        return f"<SitemapBlockAsset {self.parent_asset_id} {self.band}:{self.band_hash} {self.asset_id}>"
@@ -0,0 +1,120 @@
+"""Recall vs latency report for the hnsw index on `embedding.embedding`.
+
+Samples stored chunk embeddings as queries, computes the exact top-k (index scans
+disabled) and compares it against the index results for a range of `hnsw.ef_search`
+values.
+
+Usage (inside the backend container):
+
+    poetry run python -m benchmarks.ann_recall --bot-id 12 --queries 50 --k 10
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app import create_app, db
+from bot.models import Bot
+
+
+RETRIEVAL_QUERY = '''
+    SELECT e.id
+    FROM embedding e JOIN bot_assets ba ON ba.asset_id = e.asset_id
+    WHERE e.owner_bot_id = :owner_bot_id
+    AND ba.bot_id = :bot_id
+    AND ba.deleted_at IS NULL
+    ORDER BY e.embedding <-> CAST(:query_embedding AS vector)
+    LIMIT :k;
+'''
+
+
+def sample_queries(bot_id: int, num_queries: int):
+    rows = db.session.execute(text('''
+        SELECT e.embedding::text
+        FROM embedding e JOIN bot_assets ba ON ba.asset_id = e.asset_id
+        WHERE ba.bot_id = :bot_id AND ba.deleted_at IS NULL
+        ORDER BY random()
+        LIMIT :n;
+    '''), {"bot_id": bot_id, "n": num_queries}).all()
+
+    return [row[0] for row in rows]
+
+
+def run_query(bot_id: int, owner_bot_id: int, query_embedding: str, k: int, settings: list):
+    # every query runs in its own transaction so that SET LOCAL does not leak
+    with db.engine.connect() as conn:
+        with conn.begin():
+            for setting in settings:
+                conn.execute(text(setting))
+
+            t1 = time.perf_counter()
+            rows = conn.execute(text(RETRIEVAL_QUERY), {
+                "owner_bot_id": owner_bot_id,
+                "bot_id": bot_id,
+                "query_embedding": query_embedding,
+                "k": k
+            }).all()
+            t2 = time.perf_counter()
+
+    return [row[0] for row in rows], (t2 - t1) * 1000
+
+
+def percentile(values: list, p: float):
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(p * (len(values) - 1))))
+    return values[idx]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bot-id", type=int, required=True)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef-search", type=str, default="10,20,40,80,100,160,320")
+    args = parser.parse_args()
+
+    app = create_app(bare=True)
+    with app.app_context():
+        bot = Bot.query.filter_by(id=args.bot_id).first()
+        if bot is None:
+            print(f"bot {args.bot_id} not found")
+            return
+
+        owner_bot_id = bot.embedding_partition_id()
+        queries = sample_queries(args.bot_id, args.queries)
+        if len(queries) == 0:
+            print(f"bot {args.bot_id} has no embeddings")
+            return
+
+        exact_results = []
+        exact_latencies = []
+        for q in queries:
+            ids, latency = run_query(args.bot_id, owner_bot_id, q, args.k, [
+                "SET LOCAL enable_indexscan = off"
+            ])
+            exact_results.append(set(ids))
+            exact_latencies.append(latency)
+
+        print(f"bot_id={args.bot_id} queries={len(queries)} k={args.k}")
+        print(f"{'ef_search':>10} {'recall':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        print(f"{'exact':>10} {1.0:>8.3f} {statistics.median(exact_latencies):>8.2f} "
+              f"{percentile(exact_latencies, 0.95):>8.2f}")
+
+        for ef_search in [int(x) for x in args.ef_search.split(",")]:
+            recalls = []
+            latencies = []
+            for q, expected in zip(queries, exact_results):
+                ids, latency = run_query(args.bot_id, owner_bot_id, q, args.k, [
+                    f"SET LOCAL hnsw.ef_search = {ef_search}"
+                ])
+                latencies.append(latency)
+                if len(expected) > 0:
+                    recalls.append(len(expected.intersection(ids)) / len(expected))
+
+            print(f"{ef_search:>10} {statistics.mean(recalls):>8.3f} "
+                  f"{statistics.median(latencies):>8.2f} {percentile(latencies, 0.95):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Micro-benchmark of the retrieval result path: pandas DataFrame vs plain cursor rows.
+
+The old path built the query as text and fetched it with `pandas.io.sql.read_sql_query`,
+the new path executes the prepared statement and maps rows to `RetrievedChunk`.
+pandas is no longer a backend dependency, install it in the container to run this.
+
+Usage (inside the backend container):
+
+    poetry run pip install pandas
+    poetry run python -m benchmarks.fetch_path --bot-id 12 --iterations 200
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app import create_app, db
+from bot.models import Bot
+from rag.retrieval import retrieve_chunks
+
+
+def old_fetch(query_embedding: list, partition_id: int, bot_id: int, limit: int):
+    import pandas.io.sql as sqlio
+
+    query = f'''
+        SELECT e.*
+        FROM embedding e JOIN bot_assets ba ON ba.asset_id = e.asset_id
+        WHERE e.owner_bot_id = {partition_id}
+        AND ba.bot_id = {bot_id}
+        AND ba.deleted_at IS NULL
+        ORDER BY
+            e.embedding <-> '[{','.join([str(x) for x in query_embedding])}]'
+        LIMIT {limit};
+        '''
+    relevant_chunks = sqlio.read_sql_query(query, db.session.connection())
+    relevant_chunks = relevant_chunks.reset_index(drop=True)
+    return [chunk for chunk in relevant_chunks['chunk_text']]
+
+
+def new_fetch(query_embedding: list, partition_id: int, bot_id: int, limit: int):
+    relevant_chunks = retrieve_chunks(
+        query_embedding, partition_id=partition_id, bot_id=bot_id, limit=limit)
+    return [chunk.chunk_text for chunk in relevant_chunks]
+
+
+def measure(fn, iterations: int, *args):
+    latencies = []
+    for _ in range(iterations):
+        t1 = time.perf_counter()
+        fn(*args)
+        latencies.append((time.perf_counter() - t1) * 1000)
+        db.session.rollback()
+
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bot-id", type=int, required=True)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    app = create_app(bare=True)
+    with app.app_context():
+        bot = Bot.query.filter_by(id=args.bot_id).first()
+        if bot is None:
+            print(f"bot {args.bot_id} not found")
+            return
+
+        partition_id = bot.embedding_partition_id()
+        query_embedding = db.session.execute(text(
+            "SELECT embedding::text FROM embedding WHERE owner_bot_id = :owner_bot_id LIMIT 1;"
+        ), {"owner_bot_id": partition_id}).scalar()
+        if query_embedding is None:
+            print(f"bot {args.bot_id} has no embeddings")
+            return
+
+        query_embedding = [float(x) for x in query_embedding.strip("[]").split(",")]
+        fetch_args = (query_embedding, partition_id, bot.id, args.limit)
+
+        # warm up connections, prepared statements and imports
+        old_fetch(*fetch_args)
+        new_fetch(*fetch_args)
+        db.session.rollback()
+
+        for name, fn in [("pandas", old_fetch), ("cursor", new_fetch)]:
+            latencies = measure(fn, args.iterations, *fetch_args)
+            print(f"{name:>8}: mean {statistics.mean(latencies):.3f} ms, "
+                  f"p50 {statistics.median(latencies):.3f} ms, max {max(latencies):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
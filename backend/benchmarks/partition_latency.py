@@ -0,0 +1,82 @@
+"""Per-bot retrieval latency against the size of each bot's embedding partition.
+
+For every staging bot with embeddings, runs the retrieval query with stored chunk
+embeddings as queries and reports the latency next to the partition size and the total
+size of the embedding table. With partition pruning the latency should follow the
+partition size only.
+
+Usage (inside the backend container):
+
+    poetry run python -m benchmarks.partition_latency --queries 20 --k 10
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app import create_app, db
+from bot.models import Bot, DeploymentStatus
+from embedding.models import Embedding
+from rag.config import HNSW_EF_SEARCH
+
+
+RETRIEVAL_QUERY = '''
+    SELECT e.id
+    FROM embedding e JOIN bot_assets ba ON ba.asset_id = e.asset_id
+    WHERE e.owner_bot_id = :owner_bot_id
+    AND ba.bot_id = :bot_id
+    AND ba.deleted_at IS NULL
+    ORDER BY e.embedding <-> CAST(:query_embedding AS vector)
+    LIMIT :k;
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    app = create_app(bare=True)
+    with app.app_context():
+        total_rows = db.session.execute(
+            text("SELECT count(*) FROM embedding;")).scalar()
+        bots = Bot.query.filter_by(
+            deployment_status=DeploymentStatus.STAGING, deleted_at=None).all()
+
+        print(f"total embedding rows: {total_rows}")
+        print(f"{'bot_id':>8} {'partition rows':>15} {'p50 ms':>8} {'max ms':>8}")
+
+        for bot in bots:
+            partition_name = Embedding.partition_name(bot.id)
+            partition_rows = db.session.execute(
+                text(f"SELECT count(*) FROM public.{partition_name};")).scalar()
+            if partition_rows == 0:
+                continue
+
+            queries = db.session.execute(text(
+                f"SELECT embedding::text FROM public.{partition_name} ORDER BY random() LIMIT :n;"
+            ), {"n": args.queries}).scalars().all()
+
+            latencies = []
+            for q in queries:
+                with db.engine.connect() as conn:
+                    with conn.begin():
+                        conn.execute(
+                            text(f"SET LOCAL hnsw.ef_search = {HNSW_EF_SEARCH}"))
+                        t1 = time.perf_counter()
+                        conn.execute(text(RETRIEVAL_QUERY), {
+                            "owner_bot_id": bot.id,
+                            "bot_id": bot.id,
+                            "query_embedding": q,
+                            "k": args.k
+                        }).all()
+                        latencies.append((time.perf_counter() - t1) * 1000)
+
+            print(f"{bot.id:>8} {partition_rows:>15} {statistics.median(latencies):>8.2f} "
+                  f"{max(latencies):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Prompt assembly time against conversation length.
+
+Compares the old history assembly (encoder looked up and every message re-tokenised on
+every question) with `rag.answer.build_conversation` (shared encoder, stored
+`Message.num_tokens` reused). Uses synthetic messages, no db or network needed.
+
+Usage (inside the backend container):
+
+    poetry run python -m benchmarks.prompt_assembly --iterations 200
+"""
+import argparse
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+import tiktoken
+
+from message.models import MessageRole
+from rag.answer import build_conversation
+from rag.config import (
+    MAX_CONTEXT_WINDOW,
+    MAX_PREV_CTX_PERCENT,
+    MAX_PREV_MSGS,
+    get_system_prompt
+)
+from rag.utils import get_token_count
+from settings import OPENAI_MODEL
+
+
+WORDS = ("appointment insurance provider hours clinic doctor office location parking "
+         "referral billing payment surgery consultation follow-up visit schedule").split()
+
+
+def old_build_conversation(system_prompt: str, previous_messages: list, token_budget: int):
+    def old_get_token_count(text: str, model: str = OPENAI_MODEL):
+        enc = tiktoken.encoding_for_model(model)
+        return len(enc.encode(text))
+
+    messages = [{"role": "system", "content": system_prompt}]
+    prev_msg_tokens = old_get_token_count(system_prompt)
+
+    for i in range(0, len(previous_messages)):
+        if prev_msg_tokens < token_budget and len(messages) < MAX_PREV_MSGS:
+            messages.append({
+                "role": "user" if previous_messages[i].role == MessageRole.HUMAN else "assistant",
+                "content": previous_messages[i].content
+            })
+            prev_msg_tokens += old_get_token_count(
+                previous_messages[i].content, OPENAI_MODEL)
+        else:
+            break
+
+    return messages
+
+
+def synthetic_conversation(length: int, words_per_message: int):
+    messages = []
+    for i in range(length):
+        content = " ".join(random.choices(WORDS, k=words_per_message))
+        messages.append(SimpleNamespace(
+            role=MessageRole.HUMAN if i % 2 == 0 else MessageRole.BOT,
+            content=content,
+            num_tokens=get_token_count(content)
+        ))
+
+    return messages
+
+
+def measure(fn, iterations: int, *args):
+    latencies = []
+    for _ in range(iterations):
+        t1 = time.perf_counter()
+        fn(*args)
+        latencies.append((time.perf_counter() - t1) * 1000)
+
+    return statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--words-per-message", type=int, default=60)
+    parser.add_argument("--lengths", type=str, default="1,2,5,10,20,50")
+    args = parser.parse_args()
+
+    system_prompt = get_system_prompt("I am sorry, I am not able to help with that.")
+    token_budget = int(MAX_CONTEXT_WINDOW[OPENAI_MODEL] * MAX_PREV_CTX_PERCENT)
+
+    print(f"{'messages':>9} {'old p50 ms':>11} {'new p50 ms':>11}")
+    for length in [int(x) for x in args.lengths.split(",")]:
+        conversation = synthetic_conversation(length, args.words_per_message)
+        old = measure(old_build_conversation, args.iterations,
+                      system_prompt, conversation, token_budget)
+        new = measure(build_conversation, args.iterations,
+                      system_prompt, conversation, token_budget)
+        print(f"{length:>9} {old:>11.3f} {new:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Offline retrieval quality: vector only vs hybrid (vector + full text, rrf) vs hybrid + mmr.
+
+Loads the fixture corpus (`benchmarks/fixtures/retrieval_corpus.json` by default) into
+a throwaway bot inside a transaction that is rolled back at the end, embeds the chunks
+and questions with the configured embedding model (needs network access), and reports
+recall@k, mrr and the prompt tokens of the top k chunks for each retrieval mode. Use
+it to tune `HYBRID_CANDIDATES`, `RRF_K`, `MMR_LAMBDA` and `MAX_CHUNKS_ALLOWED` (see
+rag/config.py).
+
+Usage (inside the backend container, against a dev database):
+
+    poetry run python -m benchmarks.retrieval_eval --k 1,3,5
+    poetry run python -m benchmarks.retrieval_eval --corpus path/to/corpus.json
+"""
+import argparse
+import json
+import os
+import statistics
+
+from app import create_app, db
+from asset.models import Asset, AssetStatus
+from bot.models import Bot, BotStatus
+from bot_assets.models import BotAssets
+from client.models import Client
+from embedding.models import Embedding
+from rag.clients import get_openai_client
+from rag.config import MMR_CANDIDATES
+from rag.mmr import select_diverse_chunks
+from rag.query_embedding import embed_question
+from rag.retrieval import retrieve_chunks
+from rag.utils import get_token_counts
+from settings import OPENAI_EMBEDDING_MODEL, OPENAI_EMBEDDINGS_DIMS
+
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(
+    __file__), "fixtures", "retrieval_corpus.json")
+
+
+def embed(texts: list):
+    response = get_openai_client().embeddings.create(
+        input=texts,
+        model=OPENAI_EMBEDDING_MODEL,
+        dimensions=OPENAI_EMBEDDINGS_DIMS
+    )
+    return [item.embedding for item in response.data]
+
+
+def load_corpus(corpus: dict):
+    client = Client("retrieval-eval")
+    db.session.add(client)
+    db.session.flush()
+
+    bot = Bot("retrieval-eval", client)
+    bot.status = BotStatus.SUCCESS
+    db.session.add(bot)
+    db.session.flush()
+    Embedding.create_partition(bot.id)
+
+    asset = Asset("url", "https://retrieval-eval.example")
+    asset.status = AssetStatus.SUCCESS
+    db.session.add(asset)
+    db.session.flush()
+    db.session.add(BotAssets(bot_id=bot.id, asset_id=asset.id))
+
+    chunk_texts = [chunk["text"] for chunk in corpus["chunks"]]
+    embeddings = [Embedding(text, embedding, asset, bot.id)
+                  for text, embedding in zip(chunk_texts, embed(chunk_texts))]
+    db.session.add_all(embeddings)
+    db.session.flush()
+
+    keys_by_id = {embedding.id: chunk["key"]
+                  for embedding, chunk in zip(embeddings, corpus["chunks"])}
+    return bot, keys_by_id
+
+
+def evaluate(bot, keys_by_id: dict, questions: list, question_embeddings: list,
+             ks: list, is_hybrid: bool, is_mmr: bool):
+    recalls = {k: [] for k in ks}
+    reciprocal_ranks = []
+    tokens = {k: [] for k in ks}
+
+    for question, query_embedding in zip(questions, question_embeddings):
+        chunks = retrieve_chunks(
+            query_embedding,
+            partition_id=bot.id,
+            bot_id=bot.id,
+            limit=max(MMR_CANDIDATES, max(ks)) if is_mmr else max(ks),
+            question=question["question"] if is_hybrid else None
+        )
+        if is_mmr:
+            chunks = select_diverse_chunks(chunks, max(ks))
+        ranked_keys = [keys_by_id[chunk.id] for chunk in chunks]
+        relevant = set(question["relevant"])
+
+        for k in ks:
+            recalls[k].append(len(relevant & set(ranked_keys[:k])) / len(relevant))
+            tokens[k].append(
+                sum(get_token_counts([chunk.chunk_text for chunk in chunks[:k]])))
+
+        ranks = [rank for rank, key in enumerate(ranked_keys, start=1)
+                 if key in relevant]
+        reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+
+    return {
+        "recall": {k: statistics.mean(recalls[k]) for k in ks},
+        "mrr": statistics.mean(reciprocal_ranks),
+        "tokens": {k: statistics.mean(tokens[k]) for k in ks}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=str, default=DEFAULT_CORPUS)
+    parser.add_argument("--k", type=str, default="1,3,5,10")
+    args = parser.parse_args()
+
+    ks = sorted(int(k) for k in args.k.split(","))
+    with open(args.corpus) as f:
+        corpus = json.load(f)
+
+    questions = corpus["questions"]
+    # questions go through the same normalisation/embedding as in the answer path
+    question_embeddings = [embed_question(question["question"])
+                           for question in questions]
+
+    app = create_app(bare=True)
+    with app.app_context():
+        try:
+            bot, keys_by_id = load_corpus(corpus)
+            print(f"{len(corpus['chunks'])} chunks, {len(questions)} questions\n")
+            header = " ".join(f"{f'recall@{k}':>9}" for k in ks)
+            print(f"{'mode':>8} {header} {'mrr':>6} "
+                  + " ".join(f"{f'tokens@{k}':>9}" for k in ks))
+
+            modes = [("vector", False, False), ("hybrid", True, False),
+                     ("mmr", True, True)]
+            for mode, is_hybrid, is_mmr in modes:
+                result = evaluate(bot, keys_by_id, questions,
+                                  question_embeddings, ks, is_hybrid, is_mmr)
+                print(f"{mode:>8} "
+                      + " ".join(f"{result['recall'][k]:>9.3f}" for k in ks)
+                      + f" {result['mrr']:>6.3f} "
+                      + " ".join(f"{result['tokens'][k]:>9.0f}" for k in ks))
+        finally:
+            # nothing (including the partition) is left behind
+            db.session.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Concurrent streaming answers a running backend can serve.
+
+Opens `--streams` concurrent `/session/answer_question` SSE streams (one session each,
+the endpoint allows one stream per session) against `--base-url` and reports time to
+first token, stream duration and failures. Run it against a single pod, increasing
+`--streams` until the time to first token or the failures degrade.
+
+Session creation is rate limited per ip (30 per minute), sessions are created up front
+and the limit is waited out when hit.
+
+Usage (from any machine that can reach the backend):
+
+    poetry run python -m benchmarks.sse_load --base-url http://localhost:5000 \\
+        --bot-guid <live bot guid> --streams 100
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import uuid
+
+import httpx
+
+
+def create_session(client: httpx.Client, bot_guid: str):
+    user_guid = uuid.uuid4().hex
+    while True:
+        resp = client.post("/session/create",
+                           json={"user_guid": user_guid, "bot_guid": bot_guid})
+        if resp.status_code == 429:
+            time.sleep(2)
+            continue
+
+        resp.raise_for_status()
+        return resp.json()["guid"], user_guid
+
+
+def stream_answer(client: httpx.Client, session_guid: str, user_guid: str, question: str,
+                  start: threading.Event, results: list):
+    start.wait()
+    t1 = time.perf_counter()
+    first_token_at = None
+    try:
+        with client.stream("GET", f"/session/answer_question/{session_guid}",
+                           params={"question": question, "user_guid": user_guid}) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if not line.startswith("data: "):
+                    continue
+
+                if first_token_at is None and json.loads(line[6:]).get("token"):
+                    first_token_at = time.perf_counter()
+
+        results.append({
+            "ttft": (first_token_at - t1) * 1000 if first_token_at else None,
+            "duration": (time.perf_counter() - t1) * 1000,
+            "error": None
+        })
+    except Exception as e:
+        results.append({"ttft": None, "duration": None, "error": str(e)})
+
+
+def report(name: str, values: list):
+    if len(values) == 0:
+        print(f"{name:>20}: -")
+        return
+
+    p95 = statistics.quantiles(values, n=20)[-1] if len(values) > 1 else values[0]
+    print(f"{name:>20}: p50 {statistics.median(values):9.1f} ms, "
+          f"p95 {p95:9.1f} ms, max {max(values):9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", type=str, default="http://localhost:5000")
+    parser.add_argument("--bot-guid", type=str, required=True)
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--question", type=str,
+                        default="what are your opening hours?")
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.streams + 1)
+    with httpx.Client(base_url=args.base_url, limits=limits, timeout=120) as client:
+        sessions = [create_session(client, args.bot_guid)
+                    for _ in range(args.streams)]
+
+        start = threading.Event()
+        results = []
+        threads = [
+            threading.Thread(target=stream_answer, args=(
+                client, session_guid, user_guid, args.question, start, results))
+            for session_guid, user_guid in sessions
+        ]
+        for thread in threads:
+            thread.start()
+
+        t1 = time.perf_counter()
+        start.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - t1
+
+    errors = [r["error"] for r in results if r["error"] is not None]
+    print(f"{args.streams} concurrent streams in {elapsed:.1f} s, {len(errors)} failed")
+    report("time to first token", [r["ttft"]
+           for r in results if r["ttft"] is not None])
+    report("stream duration", [r["duration"]
+           for r in results if r["duration"] is not None])
+    for error in sorted(set(errors)):
+        print(f"  error: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Per-question setup cost: rebuilding the flask app and openai client vs reusing them.
+
+Measures `create_app(bare=True)` + a first db round trip and `OpenAI(...)` + a first
+embedding request on every iteration (the old behaviour) against the per-worker
+`get_bare_app()` / `get_openai_client()` (the new behaviour).
+
+Usage (inside the backend container):
+
+    poetry run python -m benchmarks.startup_cost --iterations 20
+    # skip the embedding requests (no network / api key)
+    poetry run python -m benchmarks.startup_cost --no-requests
+"""
+import argparse
+import statistics
+import time
+
+from openai import OpenAI
+from sqlalchemy import text
+
+from app import create_app, db, get_bare_app
+from rag.clients import get_openai_client
+from settings import OPENAI_API_KEY, OPENAI_EMBEDDING_MODEL, OPENAI_EMBEDDINGS_DIMS
+
+
+def app_round_trip(app):
+    with app.app_context():
+        db.session.execute(text("SELECT 1;"))
+
+
+def embedding_round_trip(client):
+    client.embeddings.create(
+        input=["what are your opening hours?"],
+        model=OPENAI_EMBEDDING_MODEL,
+        dimensions=OPENAI_EMBEDDINGS_DIMS
+    )
+
+
+def measure(fn, iterations: int):
+    latencies = []
+    for _ in range(iterations):
+        t1 = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - t1) * 1000)
+
+    return latencies
+
+
+def report(name: str, latencies: list):
+    print(f"{name:>24}: mean {statistics.mean(latencies):8.2f} ms, "
+          f"p50 {statistics.median(latencies):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--no-requests", action="store_true")
+    args = parser.parse_args()
+
+    # warm up imports and the shared objects
+    app_round_trip(get_bare_app())
+    get_openai_client()
+
+    report("app per question", measure(
+        lambda: app_round_trip(create_app(bare=True)), args.iterations))
+    report("app per worker", measure(
+        lambda: app_round_trip(get_bare_app()), args.iterations))
+
+    report("openai client per question", measure(
+        lambda: OpenAI(api_key=OPENAI_API_KEY), args.iterations))
+    report("openai client per worker", measure(
+        lambda: get_openai_client(), args.iterations))
+
+    if not args.no_requests:
+        embedding_round_trip(get_openai_client())
+        report("embedding, new client", measure(
+            lambda: embedding_round_trip(OpenAI(api_key=OPENAI_API_KEY)), args.iterations))
+        report("embedding, reused client", measure(
+            lambda: embedding_round_trip(get_openai_client()), args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Time to first token of `rag.answer.answer_question_stream`.
+
+Measures the work done before retrieval (bot + history lookups and the query embedding
+request) run one after the other (the old order) and overlapped (the new order), and the
+end to end time to first token of the real pipeline for an existing session. Every
+iteration asks a slightly different question so the query embedding cache is missed.
+
+With `--concurrency N` every iteration asks N questions at the same time (one thread
+each), so that queueing for the overlap threads, the db pool or the openai connections
+shows up in the percentiles.
+
+Usage (inside the backend container):
+
+    poetry run python -m benchmarks.ttft --session-guid <session guid> --iterations 10 \\
+        --concurrency 50
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from app import get_bare_app
+from bot.models import Bot
+from message.models import Message
+from rag.answer import answer_question_stream, get_io_executor
+from rag.config import MAX_PREV_MSGS
+from rag.query_embedding import embed_question
+from session.models import Session
+
+
+def load_bot_and_history(session):
+    with get_bare_app().app_context():
+        Bot.query.filter_by(id=session.bot_id).first()
+        Message.query\
+            .with_entities(Message.role, Message.content, Message.num_tokens)\
+            .filter_by(session_id=session.id)\
+            .order_by(Message.created_at.desc()).limit(MAX_PREV_MSGS).all()
+
+
+def sequential(session, question: str):
+    load_bot_and_history(session)
+    embed_question(question)
+
+
+def overlapped(session, question: str):
+    future = get_io_executor().submit(embed_question, question)
+    load_bot_and_history(session)
+    future.result()
+
+
+def time_to_first_token(session, question: str):
+    tokens = answer_question_stream(question, session)
+    for token in tokens:
+        if token:
+            break
+    tokens.close()
+
+
+def measure(fn, session, question: str, iterations: int, concurrency: int):
+    latencies = []
+
+    def run(i: int, j: int):
+        t1 = time.perf_counter()
+        fn(session, f"{question} ({fn.__name__} {i} {j} {time.time()})")
+        latencies.append((time.perf_counter() - t1) * 1000)
+
+    for i in range(iterations):
+        threads = [threading.Thread(target=run, args=(i, j)) for j in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return latencies
+
+
+def report(name: str, latencies: list):
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(
+        latencies) > 1 else latencies[0]
+    print(f"{name:>24}: p50 {statistics.median(latencies):8.2f} ms, p95 {p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--session-guid", type=str, required=True)
+    parser.add_argument("--question", type=str,
+                        default="what are your opening hours?")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    with get_bare_app().app_context():
+        session = Session.find_one_by_guid(args.session_guid)
+        if session is None:
+            raise SystemExit(f"session {args.session_guid} not found")
+
+    report("sequential (before)", measure(
+        sequential, session, args.question, args.iterations, args.concurrency))
+    report("overlapped (after)", measure(
+        overlapped, session, args.question, args.iterations, args.concurrency))
+    report("time to first token", measure(
+        time_to_first_token, session, args.question, args.iterations, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
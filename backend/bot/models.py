@@ -11,6 +11,8 @@ import s3
 from bot_assets.models import BotAssets
 from asset.models import Asset
 from client.models import Client
+from embedding.models import Embedding
+from rag.answer_cache import invalidate_bot_answers
 
 from utils.embed_code import generate_embed_code
 from utils.logger import logger
@@ -88,6 +90,9 @@ class Bot(db.Model):
             db.session.add(bot)
             db.session.flush()
 
+            # every staging bot gets its own partition for the embeddings of its assets
+            Embedding.create_partition(bot.id)
+
             url_assets = [Asset("url", url) for url in body["urls"]]
             file_assets = []
             if files is not None:
@@ -164,6 +169,19 @@ class Bot(db.Model):
         # TODO: when do we delete assets/logos/embeddings?
         db.session.commit()
 
+    def embedding_partition_id(self):
+        # embeddings are partitioned by the staging bot that the assets were added to.
+        # a live bot only ever has assets rolled out from its staging bot
+        if self.deployment_status == DeploymentStatus.STAGING:
+            return self.id
+
+        staging_bot = Bot.query.with_entities(Bot.id).filter_by(
+            associated_bot_id=self.id, deployment_status=DeploymentStatus.STAGING).first()
+        if staging_bot is None:
+            return self.id
+
+        return staging_bot.id
+
     @classmethod
     def generate_guid(cls):
         return str(uuid.uuid4().hex)
@@ -379,6 +397,8 @@ class Bot(db.Model):
                 self.is_deviating_from_live = False
                 db.session.commit()
 
+                invalidate_bot_answers(live_bot.id)
+
                 return live_bot.guid
             else:
                 live_bot = Bot.query.filter_by(
@@ -424,6 +444,9 @@ class Bot(db.Model):
                 self.is_deviating_from_live = False
                 db.session.commit()
 
+                # the live bot now answers from the staging bot's assets and configuration
+                invalidate_bot_answers(live_bot.id)
+
                 is_logo_url_shared = self.query.filter_by(
                     logo_url=live_bot_prev_logo_url,
                     deleted_at=None
@@ -12,6 +12,7 @@ from client.models import Client
 from bot_assets.models import BotAssets
 from middleware.api_key import api_key_required
 from mq import mq
+from rag.answer_cache import invalidate_bot_answers
 from utils.embed_code import generate_embed_code
 import s3
 from utils.logger import logger
@@ -389,6 +390,9 @@ def edit(guid):
 
         db.session.commit()
 
+        # answers cached for the old configuration/assets must not be served anymore
+        invalidate_bot_answers(bot.id)
+
         for asset in added_url_assets + added_file_assets:
             mq.begin_asset_processing(asset_id=asset.id, bot_id=bot.id)
 
@@ -461,6 +465,54 @@ def edit(guid):
         raise CustomHTTPException("Internal server error", 500)
 
 
+@ bot_router.route("/refresh/<guid>", methods=["POST"])
+@ api_key_required
+def refresh(guid):
+    # re-crawls the url and practice url assets of the bot. pages that did not change are
+    # skipped (sitemap lastmod, http validators) and only the chunks that changed are
+    # embedded again, see the asset and sitemap processors
+    guid_schema = GuidSchema().load({"guid": guid})
+    bot = Bot.find_one_by_guid(guid_schema["guid"])
+    if bot is None:
+        raise CustomHTTPException("Bot not found", 404)
+
+    if bot.deployment_status != DeploymentStatus.STAGING:
+        raise CustomHTTPException(
+            "Refresh is only allowed for staging bots", 400)
+
+    if bot.status != BotStatus.SUCCESS:
+        raise CustomHTTPException(
+            f"Bot status is {bot.status.value}. Please wait for the bot to finish processing", 400)
+
+    assets = Asset.query.join(BotAssets, BotAssets.asset_id == Asset.id)\
+        .filter(
+        BotAssets.bot_id == bot.id,
+        Asset.deleted_at == None,
+        Asset.parent_asset_id == None,
+        Asset.type.in_(["url", "practice_url"]),
+        BotAssets.deleted_at == None
+    ).all()
+
+    # answers cached for the pages as they were must not be served anymore, by this bot or
+    # by its live bot (the assets are shared). the processors invalidate them again once
+    # the re-crawl changed the assets, see rag/answer_cache.get_version
+    invalidate_bot_answers(bot.id, bot.associated_bot_id)
+
+    for asset in assets:
+        if asset.type == "practice_url":
+            mq.begin_practice_url_processing(
+                asset_id=asset.id, bot_id=bot.id, refresh=True)
+        else:
+            mq.begin_asset_processing(
+                asset_id=asset.id, bot_id=bot.id, refresh=True)
+
+    return jsonify({
+        "guid": bot.guid,
+        "urls": sum(1 for asset in assets if asset.type == "url"),
+        "practice_urls": sum(1 for asset in assets if asset.type == "practice_url")
+    })
+
+
 @ bot_router.route("/status/<guid>", methods=["GET"])
 @ api_key_required
 def status(guid):
@@ -33,5 +33,8 @@ class Cache:
 
         return None
 
+    def get_bytes(self, key):
+        return self.redis.get(key)
+
 
 cache = Cache()
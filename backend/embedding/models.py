@@ -1,4 +1,5 @@
 from pgvector.sqlalchemy import Vector
+from sqlalchemy import text
 
 from app import db
 
@@ -6,20 +7,86 @@ from app import db
 class Embedding(db.Model):
     __tablename__ = "embedding"
 
-    id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     embedding = db.Column(Vector(dim=512), nullable=False)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     chunk_text = db.Column(db.Text, nullable=False)
     chunk_metadata = db.Column(db.JSON, nullable=True)
+    # written by the asset processor: token count of chunk_text, sha256 of the normalised
+    # chunk_text (NFKC, collapsed whitespace) and the position of the chunk within its asset
+    num_tokens = db.Column(db.Integer, nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)
+    chunk_index = db.Column(db.Integer, nullable=True)
 
     # one-to-many relationship with assets
     asset_id = db.Column(db.Integer, db.ForeignKey(
         "asset.id"), nullable=False)
 
-    def __init__(self, chunk_text, embedding, asset):
+    # partition key: the staging bot the asset was added to. the live version of a bot
+    # shares the assets (and hence the partition) of its staging bot, see `Bot.embedding_partition_id`
+    owner_bot_id = db.Column(db.Integer, primary_key=True, nullable=False)
+
+    __table_args__ = (
+        # approximate nearest neighbour index used by retrieval (L2 distance, `<->`).
+        # defined on the partitioned table, so every partition gets its own local index
+        db.Index(
+            'ix_embedding_embedding_hnsw',
+            'embedding',
+            postgresql_using='hnsw',
+            postgresql_with={'m': 16, 'ef_construction': 64},
+            postgresql_ops={'embedding': 'vector_l2_ops'}
+        ),
+        # full text index used by the lexical half of hybrid retrieval. queries must use
+        # the same expression (and text search config) for the index to be used
+        db.Index(
+            'ix_embedding_chunk_text_fts',
+            db.func.to_tsvector('english', chunk_text),
+            postgresql_using='gin'
+        ),
+        {'postgresql_partition_by': 'LIST (owner_bot_id)'}
+    )
+
+    def __init__(self, chunk_text, embedding, asset, owner_bot_id):
         self.chunk_text = chunk_text
         self.embedding = embedding
         self.asset_id = asset.id
+        self.owner_bot_id = owner_bot_id
+
+    @classmethod
+    def partition_name(cls, owner_bot_id: int):
+        return f"embedding_bot_{int(owner_bot_id)}"
+
+    @classmethod
+    def create_partition(cls, owner_bot_id: int):
+        # the table is created standalone and then attached: ATTACH PARTITION only needs a
+        # SHARE UPDATE EXCLUSIVE lock on the parent, so it does not wait for (or block)
+        # retrievals that are streaming an answer. the partitioned hnsw index is built on
+        # the empty partition as part of the attach
+        partition_name = cls.partition_name(owner_bot_id)
+        db.session.execute(text(
+            f"CREATE TABLE public.{partition_name} "
+            f"(LIKE public.embedding INCLUDING DEFAULTS INCLUDING CONSTRAINTS);"))
+        db.session.execute(text(
+            f"ALTER TABLE public.embedding ATTACH PARTITION public.{partition_name} "
+            f"FOR VALUES IN ({int(owner_bot_id)});"))
 
     def __repr__(self):
         return f"<Embedding {self.chunk_text[:20]}>"
+
+
+class EmbeddingCache(db.Model):
+    # chunk embeddings shared across assets and bots, keyed by the embedding model and the
+    # content hash of the chunk. read and written by the asset processor, rows not used for
+    # EMBEDDING_CACHE_RETENTION_DAYS (asset processor env) are deleted
+    __tablename__ = "embedding_cache"
+
+    model = db.Column(db.String(100), primary_key=True)
+    dims = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), primary_key=True)
+    embedding = db.Column(Vector(), nullable=False)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    last_used_at = db.Column(
+        db.DateTime, server_default=db.func.now(), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<EmbeddingCache {self.model} {self.content_hash[:12]}>"
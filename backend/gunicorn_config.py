@@ -6,3 +6,11 @@ class CustomGunicornLogger(glogging.Logger):
         if req.path in ["/health"]:
             return
         super().access(resp, req, environ, request_time)
+
+
+def post_fork(server, worker):
+    # with gevent workers the streaming answers are multiplexed on greenlets, psycopg2 has
+    # to wait for the db through gevent too (instead of blocking the whole worker)
+    if worker.__class__.__name__.startswith("Gevent"):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -0,0 +1,44 @@
+"""hnsw index on embedding
+
+Revision ID: 4b1f0c9e2a7d
+Revises: d75673328580
+Create Date: 2026-10-18 10:12:41.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b1f0c9e2a7d'
+down_revision = 'd75673328580'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # building the index on a large table takes a while, so it is built
+    # concurrently to keep the asset processor inserting in the meantime.
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_embedding_embedding_hnsw',
+            'embedding',
+            ['embedding'],
+            unique=False,
+            postgresql_using='hnsw',
+            postgresql_with={'m': 16, 'ef_construction': 64},
+            postgresql_ops={'embedding': 'vector_l2_ops'},
+            postgresql_concurrently=True,
+            if_not_exists=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_embedding_embedding_hnsw',
+            table_name='embedding',
+            postgresql_concurrently=True,
+            if_exists=True
+        )
@@ -0,0 +1,48 @@
+"""full text index on embedding chunk_text
+
+Revision ID: 6c3a8f1d2b94
+Revises: 9d2e6b3a1c58
+Create Date: 2026-10-18 14:21:05.918342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c3a8f1d2b94'
+down_revision = '9d2e6b3a1c58'
+branch_labels = None
+depends_on = None
+
+
+INDEX_NAME = 'ix_embedding_chunk_text_fts'
+INDEX_EXPRESSION = "USING gin (to_tsvector('english', chunk_text))"
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY is not supported on a partitioned table. the parent index
+    # is created (invalid) on the parent only, every partition's index is built
+    # concurrently and attached, and the parent index becomes valid once all are attached
+    op.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON ONLY public.embedding {INDEX_EXPRESSION};")
+
+    conn = op.get_bind()
+    partitions = conn.execute(sa.text("""
+        SELECT c.relname
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'public.embedding'::regclass;
+    """)).scalars().all()
+
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_chunk_text_fts_idx "
+                f"ON public.{partition} {INDEX_EXPRESSION};")
+            op.execute(
+                f"ALTER INDEX public.{INDEX_NAME} ATTACH PARTITION public.{partition}_chunk_text_fts_idx;")
+
+
+def downgrade():
+    # dropping the parent index drops the attached partition indexes too
+    op.execute(f"DROP INDEX IF EXISTS public.{INDEX_NAME};")
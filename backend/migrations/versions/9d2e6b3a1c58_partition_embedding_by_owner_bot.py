@@ -0,0 +1,209 @@
+"""partition embedding by owner bot
+
+Revision ID: 9d2e6b3a1c58
+Revises: 4b1f0c9e2a7d
+Create Date: 2026-10-18 11:02:17.530284
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2e6b3a1c58'
+down_revision = '4b1f0c9e2a7d'
+branch_labels = None
+depends_on = None
+
+
+# rows copied per transaction while the old table stays writable
+BATCH_SIZE = 50000
+INDEX_EXPRESSION = "USING hnsw (embedding vector_l2_ops) WITH (m = 16, ef_construction = 64)"
+
+# the owner of an asset is the staging bot it was added to. assets only mapped to a live
+# bot resolve to that live bot's staging bot (if any)
+ASSET_OWNER = """
+    SELECT
+        ba.asset_id,
+        MIN(CASE
+            WHEN b.deployment_status = 'STAGING' THEN b.id
+            ELSE COALESCE(s.id, b.id)
+        END) AS owner_bot_id
+    FROM public.bot_assets ba
+    JOIN public.bot b ON b.id = ba.bot_id
+    LEFT JOIN public.bot s ON s.associated_bot_id = b.id AND s.deployment_status = 'STAGING'
+    GROUP BY ba.asset_id
+"""
+
+
+def copy_rows(asset_owner: str, condition: str):
+    return f"""
+        INSERT INTO public.embedding_partitioned
+            (id, embedding, created_at, chunk_text, chunk_metadata, asset_id, owner_bot_id)
+        SELECT e.id, e.embedding, e.created_at, e.chunk_text, e.chunk_metadata, e.asset_id,
+            COALESCE(ao.owner_bot_id, 0)
+        FROM public.embedding e
+        LEFT JOIN {asset_owner} ao ON ao.asset_id = e.asset_id
+        WHERE {condition};
+    """
+
+
+def create_bot_partitions(conn):
+    # a partition for every staging bot that does not have one yet, returns their names
+    bot_ids = conn.execute(sa.text("""
+        SELECT b.id
+        FROM public.bot b
+        WHERE b.deployment_status = 'STAGING'
+        AND to_regclass('public.embedding_bot_' || b.id) IS NULL;
+    """)).scalars().all()
+    for bot_id in bot_ids:
+        op.execute(
+            f"CREATE TABLE public.embedding_bot_{bot_id} PARTITION OF public.embedding_partitioned "
+            f"FOR VALUES IN ({bot_id});")
+
+    return [f"embedding_bot_{bot_id}" for bot_id in bot_ids]
+
+
+def upgrade():
+    # the rows are copied in batches and the partitions indexed concurrently while the old
+    # table keeps taking writes (the asset processor) and reads. only the catch-up of the
+    # rows written in the meantime and the swap run under a lock. the hnsw index of the old
+    # table goes with it, every partition gets its own
+    conn = op.get_bind()
+    with op.get_context().autocommit_block():
+        op.execute("""
+            CREATE TABLE public.embedding_partitioned (
+                id INTEGER NOT NULL DEFAULT nextval('embedding_id_seq'::regclass),
+                embedding vector(512) NOT NULL,
+                created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+                chunk_text TEXT NOT NULL,
+                chunk_metadata JSON,
+                asset_id INTEGER NOT NULL REFERENCES public.asset (id),
+                owner_bot_id INTEGER NOT NULL,
+                CONSTRAINT embedding_partitioned_pkey PRIMARY KEY (id, owner_bot_id)
+            ) PARTITION BY LIST (owner_bot_id);
+        """)
+        # catches rows of bots that do not have a partition (e.g. assets without a staging bot)
+        op.execute(
+            "CREATE TABLE public.embedding_default PARTITION OF public.embedding_partitioned DEFAULT;")
+        create_bot_partitions(conn)
+
+        # the owners are resolved once for the batches (the catch-up resolves them again)
+        op.execute(f"CREATE TEMP TABLE embedding_asset_owner AS {ASSET_OWNER};")
+        op.execute("ALTER TABLE embedding_asset_owner ADD PRIMARY KEY (asset_id);")
+
+        max_id = conn.execute(sa.text(
+            "SELECT COALESCE(MAX(id), 0) FROM public.embedding;")).scalar()
+        for start in range(0, max_id, BATCH_SIZE):
+            op.execute(copy_rows(
+                "embedding_asset_owner", f"e.id > {start} AND e.id <= {start + BATCH_SIZE}"))
+
+        op.execute("DROP TABLE embedding_asset_owner;")
+
+        # CREATE INDEX CONCURRENTLY is not supported on a partitioned table: every partition's
+        # index is built concurrently here and attached to the parent index below
+        partitions = conn.execute(sa.text("""
+            SELECT c.relname
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'public.embedding_partitioned'::regclass;
+        """)).scalars().all()
+        for partition in partitions:
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_embedding_hnsw_idx "
+                f"ON public.{partition} {INDEX_EXPRESSION};")
+
+    # block writes (the asset processor) for the catch-up and the swap, reads keep working
+    # against the old table until the swap
+    op.execute("LOCK TABLE public.embedding IN SHARE MODE;")
+
+    # staging bots created during the copy. their rows (if any) went to the default
+    # partition, which is detached while they are moved
+    op.execute("ALTER TABLE public.embedding_partitioned DETACH PARTITION public.embedding_default;")
+    new_partitions = create_bot_partitions(conn)
+    op.execute("""
+        WITH moved AS (
+            DELETE FROM public.embedding_default d
+            WHERE EXISTS (
+                SELECT 1 FROM public.bot b
+                WHERE b.id = d.owner_bot_id AND b.deployment_status = 'STAGING'
+            )
+            RETURNING *
+        )
+        INSERT INTO public.embedding_partitioned SELECT * FROM moved;
+    """)
+    op.execute(
+        "ALTER TABLE public.embedding_partitioned ATTACH PARTITION public.embedding_default DEFAULT;")
+    for partition in new_partitions:
+        op.execute(
+            f"CREATE INDEX {partition}_embedding_hnsw_idx ON public.{partition} {INDEX_EXPRESSION};")
+
+    # rows written and deleted since the batches were copied
+    op.execute(copy_rows(f"({ASSET_OWNER})", f"e.id > {max_id}"))
+    op.execute(f"""
+        DELETE FROM public.embedding_partitioned p
+        WHERE p.id <= {max_id}
+        AND NOT EXISTS (SELECT 1 FROM public.embedding e WHERE e.id = p.id);
+    """)
+
+    # the parent index is created (invalid) on the parent only and becomes valid once every
+    # partition's index is attached
+    op.execute(
+        f"CREATE INDEX ix_embedding_partitioned_embedding_hnsw ON ONLY public.embedding_partitioned "
+        f"{INDEX_EXPRESSION};")
+    partitions = conn.execute(sa.text("""
+        SELECT c.relname
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'public.embedding_partitioned'::regclass;
+    """)).scalars().all()
+    for partition in partitions:
+        op.execute(
+            f"ALTER INDEX public.ix_embedding_partitioned_embedding_hnsw "
+            f"ATTACH PARTITION public.{partition}_embedding_hnsw_idx;")
+
+    op.execute("ALTER SEQUENCE public.embedding_id_seq OWNED BY NONE;")
+    op.execute("DROP TABLE public.embedding;")
+    op.execute("ALTER TABLE public.embedding_partitioned RENAME TO embedding;")
+    op.execute(
+        "ALTER TABLE public.embedding RENAME CONSTRAINT embedding_partitioned_pkey TO embedding_pkey;")
+    op.execute(
+        "ALTER TABLE public.embedding RENAME CONSTRAINT embedding_partitioned_asset_id_fkey TO embedding_asset_id_fkey;")
+    op.execute(
+        "ALTER INDEX public.ix_embedding_partitioned_embedding_hnsw RENAME TO ix_embedding_embedding_hnsw;")
+    op.execute("ALTER SEQUENCE public.embedding_id_seq OWNED BY public.embedding.id;")
+
+
+def downgrade():
+    op.execute("LOCK TABLE public.embedding IN SHARE MODE;")
+
+    op.execute("""
+        CREATE TABLE public.embedding_flat (
+            id INTEGER NOT NULL DEFAULT nextval('embedding_id_seq'::regclass),
+            embedding vector(512) NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+            chunk_text TEXT NOT NULL,
+            chunk_metadata JSON,
+            asset_id INTEGER NOT NULL REFERENCES public.asset (id),
+            CONSTRAINT embedding_flat_pkey PRIMARY KEY (id)
+        );
+    """)
+    op.execute("""
+        INSERT INTO public.embedding_flat (id, embedding, created_at, chunk_text, chunk_metadata, asset_id)
+        SELECT id, embedding, created_at, chunk_text, chunk_metadata, asset_id
+        FROM public.embedding;
+    """)
+    op.execute("""
+        CREATE INDEX ix_embedding_flat_embedding_hnsw ON public.embedding_flat
+        USING hnsw (embedding vector_l2_ops) WITH (m = 16, ef_construction = 64);
+    """)
+
+    op.execute("ALTER SEQUENCE public.embedding_id_seq OWNED BY NONE;")
+    # drops all the partitions along with the partitioned table
+    op.execute("DROP TABLE public.embedding;")
+    op.execute("ALTER TABLE public.embedding_flat RENAME TO embedding;")
+    op.execute(
+        "ALTER TABLE public.embedding RENAME CONSTRAINT embedding_flat_pkey TO embedding_pkey;")
+    op.execute(
+        "ALTER TABLE public.embedding RENAME CONSTRAINT embedding_flat_asset_id_fkey TO embedding_asset_id_fkey;")
+    op.execute(
+        "ALTER INDEX public.ix_embedding_flat_embedding_hnsw RENAME TO ix_embedding_embedding_hnsw;")
+    op.execute("ALTER SEQUENCE public.embedding_id_seq OWNED BY public.embedding.id;")
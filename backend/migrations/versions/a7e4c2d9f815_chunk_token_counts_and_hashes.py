@@ -0,0 +1,34 @@
+"""token count, content hash and chunk index on embedding
+
+Revision ID: a7e4c2d9f815
+Revises: 6c3a8f1d2b94
+Create Date: 2026-10-18 16:40:52.377019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e4c2d9f815'
+down_revision = '6c3a8f1d2b94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # nullable columns without a default only change the catalog (no table rewrite), they
+    # are added to every partition. existing rows are filled by the asset processor's
+    # backfill job (`poetry run backfill`)
+    op.add_column('embedding', sa.Column(
+        'num_tokens', sa.Integer(), nullable=True))
+    op.add_column('embedding', sa.Column(
+        'content_hash', sa.String(length=64), nullable=True))
+    op.add_column('embedding', sa.Column(
+        'chunk_index', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('embedding', 'chunk_index')
+    op.drop_column('embedding', 'content_hash')
+    op.drop_column('embedding', 'num_tokens')
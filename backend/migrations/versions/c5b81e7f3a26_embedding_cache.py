@@ -0,0 +1,41 @@
+"""embedding cache
+
+Revision ID: c5b81e7f3a26
+Revises: a7e4c2d9f815
+Create Date: 2026-10-18 17:55:13.642870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import pgvector.sqlalchemy
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5b81e7f3a26'
+down_revision = 'a7e4c2d9f815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('embedding_cache',
+                    sa.Column('model', sa.String(length=100), nullable=False),
+                    sa.Column('dims', sa.Integer(), nullable=False),
+                    sa.Column('content_hash', sa.String(
+                        length=64), nullable=False),
+                    sa.Column('embedding', pgvector.sqlalchemy.Vector(),
+                              nullable=False),
+                    sa.Column('created_at', sa.DateTime(),
+                              server_default=sa.text('now()'), nullable=True),
+                    sa.Column('last_used_at', sa.DateTime(),
+                              server_default=sa.text('now()'), nullable=False),
+                    sa.PrimaryKeyConstraint('model', 'dims', 'content_hash')
+                    )
+    op.create_index('ix_embedding_cache_last_used_at',
+                    'embedding_cache', ['last_used_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_embedding_cache_last_used_at',
+                  table_name='embedding_cache')
+    op.drop_table('embedding_cache')
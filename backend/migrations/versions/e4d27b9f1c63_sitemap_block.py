@@ -0,0 +1,48 @@
+"""sitemap block fingerprints
+
+Revision ID: e4d27b9f1c63
+Revises: c5b81e7f3a26
+Create Date: 2026-10-18 19:12:40.318214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4d27b9f1c63'
+down_revision = 'c5b81e7f3a26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sitemap_block',
+                    sa.Column('parent_asset_id', sa.Integer(), nullable=False),
+                    sa.Column('band', sa.SmallInteger(), nullable=False),
+                    sa.Column('band_hash', sa.BigInteger(), nullable=False),
+                    sa.Column('first_asset_id', sa.Integer(), nullable=True),
+                    sa.Column('asset_count', sa.Integer(),
+                              server_default='1', nullable=False),
+                    sa.ForeignKeyConstraint(['parent_asset_id'], [
+                                            'asset.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint(
+                        'parent_asset_id', 'band', 'band_hash')
+                    )
+    op.create_table('sitemap_block_asset',
+                    sa.Column('parent_asset_id', sa.Integer(), nullable=False),
+                    sa.Column('band', sa.SmallInteger(), nullable=False),
+                    sa.Column('band_hash', sa.BigInteger(), nullable=False),
+                    sa.Column('asset_id', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['parent_asset_id'], [
+                                            'asset.id'], ondelete='CASCADE'),
+                    sa.ForeignKeyConstraint(['asset_id'], [
+                                            'asset.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint(
+                        'parent_asset_id', 'band', 'band_hash', 'asset_id')
+                    )
+
+
+def downgrade():
+    op.drop_table('sitemap_block_asset')
+    op.drop_table('sitemap_block')
@@ -18,10 +18,12 @@ class Mq:
         self.thread = threading.Thread(target=self.heartbeat, daemon=True)
         self.thread.start()
 
-    def begin_asset_processing(self, asset_id: int, bot_id: int, mime_type=None):
+    def begin_asset_processing(self, asset_id: int, bot_id: int, mime_type=None, refresh=False):
         payload = {"asset_id": asset_id, "bot_id": bot_id}
         if mime_type:
             payload['mime_type'] = mime_type
+        if refresh:
+            payload['refresh'] = True
         payload = json.dumps(payload)
         message = Message.create(self.channel, payload, properties={
             'delivery_mode': 2
@@ -30,8 +32,11 @@ class Mq:
         logger.info(
             f"Sent message to asset processor for asset {asset_id} and bot {bot_id}")
 
-    def begin_practice_url_processing(self, asset_id: int, bot_id: int):
-        payload = json.dumps({"asset_id": asset_id, "bot_id": bot_id})
+    def begin_practice_url_processing(self, asset_id: int, bot_id: int, refresh=False):
+        payload = {"asset_id": asset_id, "bot_id": bot_id}
+        if refresh:
+            payload['refresh'] = True
+        payload = json.dumps(payload)
         message = Message.create(self.channel, payload, properties={
             'delivery_mode': 2
         })
@@ -1,43 +1,108 @@
-import re
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import threading
+import time
 
-from app import db, create_app
-
-from openai import OpenAI
-import pandas.io.sql as sqlio
+from app import db, get_bare_app
 
 from message.models import Message, MessageRole
-from bot.models import Bot
-from settings import (
-    OPENAI_API_KEY,
-    OPENAI_EMBEDDING_MODEL,
-    OPENAI_MODEL,
-    OPENAI_EMBEDDINGS_DIMS
-)
+from bot.models import Bot, BotStatus
+from settings import OPENAI_MODEL, SEMANTIC_ANSWER_CACHE_ENABLED
 from rag.config import (
-    CHUNK_SIZE_TOKENS,
+    ANSWER_IO_THREADS,
+    CONTEXT_TOKEN_BUDGET,
     MAX_CHUNKS_ALLOWED,
     MAX_CONTEXT_WINDOW,
     MAX_CURR_CTX_PERCENT,
     MAX_PREV_CTX_PERCENT,
     MAX_PREV_MSGS,
+    MMR_CANDIDATES,
     get_system_prompt
 )
 
-from rag.utils import get_token_count
+from rag.answer_cache import get_cached_answer, get_version, replay_answer, store_answer
+from rag.clients import get_openai_client
+from rag.context import format_context, pack_context
+from rag.mmr import select_diverse_chunks
+from rag.query_embedding import embed_question
+from rag.retrieval import retrieve_chunks
+from rag.utils import get_cached_token_count, get_token_count, get_token_counts
 from utils.logger import logger, set_prefix
 
 
+_io_executor = None
+_io_executor_pid = None
+_io_executor_lock = threading.Lock()
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    # same per-worker pattern as the openai client: an executor created before a fork
+    # has no live threads in the child process
+    global _io_executor, _io_executor_pid
+    pid = os.getpid()
+    if _io_executor is None or _io_executor_pid != pid:
+        with _io_executor_lock:
+            if _io_executor is None or _io_executor_pid != pid:
+                _io_executor = ThreadPoolExecutor(
+                    max_workers=ANSWER_IO_THREADS, thread_name_prefix="answer-io")
+                _io_executor_pid = pid
+
+    return _io_executor
+
+
+def log_time_to_first_token(tokens, started_at: float):
+    is_first_token = True
+    for token in tokens:
+        if is_first_token and token:
+            is_first_token = False
+            logger.info(
+                f"time to first token: {(time.perf_counter() - started_at) * 1000:.0f} ms")
+        yield token
+
+
+def build_conversation(system_prompt: str, previous_messages: list, token_budget: int):
+    messages = [
+        {
+            "role": "system",
+            "content": system_prompt
+        }
+    ]
+    prev_msg_tokens = get_cached_token_count(system_prompt)
+
+    # token counts are stored along with every message, only the ones without a
+    # stored count (non-text messages) need to be tokenised here
+    uncounted = [message.content for message in previous_messages
+                 if not message.num_tokens]
+    uncounted_tokens = iter(get_token_counts(uncounted))
+
+    for message in previous_messages:
+        if prev_msg_tokens >= token_budget or len(messages) >= MAX_PREV_MSGS:
+            break
+
+        messages.append({
+            "role": "user" if message.role == MessageRole.HUMAN else "assistant",
+            "content": message.content
+        })
+        prev_msg_tokens += message.num_tokens if message.num_tokens else next(
+            uncounted_tokens)
+
+    return messages
+
+
 # TODO: implement cost calculation
 def answer_question_stream(question: str, session):
     global logger
     logger = set_prefix(logger, f"session={session.guid}")
-    _app = create_app(bare=True)
+    started_at = time.perf_counter()
+
+    # the embedding request only depends on the question, start it right away and load
+    # the bot and the conversation while it is in flight
+    query_embedding_future = get_io_executor().submit(embed_question, question)
 
-    with _app.app_context():
+    with get_bare_app().app_context():
         max_context_window = MAX_CONTEXT_WINDOW[OPENAI_MODEL]
         curr_input_ctx_window = int(max_context_window * MAX_CURR_CTX_PERCENT)
-        num_chunks = min(curr_input_ctx_window //
-                         CHUNK_SIZE_TOKENS, MAX_CHUNKS_ALLOWED)
         prev_input_ctx_window = int(max_context_window * MAX_PREV_CTX_PERCENT)
 
         bot = Bot.query.filter_by(id=session.bot_id).first()
@@ -49,7 +114,9 @@ def answer_question_stream(question: str, session):
             'escalation_message', 'I am sorry, I am not able to help with that.')
         system_prompt = get_system_prompt(escalation_message)
 
-        previous_messages = Message.query.filter_by(session_id=session.id)\
+        previous_messages = Message.query\
+            .with_entities(Message.role, Message.content, Message.num_tokens)\
+            .filter_by(session_id=session.id)\
             .order_by(Message.created_at.desc()).limit(MAX_PREV_MSGS).all()
 
         previous_messages = list(reversed(previous_messages))
@@ -60,67 +127,69 @@ def answer_question_stream(question: str, session):
                 'If relevant, use this to move the conversation forward'
             )
 
-        messages = [
-            {
-                "role": "system",
-                "content": system_prompt
-            }
-        ]
-        prev_msg_tokens = get_token_count(system_prompt)
-
-        for i in range(0, len(previous_messages)):
-            if prev_msg_tokens < prev_input_ctx_window and len(messages) < MAX_PREV_MSGS:
-                messages.append({
-                    "role": "user" if previous_messages[i].role == MessageRole.HUMAN else "assistant",
-                    "content": previous_messages[i].content
-                })
-                prev_msg_tokens += get_token_count(
-                    previous_messages[i].content, OPENAI_MODEL)
-            else:
-                break
+        messages = build_conversation(
+            system_prompt, previous_messages, prev_input_ctx_window)
 
         # query the database to get the matching docs
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
-        query_embedding = openai_client.embeddings.create(
-            input=[question.replace("\n", " ")],
-            model=OPENAI_EMBEDDING_MODEL,
-            dimensions=OPENAI_EMBEDDINGS_DIMS
-        ).data[0].embedding
-
-        query = f'''
-            SELECT e.*
-            FROM embedding e JOIN bot_assets ba ON ba.asset_id = e.asset_id
-            WHERE ba.bot_id = {session.bot_id}
-            AND ba.deleted_at IS NULL
-            ORDER BY
-                e.embedding <-> '[{','.join([str(x) for x in query_embedding])}]'
-            LIMIT {num_chunks};
-            '''
-        relevant_chunks = sqlio.read_sql_query(query, db.session.connection())
-        relevant_chunks = relevant_chunks.reset_index(drop=True)
-
-        if relevant_chunks.empty:
+        query_embedding = query_embedding_future.result()
+
+        # only the opening question of a conversation is answered from the cache, later
+        # answers depend on the conversation so far
+        use_answer_cache = SEMANTIC_ANSWER_CACHE_ENABLED and \
+            len(previous_messages) == 0 and bot.status == BotStatus.SUCCESS
+        if use_answer_cache:
+            answer_cache_version = get_version(bot.id, bot.updated_at)
+            cached_answer = get_cached_answer(
+                bot.id, answer_cache_version, query_embedding)
+            if cached_answer is not None:
+                yield from log_time_to_first_token(
+                    replay_answer(cached_answer), started_at)
+                return
+
+        relevant_chunks = retrieve_chunks(
+            query_embedding,
+            partition_id=bot.embedding_partition_id(),
+            bot_id=session.bot_id,
+            limit=MMR_CANDIDATES,
+            question=question
+        )
+        relevant_chunks = select_diverse_chunks(
+            relevant_chunks, MAX_CHUNKS_ALLOWED)
+
+        if len(relevant_chunks) == 0:
             yield escalation_message
             return
 
+        # nothing else is read from the db, give the connection back to the pool instead of
+        # holding it for the whole generation
+        db.session.close()
+
         logger.info(
             f"included the last {len(messages) - 1} messages from the conversation")
 
-        main_content = f"The user's question is: {question}\nHere is the relevant information you need to analyse to get the answer:\n\n"
-
-        for chunk in relevant_chunks['chunk_text']:
-            main_content += chunk + "\n\n"
-
-        main_content = re.sub(r'\n{2,}', '\n', main_content)
-        main_content = main_content.strip()
-
+        prompt_header = f"The user's question is: {question}\nHere is the relevant information you need to analyse to get the answer:\n"
+        prompt_footer = "\nProvide answer in plain text (no markdown).\n\nAnswer: "
         if len(previous_messages) > 0:
-            main_content += "\nYou can also refer to the previous conversation to get more context."
+            prompt_footer = "\nYou can also refer to the previous conversation to get more context." + \
+                prompt_footer
 
-        main_content += "\nProvide answer in plain text (no markdown).\n\nAnswer: "
+        context_token_budget = min(
+            CONTEXT_TOKEN_BUDGET,
+            curr_input_ctx_window - get_token_count(prompt_header) -
+            get_cached_token_count(prompt_footer)
+        )
+        packed_chunks, context_tokens = pack_context(
+            relevant_chunks, context_token_budget)
+        logger.info(
+            f"packed {len(packed_chunks)} of {len(relevant_chunks)} retrieved chunks "
+            f"({context_tokens} of {context_token_budget} tokens)")
+
+        main_content = "".join(
+            [prompt_header, format_context(packed_chunks), prompt_footer])
 
-        tokens = get_token_count(main_content, OPENAI_MODEL)
-        logger.debug(f"for {OPENAI_MODEL}, user message tokens: {tokens}")
+        if logger.isEnabledFor(logging.DEBUG):
+            tokens = get_token_count(main_content, OPENAI_MODEL)
+            logger.debug(f"for {OPENAI_MODEL}, user message tokens: {tokens}")
 
         ai_response = ""
         messages.append({
@@ -128,14 +197,18 @@ def answer_question_stream(question: str, session):
             "content": main_content
         })
 
-        stream = openai_client.chat.completions.create(
+        stream = get_openai_client().chat.completions.create(
             model=OPENAI_MODEL,
             temperature=0,
             messages=messages,
             stream=True
         )
 
-        for chunk in stream:
-            token = chunk.choices[0].delta.content or ""
+        tokens = (chunk.choices[0].delta.content or "" for chunk in stream)
+        for token in log_time_to_first_token(tokens, started_at):
             ai_response += token
             yield token
+
+        if use_answer_cache and ai_response:
+            store_answer(bot.id, answer_cache_version,
+                         query_embedding, ai_response)
@@ -0,0 +1,115 @@
+import re
+
+import numpy as np
+
+from cache import cache
+from settings import OPENAI_EMBEDDINGS_DIMS
+from rag.config import (
+    SEMANTIC_ANSWER_CACHE_MAX_ENTRIES,
+    SEMANTIC_ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    SEMANTIC_ANSWER_CACHE_TTL_SECONDS
+)
+from utils.capture_exception import capture_exception
+from utils.logger import logger
+
+
+EMBEDDING_DTYPE = np.dtype("<f4")
+EMBEDDING_NUM_BYTES = OPENAI_EMBEDDINGS_DIMS * EMBEDDING_DTYPE.itemsize
+
+
+def version_key(bot_id: int):
+    return f"answer_cache:version:{bot_id}"
+
+
+def entries_key(bot_id: int, version: str):
+    return f"answer_cache:{bot_id}:{version}"
+
+
+def get_version(bot_id: int, updated_at=None):
+    # read before retrieval and passed to store_answer, an answer built from assets that
+    # changed while it was generated is stored under the old (orphaned) version.
+    # the processors can not bump the version in redis, they touch the bot's `updated_at`
+    # when a re-crawl changed its assets (see the asset processor), which is part of it.
+    # None when redis is not reachable, the cache is skipped then
+    try:
+        version = cache.get(version_key(bot_id))
+    except Exception as e:
+        capture_exception(e, metadata={"bot_id": bot_id})
+        logger.warning(f"failed to read the answer cache version: {e}")
+        return None
+
+    version = int(version) if version is not None else 0
+    if updated_at is None:
+        return str(version)
+
+    return f"{version}:{updated_at.timestamp():.0f}"
+
+
+def invalidate_bot_answers(*bot_ids: int):
+    # answers are stored under the bot's current version, bumping it orphans all of
+    # them (they expire with their ttl)
+    try:
+        for bot_id in bot_ids:
+            if bot_id is not None:
+                cache.redis.incr(version_key(bot_id))
+    except Exception as e:
+        capture_exception(e, metadata={"bot_ids": bot_ids})
+        logger.warning(f"failed to invalidate cached answers: {e}")
+
+
+def get_cached_answer(bot_id: int, version: str, query_embedding):
+    if version is None:
+        return None
+
+    try:
+        entries = cache.redis.lrange(entries_key(bot_id, version), 0, -1)
+    except Exception as e:
+        capture_exception(e, metadata={"bot_id": bot_id})
+        logger.warning(f"failed to read cached answers: {e}")
+        return None
+
+    if len(entries) == 0:
+        return None
+
+    # each entry is the question embedding (float32 bytes) followed by the answer (utf-8)
+    cached_embeddings = np.frombuffer(
+        b"".join(entry[:EMBEDDING_NUM_BYTES] for entry in entries), dtype=EMBEDDING_DTYPE
+    ).reshape(len(entries), OPENAI_EMBEDDINGS_DIMS)
+
+    query_embedding = np.asarray(query_embedding, dtype=EMBEDDING_DTYPE)
+    similarities = cached_embeddings @ query_embedding
+    similarities /= np.linalg.norm(cached_embeddings, axis=1) * \
+        np.linalg.norm(query_embedding)
+
+    best = int(np.argmax(similarities))
+    if similarities[best] < SEMANTIC_ANSWER_CACHE_SIMILARITY_THRESHOLD:
+        return None
+
+    logger.info(
+        f"semantic answer cache hit for bot {bot_id} (similarity {similarities[best]:.3f})")
+    return entries[best][EMBEDDING_NUM_BYTES:].decode("utf-8")
+
+
+def store_answer(bot_id: int, version: str, query_embedding, answer: str):
+    if version is None:
+        return
+
+    entry = np.asarray(query_embedding, dtype=EMBEDDING_DTYPE).tobytes() + \
+        answer.encode("utf-8")
+    key = entries_key(bot_id, version)
+
+    try:
+        pipeline = cache.redis.pipeline()
+        pipeline.lpush(key, entry)
+        pipeline.ltrim(key, 0, SEMANTIC_ANSWER_CACHE_MAX_ENTRIES - 1)
+        pipeline.expire(key, SEMANTIC_ANSWER_CACHE_TTL_SECONDS)
+        pipeline.execute()
+    except Exception as e:
+        capture_exception(e, metadata={"bot_id": bot_id})
+        logger.warning(f"failed to cache answer: {e}")
+
+
+def replay_answer(answer: str):
+    # stream the cached answer word by word, like tokens from the model
+    for token in re.findall(r"\s*\S+", answer):
+        yield token
@@ -0,0 +1,47 @@
+import os
+import threading
+
+import httpx
+from openai import OpenAI, DefaultHttpxClient
+
+from settings import OPENAI_API_KEY
+from rag.config import (
+    OPENAI_CONNECT_TIMEOUT_SECONDS,
+    OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_TIMEOUT_SECONDS
+)
+
+
+_openai_client = None
+_openai_client_pid = None
+_openai_client_lock = threading.Lock()
+
+
+def create_openai_client():
+    return OpenAI(
+        api_key=OPENAI_API_KEY,
+        timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS,
+                              connect=OPENAI_CONNECT_TIMEOUT_SECONDS),
+        http_client=DefaultHttpxClient(limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_SECONDS
+        ))
+    )
+
+
+def get_openai_client() -> OpenAI:
+    # one client per worker process, so that embedding and completion calls reuse warm
+    # (already TLS-negotiated) connections. the pid check makes sure a client created
+    # before a fork is never shared with the child process
+    global _openai_client, _openai_client_pid
+    pid = os.getpid()
+    if _openai_client is None or _openai_client_pid != pid:
+        with _openai_client_lock:
+            if _openai_client is None or _openai_client_pid != pid:
+                _openai_client = create_openai_client()
+                _openai_client_pid = pid
+
+    return _openai_client
@@ -1,3 +1,5 @@
+from settings import WORKER_CONNECTIONS
+
 # has to be the same as asset_processor/.env
 CHUNK_SIZE_TOKENS = 512
 CHUNK_OVERLAP_TOKENS = 64
@@ -30,5 +32,59 @@ MAX_CURR_CTX_PERCENT = 0.5
 MAX_PREV_CTX_PERCENT = 0.3
 # how many previous messages in the conversation to include (including system prompt)
 MAX_PREV_MSGS = 10
-# how many maximum chunks to forward to the model
+# how many chunks (after the mmr re-selection) are candidates for the context packer
 MAX_CHUNKS_ALLOWED = 10
+# tokens of retrieved chunks packed into the prompt (capped by the MAX_CURR_CTX_PERCENT of the
+# context window). candidates are packed in rank order until nothing else fits
+CONTEXT_TOKEN_BUDGET = 3072
+# a candidate is dropped when this fraction of its word shingles is already contained in a
+# packed chunk (the same text on several pages: headers/footers, repeated call to actions)
+NEAR_DUPLICATE_CONTAINMENT = 0.8
+NEAR_DUPLICATE_SHINGLE_SIZE = 5
+# neighbouring chunks of an asset share the splitter's overlap (64 of 512 tokens by default),
+# it is trimmed off a candidate whose neighbour is packed already. shorter common text at
+# the chunk boundary is not considered an overlap
+CHUNK_OVERLAP_MIN_CHARS = 20
+# size of the candidate list the hnsw index keeps while searching (pgvector `hnsw.ef_search`).
+# higher values improve recall at the cost of latency. the index search happens before the
+# bot_assets filter is applied, so this must stay well above the number of chunks requested.
+# use `benchmarks/ann_recall.py` to pick a value
+HNSW_EF_SEARCH = 100
+# keep-alive connection pool to the openai api, shared by all the requests of a worker.
+# every streaming answer holds a connection for the whole generation, so this has to match
+# gunicorn's --worker-connections
+OPENAI_MAX_CONNECTIONS = WORKER_CONNECTIONS
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 10
+OPENAI_KEEPALIVE_EXPIRY_SECONDS = 120
+OPENAI_CONNECT_TIMEOUT_SECONDS = 5
+OPENAI_TIMEOUT_SECONDS = 60
+# query embeddings are cached per worker (lru) and in redis, keyed by the normalised question
+QUERY_EMBEDDING_LOCAL_CACHE_SIZE = 2048
+QUERY_EMBEDDING_LOCAL_CACHE_TTL_SECONDS = 60 * 60
+QUERY_EMBEDDING_REDIS_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+# how often (in lookups) the cache hit rates are logged
+QUERY_EMBEDDING_CACHE_STATS_INTERVAL = 500
+# semantic answer cache (see SEMANTIC_ANSWER_CACHE_ENABLED): minimum cosine similarity between
+# a new question and a cached one to reuse the cached answer
+SEMANTIC_ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+# most recent answers kept per bot (and bot version)
+SEMANTIC_ANSWER_CACHE_MAX_ENTRIES = 100
+SEMANTIC_ANSWER_CACHE_TTL_SECONDS = 24 * 60 * 60
+# threads (greenlets on gevent workers) per worker used to overlap the query embedding request
+# with the db lookups. every concurrent question needs one, or its embedding request waits
+# for the ones ahead of it
+ANSWER_IO_THREADS = WORKER_CONNECTIONS
+# hybrid retrieval: full text search over the chunks (ix_embedding_chunk_text_fts) fused with
+# the vector search using reciprocal rank fusion. exact terms (provider names, insurance plans,
+# phone numbers) are often missed by the vector search alone
+HYBRID_RETRIEVAL_ENABLED = True
+# candidates taken from each search before fusing
+HYBRID_CANDIDATES = 30
+# rrf constant, a chunk scores sum(1 / (RRF_K + rank)) over the searches it was found by
+RRF_K = 60
+# maximal marginal relevance: MMR_CANDIDATES chunks are retrieved (with their vectors) and
+# MAX_CHUNKS_ALLOWED of them are re-selected trading off relevance (retrieval rank) against
+# similarity to the already selected ones. 1 keeps the retrieval order, lower values favour
+# diversity (e.g. the same header/footer chunk from many pages of a practice url)
+MMR_CANDIDATES = 40
+MMR_LAMBDA = 0.7
@@ -0,0 +1,108 @@
+import re
+
+from rag.config import (
+    CHUNK_OVERLAP_MIN_CHARS,
+    NEAR_DUPLICATE_CONTAINMENT,
+    NEAR_DUPLICATE_SHINGLE_SIZE
+)
+from rag.utils import get_token_count, get_token_counts
+
+
+# packed chunks are joined with this separator, counted once per chunk
+CHUNK_SEPARATOR = "\n"
+CHUNK_SEPARATOR_TOKENS = 1
+
+
+def get_shingles(text: str, size: int = NEAR_DUPLICATE_SHINGLE_SIZE):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def is_near_duplicate(shingles: set, packed_shingles: list):
+    if len(shingles) == 0:
+        return True
+
+    for other in packed_shingles:
+        if len(shingles & other) >= NEAR_DUPLICATE_CONTAINMENT * len(shingles):
+            return True
+
+    return False
+
+
+def get_overlap(earlier: str, later: str, min_chars: int = CHUNK_OVERLAP_MIN_CHARS):
+    # length of the longest end of `earlier` that `later` starts with (the splitter's overlap
+    # between neighbouring chunks), 0 when it is shorter than `min_chars`
+    if len(later) < min_chars:
+        return 0
+
+    head = later[:min_chars]
+    i = earlier.find(head)
+    while i != -1:
+        if later.startswith(earlier[i:]):
+            return len(earlier) - i
+        i = earlier.find(head, i + 1)
+
+    return 0
+
+
+def trim_overlaps(chunk, packed_neighbours: dict):
+    # drops the text the chunk shares with its packed neighbours (same asset, chunk_index
+    # -1/+1), it is in the prompt already
+    if chunk.chunk_index is None:
+        return chunk.chunk_text
+
+    text = chunk.chunk_text
+    previous = packed_neighbours.get((chunk.asset_id, chunk.chunk_index - 1))
+    if previous is not None:
+        text = text[get_overlap(previous.chunk_text, text):]
+
+    following = packed_neighbours.get((chunk.asset_id, chunk.chunk_index + 1))
+    if following is not None:
+        text = text[:len(text) - get_overlap(text, following.chunk_text)]
+
+    return text
+
+
+def pack_context(chunks: list, token_budget: int):
+    # greedily packs the retrieved chunks (in rank order) into `token_budget` tokens, skipping
+    # near-duplicates of already packed chunks and chunks that no longer fit. the overlap
+    # with a packed neighbouring chunk is trimmed off. uses the token counts stored at
+    # ingestion, only chunks without one (or trimmed ones) are tokenised here
+    uncounted = [chunk.chunk_text for chunk in chunks if not chunk.num_tokens]
+    uncounted_tokens = iter(get_token_counts(uncounted))
+
+    packed = []
+    packed_shingles = []
+    # {(asset_id, chunk_index): packed chunk}, trimmed text included
+    packed_neighbours = {}
+    used_tokens = 0
+    for chunk in chunks:
+        num_tokens = chunk.num_tokens if chunk.num_tokens else next(uncounted_tokens)
+        text = trim_overlaps(chunk, packed_neighbours)
+        if text != chunk.chunk_text:
+            num_tokens = get_token_count(text) if text.strip() else 0
+            chunk = chunk._replace(chunk_text=text, num_tokens=num_tokens)
+
+        num_tokens += CHUNK_SEPARATOR_TOKENS
+        if used_tokens + num_tokens > token_budget:
+            continue
+
+        shingles = get_shingles(chunk.chunk_text)
+        if is_near_duplicate(shingles, packed_shingles):
+            continue
+
+        packed.append(chunk)
+        packed_shingles.append(shingles)
+        if chunk.chunk_index is not None:
+            packed_neighbours[(chunk.asset_id, chunk.chunk_index)] = chunk
+        used_tokens += num_tokens
+
+    return packed, used_tokens
+
+
+def format_context(chunks: list):
+    return CHUNK_SEPARATOR.join(
+        re.sub(r"\n{2,}", "\n", chunk.chunk_text).strip() for chunk in chunks)
@@ -0,0 +1,31 @@
+import numpy as np
+
+from rag.config import MMR_LAMBDA
+
+
+def select_diverse_chunks(chunks: list, k: int, mmr_lambda: float = MMR_LAMBDA):
+    # maximal marginal relevance over the retrieved candidates (in rank order). relevance
+    # comes from the rank (so that hybrid retrieval's fusion is kept), redundancy is the
+    # cosine similarity to the closest already selected chunk
+    if len(chunks) <= 1 or mmr_lambda >= 1:
+        return chunks[:k]
+
+    embeddings = np.asarray([chunk.embedding for chunk in chunks], dtype=np.float32)
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    similarities = embeddings @ embeddings.T
+
+    relevance = 1.0 - np.arange(len(chunks), dtype=np.float32) / len(chunks)
+    max_similarity = np.zeros(len(chunks), dtype=np.float32)
+    is_available = np.ones(len(chunks), dtype=bool)
+
+    selected = []
+    for _ in range(min(k, len(chunks))):
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity
+        scores[~is_available] = -np.inf
+        best = int(np.argmax(scores))
+
+        selected.append(best)
+        is_available[best] = False
+        np.maximum(max_similarity, similarities[best], out=max_similarity)
+
+    return [chunks[i] for i in selected]
@@ -0,0 +1,139 @@
+from collections import OrderedDict
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+from cache import cache
+from settings import OPENAI_EMBEDDING_MODEL, OPENAI_EMBEDDINGS_DIMS
+from rag.clients import get_openai_client
+from rag.config import (
+    QUERY_EMBEDDING_CACHE_STATS_INTERVAL,
+    QUERY_EMBEDDING_LOCAL_CACHE_SIZE,
+    QUERY_EMBEDDING_LOCAL_CACHE_TTL_SECONDS,
+    QUERY_EMBEDDING_REDIS_CACHE_TTL_SECONDS
+)
+from utils.capture_exception import capture_exception
+from utils.logger import logger
+
+
+# embeddings are stored as raw little-endian float32 bytes (2 KB for 512 dims)
+EMBEDDING_DTYPE = np.dtype("<f4")
+
+
+def normalise_question(question: str):
+    question = unicodedata.normalize("NFKC", question).lower()
+    question = re.sub(r"\s+", " ", question)
+    return question.strip().rstrip("?!. ")
+
+
+def get_cache_key(normalised_question: str):
+    digest = hashlib.sha256(normalised_question.encode("utf-8")).hexdigest()
+    return f"query_embedding:{OPENAI_EMBEDDING_MODEL}:{OPENAI_EMBEDDINGS_DIMS}:{digest}"
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_size: int, local_ttl: int, redis_ttl: int):
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        # key -> (expires_at, embedding)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+        self.counters_lock = threading.Lock()
+
+    def get(self, key: str):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.count("local_hits")
+                return entry[1]
+
+            if entry is not None:
+                del self.entries[key]
+
+        embedding = None
+        try:
+            value = cache.get_bytes(key)
+            if value is not None:
+                embedding = np.frombuffer(value, dtype=EMBEDDING_DTYPE)
+        except Exception as e:
+            # the cache is an optimisation, a redis failure must not fail the question
+            capture_exception(e, metadata={"key": key})
+            logger.warning(f"failed to read query embedding from redis: {e}")
+
+        if embedding is None:
+            self.count("misses")
+            return None
+
+        self.count("redis_hits")
+        self.set_local(key, embedding)
+        return embedding
+
+    def set(self, key: str, embedding):
+        embedding = np.asarray(embedding, dtype=EMBEDDING_DTYPE)
+        self.set_local(key, embedding)
+        try:
+            cache.set(key, embedding.tobytes(), ttl=self.redis_ttl)
+        except Exception as e:
+            capture_exception(e, metadata={"key": key})
+            logger.warning(f"failed to write query embedding to redis: {e}")
+
+        return embedding
+
+    def set_local(self, key: str, embedding):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.local_ttl, embedding)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def count(self, counter: str):
+        with self.counters_lock:
+            self.counters[counter] += 1
+            lookups = sum(self.counters.values())
+
+        if lookups % QUERY_EMBEDDING_CACHE_STATS_INTERVAL == 0:
+            logger.info(f"query embedding cache stats: {self.stats()}")
+
+    def stats(self):
+        lookups = sum(self.counters.values())
+        hits = self.counters["local_hits"] + self.counters["redis_hits"]
+        return {
+            **self.counters,
+            "lookups": lookups,
+            "hit_rate": hits / lookups if lookups > 0 else 0.0,
+            "local_size": len(self.entries)
+        }
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    max_size=QUERY_EMBEDDING_LOCAL_CACHE_SIZE,
+    local_ttl=QUERY_EMBEDDING_LOCAL_CACHE_TTL_SECONDS,
+    redis_ttl=QUERY_EMBEDDING_REDIS_CACHE_TTL_SECONDS
+)
+
+
+def embed_question(question: str):
+    # the normalised question is what gets embedded, so that every variant mapping to the
+    # same cache key gets the same embedding
+    normalised_question = normalise_question(question)
+    key = get_cache_key(normalised_question)
+
+    embedding = query_embedding_cache.get(key)
+    if embedding is not None:
+        return embedding
+
+    embedding = get_openai_client().embeddings.create(
+        input=[normalised_question],
+        model=OPENAI_EMBEDDING_MODEL,
+        dimensions=OPENAI_EMBEDDINGS_DIMS
+    ).data[0].embedding
+
+    return query_embedding_cache.set(key, embedding)
@@ -0,0 +1,142 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+from pgvector.psycopg2 import register_vector
+
+from app import db
+from rag.config import HNSW_EF_SEARCH, HYBRID_CANDIDATES, HYBRID_RETRIEVAL_ENABLED, RRF_K
+
+
+RETRIEVE_CHUNKS_STATEMENT = "retrieve_chunks"
+RETRIEVE_CHUNKS_LEXICAL_STATEMENT = "retrieve_chunks_lexical"
+
+
+class RetrievedChunk(NamedTuple):
+    id: int
+    chunk_text: str
+    asset_id: int
+    # L2 distance from the query embedding, None for chunks only found by the text search
+    distance: Optional[float]
+    # stored at ingestion (None for chunks ingested before they were stored and not backfilled)
+    num_tokens: Optional[int]
+    content_hash: Optional[str]
+    chunk_index: Optional[int]
+    embedding: np.ndarray
+
+
+# $1: query embedding, $2: embedding partition (owner bot), $3: bot, $4: number of chunks
+RETRIEVE_CHUNKS_QUERY = f'''
+    PREPARE {RETRIEVE_CHUNKS_STATEMENT} (vector, integer, integer, integer) AS
+    SELECT e.id, e.chunk_text, e.asset_id, e.embedding <-> $1 AS distance,
+        e.num_tokens, e.content_hash, e.chunk_index, e.embedding
+    FROM embedding e JOIN bot_assets ba ON ba.asset_id = e.asset_id
+    WHERE e.owner_bot_id = $2
+    AND ba.bot_id = $3
+    AND ba.deleted_at IS NULL
+    ORDER BY e.embedding <-> $1
+    LIMIT $4;
+'''
+
+# $1: question, $2: embedding partition (owner bot), $3: bot, $4: number of chunks.
+# the question's terms are OR-ed (plainto_tsquery AND-s them, which a full question rarely
+# matches) and the matches are ranked by term density. the expression has to stay the
+# same as the one of ix_embedding_chunk_text_fts
+RETRIEVE_CHUNKS_LEXICAL_QUERY = f'''
+    PREPARE {RETRIEVE_CHUNKS_LEXICAL_STATEMENT} (text, integer, integer, integer) AS
+    WITH q AS (
+        SELECT replace(plainto_tsquery('english', $1)::text, ' & ', ' | ')::tsquery AS query
+    )
+    SELECT e.id, e.chunk_text, e.asset_id, NULL::double precision AS distance,
+        e.num_tokens, e.content_hash, e.chunk_index, e.embedding
+    FROM q, embedding e JOIN bot_assets ba ON ba.asset_id = e.asset_id
+    WHERE e.owner_bot_id = $2
+    AND ba.bot_id = $3
+    AND ba.deleted_at IS NULL
+    AND to_tsvector('english', e.chunk_text) @@ q.query
+    ORDER BY ts_rank_cd(to_tsvector('english', e.chunk_text), q.query) DESC
+    LIMIT $4;
+'''
+
+
+def prepare_connection(connection):
+    # `connection.info` lives as long as the underlying dbapi connection, so the vector
+    # type is registered and the statements are parsed/planned once per pooled connection.
+    # prepared statements are session level and survive transaction rollbacks
+    if connection.info.get(RETRIEVE_CHUNKS_STATEMENT):
+        return
+
+    register_vector(connection.dbapi_connection)
+    cur = connection.cursor()
+    try:
+        cur.execute(RETRIEVE_CHUNKS_QUERY)
+        cur.execute(RETRIEVE_CHUNKS_LEXICAL_QUERY)
+    finally:
+        cur.close()
+
+    connection.info[RETRIEVE_CHUNKS_STATEMENT] = True
+
+
+def reciprocal_rank_fusion(*rankings, k: int = RRF_K):
+    scores = {}
+    chunks = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, start=1):
+            scores[chunk.id] = scores.get(chunk.id, 0.0) + 1.0 / (k + rank)
+            # the first ranking's row wins, pass the vector search first to keep distances
+            chunks.setdefault(chunk.id, chunk)
+
+    return sorted(chunks.values(), key=lambda chunk: scores[chunk.id], reverse=True)
+
+
+def drop_duplicate_chunks(chunks: list):
+    # the same text attached to a bot through several assets (e.g. a page that is also
+    # uploaded as a pdf) is only kept once, at its best rank
+    seen = set()
+    unique_chunks = []
+    for chunk in chunks:
+        key = chunk.content_hash if chunk.content_hash else chunk.chunk_text
+        if key in seen:
+            continue
+
+        seen.add(key)
+        unique_chunks.append(chunk)
+
+    return unique_chunks
+
+
+def retrieve_chunks(query_embedding, partition_id: int, bot_id: int, limit: int,
+                    question: str = None):
+    # with the question given (and hybrid retrieval enabled), the vector and the text search
+    # results are fused. without it this is a plain vector search
+    is_hybrid = HYBRID_RETRIEVAL_ENABLED and question is not None
+    num_candidates = max(int(limit), HYBRID_CANDIDATES) if is_hybrid else int(limit)
+
+    connection = db.session.connection().connection
+    prepare_connection(connection)
+
+    cur = connection.cursor()
+    try:
+        # scoped to the current transaction, so pooled connections are not affected
+        cur.execute(
+            f"SET LOCAL hnsw.ef_search = {max(HNSW_EF_SEARCH, num_candidates)};")
+        cur.execute(f"EXECUTE {RETRIEVE_CHUNKS_STATEMENT} (%s, %s, %s, %s);", (
+            np.asarray(query_embedding, dtype=np.float32),
+            partition_id,
+            bot_id,
+            num_candidates
+        ))
+        vector_chunks = [RetrievedChunk._make(row) for row in cur.fetchall()]
+        if not is_hybrid:
+            return drop_duplicate_chunks(vector_chunks)
+
+        cur.execute(f"EXECUTE {RETRIEVE_CHUNKS_LEXICAL_STATEMENT} (%s, %s, %s, %s);", (
+            question,
+            partition_id,
+            bot_id,
+            num_candidates
+        ))
+        lexical_chunks = [RetrievedChunk._make(row) for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+    return drop_duplicate_chunks(reciprocal_rank_fusion(vector_chunks, lexical_chunks))[:limit]
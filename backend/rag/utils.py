@@ -1,8 +1,29 @@
+from functools import lru_cache
+
 import tiktoken
 
 from settings import OPENAI_MODEL
 
 
+@lru_cache(maxsize=None)
+def get_encoder(model: str = OPENAI_MODEL):
+    # looking up an encoding is expensive, the encoder itself is thread safe and can be
+    # shared by the whole process
+    return tiktoken.encoding_for_model(model)
+
+
 def get_token_count(text: str, model: str = OPENAI_MODEL):
-    enc = tiktoken.encoding_for_model(model)
-    return len(enc.encode(text))
+    return len(get_encoder(model).encode(text))
+
+
+def get_token_counts(texts: list, model: str = OPENAI_MODEL):
+    if len(texts) == 0:
+        return []
+
+    return [len(tokens) for tokens in get_encoder(model).encode_batch(texts)]
+
+
+@lru_cache(maxsize=256)
+def get_cached_token_count(text: str, model: str = OPENAI_MODEL):
+    # for the small set of texts that repeat on every question (e.g. system prompts)
+    return get_token_count(text, model)
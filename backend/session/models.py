@@ -111,7 +111,9 @@ class Session(db.Model):
 
             user_message = Message(
                 "text", question, MessageRole.HUMAN, self, created_at=datetime.now())
-            db.session.add(user_message)
+            # both messages are written once the answer is complete. release the connection
+            # checked out by the session lookup so that it is not held for the whole stream
+            db.session.close()
             ai_response = ""
             error = None
             try:
@@ -131,7 +133,7 @@ class Session(db.Model):
             finally:
                 bot_message = Message("text", ai_response,
                                       MessageRole.BOT, self, error, created_at=datetime.now())
-                db.session.add(bot_message)
+                db.session.add_all([self, user_message, bot_message])
                 self.last_active_at = db.func.now()
                 db.session.commit()
                 cache.delete(cache_key)
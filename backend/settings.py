@@ -6,6 +6,9 @@ FLASK_ENV = os.environ["FLASK_ENV"]
 API_KEY = os.environ["API_KEY"]
 MAX_BYTES_TO_READ_FOR_MIME_TYPE = 2048
 MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500 MB
+# concurrent requests (greenlets) per gunicorn worker, has to match --worker-connections
+# in the Dockerfile
+WORKER_CONNECTIONS = 200
 
 # db
 DB_USERNAME = os.environ["DB_USERNAME"]
@@ -17,6 +20,19 @@ SQLALCHEMY_TRACK_MODIFICATIONS = False
 SQLALCHEMY_DATABASE_URI = (
     f"postgresql://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DATABASE_NAME}"
 )
+# a worker serves WORKER_CONNECTIONS requests at once through two engines (the request app
+# and the bare app of the streaming answers, see app.py). a stream only holds a connection
+# for its session, bot, history and retrieval lookups, so the pools are a fraction of that.
+# postgres budget per pod: workers (2) x engines (2) x (DB_POOL_SIZE + DB_MAX_OVERFLOW),
+# 200 with the defaults. max_connections has to cover every pod plus the processors
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "30"))
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    # fail a request quickly instead of holding its greenlet when the pool is exhausted
+    "pool_timeout": 10,
+}
 
 # aws
 AWS_ACCESS_KEY_ID = os.environ["AWS_ACCESS_KEY_ID"]
@@ -42,6 +58,10 @@ OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
 OPENAI_EMBEDDING_MODEL = os.environ["OPENAI_EMBEDDING_MODEL"]
 OPENAI_EMBEDDINGS_DIMS = int(os.environ["OPENAI_EMBEDDINGS_DIMS"])
 
+# opt-in cache of answers to (semantically) repeated first questions per bot
+SEMANTIC_ANSWER_CACHE_ENABLED = os.environ.get(
+    "SEMANTIC_ANSWER_CACHE_ENABLED", "0") == "1"
+
 # static asset
 CHATBOT_JS_ASSET_URL = os.environ["CHATBOT_JS_ASSET_URL"]
 CHATBOT_CSS_ASSET_URL = os.environ["CHATBOT_CSS_ASSET_URL"]
@@ -0,0 +1,83 @@
+import numpy as np
+
+from rag.context import CHUNK_SEPARATOR_TOKENS, pack_context
+from rag.mmr import select_diverse_chunks
+from rag.retrieval import RetrievedChunk, reciprocal_rank_fusion
+
+
+def make_chunk(id, chunk_text=None, asset_id=1, distance=None, num_tokens=10,
+               chunk_index=None, embedding=(1.0, 0.0)):
+    if chunk_text is None:
+        chunk_text = f"chunk number {id} talks about its own topic {id} in a few words"
+    return RetrievedChunk(id=id, chunk_text=chunk_text, asset_id=asset_id, distance=distance,
+                          num_tokens=num_tokens, content_hash=None, chunk_index=chunk_index,
+                          embedding=np.asarray(embedding, dtype=np.float32))
+
+
+def ids(chunks):
+    return [chunk.id for chunk in chunks]
+
+
+def test_rank_fusion_prefers_chunks_found_by_both_searches():
+    vector = [make_chunk(1), make_chunk(2), make_chunk(3)]
+    lexical = [make_chunk(3), make_chunk(4)]
+
+    assert ids(reciprocal_rank_fusion(vector, lexical)) == [3, 1, 2, 4]
+
+
+def test_rank_fusion_ties_keep_the_first_ranking_order():
+    vector = [make_chunk(1, distance=0.1), make_chunk(2, distance=0.2)]
+    lexical = [make_chunk(2), make_chunk(1)]
+
+    fused = reciprocal_rank_fusion(vector, lexical)
+
+    assert ids(fused) == [1, 2]
+    # the rows of the vector search are kept, with their distances
+    assert [chunk.distance for chunk in fused] == [0.1, 0.2]
+
+
+def test_mmr_lambda_one_keeps_the_rank_order():
+    chunks = [make_chunk(1, embedding=(1, 0)), make_chunk(2, embedding=(1, 0.01)),
+              make_chunk(3, embedding=(0, 1))]
+
+    assert ids(select_diverse_chunks(chunks, 2, mmr_lambda=1)) == [1, 2]
+
+
+def test_mmr_lambda_zero_picks_the_least_similar_chunk():
+    chunks = [make_chunk(1, embedding=(1, 0)), make_chunk(2, embedding=(1, 0.01)),
+              make_chunk(3, embedding=(0, 1))]
+
+    assert ids(select_diverse_chunks(chunks, 3, mmr_lambda=0)) == [1, 3, 2]
+
+
+def test_pack_context_skips_chunks_over_the_budget():
+    chunks = [make_chunk(1, num_tokens=10), make_chunk(2, num_tokens=10),
+              make_chunk(3, num_tokens=50), make_chunk(4, num_tokens=5)]
+
+    packed, used_tokens = pack_context(chunks, 30)
+
+    assert ids(packed) == [1, 2, 4]
+    assert used_tokens == 25 + 3 * CHUNK_SEPARATOR_TOKENS
+
+
+def test_pack_context_drops_near_duplicates():
+    text = "our clinic is open from monday to friday between nine and five"
+    chunks = [make_chunk(1, text, asset_id=1), make_chunk(2, text + " daily", asset_id=2),
+              make_chunk(3)]
+
+    packed, _ = pack_context(chunks, 1000)
+
+    assert ids(packed) == [1, 3]
+
+
+def test_pack_context_trims_the_overlap_of_neighbouring_chunks():
+    words = [f"word{i}" for i in range(60)]
+    first = " ".join(words[:40])
+    second = " ".join(words[30:])
+    chunks = [make_chunk(1, first, chunk_index=0, num_tokens=40),
+              make_chunk(2, second, chunk_index=1, num_tokens=30)]
+
+    packed, _ = pack_context(chunks, 1000)
+
+    assert ids(packed) == [1, 2]
+    assert packed[1].chunk_text.split() == words[40:]
@@ -21,6 +21,28 @@ DATABASE_NAME = os.environ.get('DATABASE_NAME')
 
 # smartproxy
 SMARTPROXY_AUTH = os.environ.get('SMARTPROXY_AUTH')
+SMARTPROXY_URL = os.environ.get(
+    'SMARTPROXY_URL', 'https://scraper-api.smartproxy.com/v2/scrape')
+# at most this many scrape calls in flight and started per second (0 = no rate limit)
+SCRAPE_MAX_CONCURRENCY = int(os.environ.get('SCRAPE_MAX_CONCURRENCY', 8))
+SCRAPE_RATE_LIMIT_PER_SECOND = float(
+    os.environ.get('SCRAPE_RATE_LIMIT_PER_SECOND', 10))
+# headless rendering is slow, the read timeout has to cover it
+SCRAPE_CONNECT_TIMEOUT_SECONDS = float(
+    os.environ.get('SCRAPE_CONNECT_TIMEOUT_SECONDS', 5))
+SCRAPE_READ_TIMEOUT_SECONDS = float(
+    os.environ.get('SCRAPE_READ_TIMEOUT_SECONDS', 90))
+SCRAPE_MAX_RETRIES = int(os.environ.get('SCRAPE_MAX_RETRIES', 3))
+
+# sitemap discovery: timeout of each probe (robots.txt, common sitemap paths), they run
+# concurrently. discovered sitemap locations are cached per host for the ttl
+SITEMAP_PROBE_TIMEOUT_SECONDS = float(
+    os.environ.get('SITEMAP_PROBE_TIMEOUT_SECONDS', 3))
+SITEMAP_CACHE_TTL_SECONDS = int(
+    os.environ.get('SITEMAP_CACHE_TTL_SECONDS', 24 * 60 * 60))
+# timeout of each request fetching the sitemap (and its sub-sitemaps)
+SITEMAP_FETCH_TIMEOUT_SECONDS = int(
+    os.environ.get('SITEMAP_FETCH_TIMEOUT_SECONDS', 60))
 
 ENV = os.environ.get('ENV', 'development')
 MAX_URLS_ALLOWED = int(os.environ.get('MAX_URLS_ALLOWED', 500))
@@ -68,4 +90,5 @@ ENV = ENV.strip()
 INPUT_QUEUE_NAME = INPUT_QUEUE_NAME.strip()
 RABBITMQ_URL = RABBITMQ_URL.strip()
 SMARTPROXY_AUTH = SMARTPROXY_AUTH.strip()
+SMARTPROXY_URL = SMARTPROXY_URL.strip()
 SENTRY_DSN = SENTRY_DSN.strip()
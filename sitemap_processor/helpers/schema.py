@@ -4,3 +4,4 @@ from marshmallow import Schema, fields, validate
 class InputMessageSchema(Schema):
     asset_id = fields.Int(required=True, valudate=validate.Range(min=1))
     bot_id = fields.Int(required=True, valudate=validate.Range(min=1))
+    refresh = fields.Bool(required=False, load_default=False)
@@ -0,0 +1,190 @@
+from logging import Logger
+import bisect
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from envs import (
+    SMARTPROXY_AUTH,
+    SMARTPROXY_URL,
+    SCRAPE_MAX_CONCURRENCY,
+    SCRAPE_RATE_LIMIT_PER_SECOND,
+    SCRAPE_CONNECT_TIMEOUT_SECONDS,
+    SCRAPE_READ_TIMEOUT_SECONDS,
+    SCRAPE_MAX_RETRIES
+)
+from logger import logger as default_logger
+
+
+# upper bounds (seconds) of the latency histogram buckets, the last one catches the rest
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, float("inf"))
+# the histogram is logged every this many calls
+STATS_LOG_INTERVAL = 100
+
+
+class LatencyHistogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.outcomes = {}
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float, outcome: str):
+        # returns the number of calls observed so far
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            return sum(self.counts)
+
+    def percentile(self, q: float):
+        # upper bound of the bucket the q-th call falls in
+        with self.lock:
+            total = sum(self.counts)
+            if total == 0:
+                return 0.0
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= q * total:
+                    return bound
+
+    def stats(self):
+        with self.lock:
+            stats = {
+                "calls": sum(self.counts),
+                "outcomes": dict(self.outcomes),
+                "buckets": {f"<={bound}s": count for bound, count in zip(self.buckets, self.counts)}
+            }
+        return {**stats, "p50": self.percentile(0.5), "p95": self.percentile(0.95)}
+
+
+class RateLimiter:
+    # spaces the calls out to at most `rate_per_second` (across threads), 0 disables it
+    def __init__(self, rate_per_second: float):
+        self.interval = 1 / rate_per_second if rate_per_second > 0 else 0
+        self.next_call_at = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.interval == 0:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            call_at = max(now, self.next_call_at)
+            self.next_call_at = call_at + self.interval
+
+        if call_at > now:
+            time.sleep(call_at - now)
+
+
+class ScrapeClient:
+    # client of the smartproxy scraper api, shared by the threads of the processor. calls go
+    # through a pooled session, with connect/read timeouts, at most `max_concurrency` in
+    # flight and at most `rate_per_second` started per second. 429s, 5xxs and network errors
+    # are retried with exponential backoff and full jitter
+    def __init__(self, url: str = SMARTPROXY_URL, auth: str = SMARTPROXY_AUTH,
+                 max_concurrency: int = SCRAPE_MAX_CONCURRENCY,
+                 rate_per_second: float = SCRAPE_RATE_LIMIT_PER_SECOND,
+                 connect_timeout: float = SCRAPE_CONNECT_TIMEOUT_SECONDS,
+                 read_timeout: float = SCRAPE_READ_TIMEOUT_SECONDS,
+                 max_retries: int = SCRAPE_MAX_RETRIES):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.headers.update({
+            "accept": "application/json",
+            "content-type": "application/json",
+            "authorization": f"Basic {auth}"
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.rate_limiter = RateLimiter(rate_per_second)
+        self.histogram = LatencyHistogram()
+
+    def scrape(self, url: str, logger: Logger = default_logger):
+        # returns the html of the page, None if it could not be scraped
+        payload = {
+            "headless": "html",
+            "target": "universal",
+            "url": url
+        }
+        attempt = 0
+        while True:
+            response = self.post(payload, logger)
+            if response is not None and response.status_code != 429 and response.status_code < 500:
+                break
+
+            attempt += 1
+            if attempt > self.max_retries:
+                logger.error(f"failed to scrape {url} after {attempt} attempts")
+                return None
+
+            delay = random.uniform(0, min(30, 2 ** attempt))
+            # honour the proxy asking us to slow down
+            retry_after = response.headers.get(
+                "retry-after") if response is not None else None
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            logger.warning(
+                f"scraping {url} failed ({response.status_code if response is not None else 'network error'}), "
+                f"retry {attempt} in {delay:.1f}s")
+            time.sleep(delay)
+
+        if not response.ok:
+            logger.error(
+                f"failed to scrape {url}: {response.status_code} {response.text[:200]}")
+            return None
+
+        try:
+            results = response.json().get("results") or []
+        except ValueError:
+            results = []
+        if len(results) == 0:
+            logger.error(f"smartproxy returned no results for {url}")
+            return None
+
+        logger.info(f"smartproxy task_id: {results[0].get('task_id')}")
+        return results[0].get("content")
+
+    def post(self, payload: dict, logger: Logger):
+        # one call, None on network errors and timeouts
+        with self.slots:
+            self.rate_limiter.acquire()
+            t1 = time.perf_counter()
+            outcome = "error"
+            try:
+                response = self.session.post(
+                    self.url, json=payload, timeout=self.timeout)
+                outcome = str(response.status_code)
+                return response
+            except requests.Timeout as e:
+                outcome = "timeout"
+                logger.warning(f"smartproxy call timed out: {e}")
+            except requests.ConnectionError as e:
+                logger.warning(f"smartproxy call failed: {e}")
+            finally:
+                elapsed = time.perf_counter() - t1
+                calls = self.histogram.observe(elapsed, outcome)
+                logger.info(
+                    f"smartproxy api response time: {elapsed:.2f} seconds ({outcome}) for {payload['url']}")
+                if calls % STATS_LOG_INTERVAL == 0:
+                    logger.info(f"smartproxy stats: {self.histogram.stats()}")
+
+        return None
+
+    def stats(self):
+        return self.histogram.stats()
+
+
+scrape_client = ScrapeClient()
+
+
+def scrape_url_smartproxy(url: str, logger: Logger):
+    return scrape_client.scrape(url, logger)
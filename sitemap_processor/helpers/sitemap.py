@@ -1,38 +1,156 @@
+from concurrent.futures import ThreadPoolExecutor
 from logging import Logger
+import threading
 import time
 import urllib.parse
 
-from usp.tree import sitemap_tree_for_homepage
+from usp.fetch_parse import SitemapFetcher
+from usp.web_client.requests_client import RequestsWebClient
 from bs4 import BeautifulSoup
 import requests
+from requests.adapters import HTTPAdapter
 
-from envs import SMARTPROXY_AUTH
+from envs import (
+    SITEMAP_PROBE_TIMEOUT_SECONDS,
+    SITEMAP_CACHE_TTL_SECONDS,
+    SITEMAP_FETCH_TIMEOUT_SECONDS
+)
+from helpers.scrape import scrape_url_smartproxy
+
+
+COMMON_SITEMAP_PATHS = [
+    "/sitemap.xml",
+    "/sitemap_index.xml",
+    "/sitemap/sitemap.xml",
+    "/sitemap/sitemap_index.xml",
+    "/sitemap/sitemap.xml.gz",
+    "/sitemap/sitemap_index.xml.gz",
+]
+# servers that do not answer HEAD properly, the probe falls back to a ranged GET
+HEAD_NOT_SUPPORTED = {403, 405, 501}
+# content types that are a sitemap, and html (a soft 404) that is not one. anything else
+# (application/octet-stream is common for .xml.gz) is told apart by the first bytes
+SITEMAP_CONTENT_TYPES = ("xml", "gzip")
+NOT_SITEMAP_CONTENT_TYPES = ("text/html",)
+# enough of the body to tell a sitemap from an html (soft 404) page
+PROBE_RANGE_BYTES = 1024
+SITEMAP_PREFIXES = (b"<?xml", b"<urlset", b"<sitemapindex", b"\x1f\x8b")
+
+# robots.txt and all the common paths are probed at once, straight to the site
+probe_executor = ThreadPoolExecutor(max_workers=len(COMMON_SITEMAP_PATHS) + 1)
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_maxsize=len(COMMON_SITEMAP_PATHS) + 1))
+session.mount("https://", HTTPAdapter(pool_maxsize=len(COMMON_SITEMAP_PATHS) + 1))
+
+# {host: (sitemap_url, expires_at)}
+sitemap_url_cache = {}
+sitemap_url_cache_lock = threading.Lock()
+
+
+def is_sitemap_content_type(content_type: str):
+    # True/False when the content type tells, None when the body has to be looked at
+    content_type = content_type.lower()
+    if any(t in content_type for t in SITEMAP_CONTENT_TYPES):
+        return True
+    if any(t in content_type for t in NOT_SITEMAP_CONTENT_TYPES):
+        return False
+    return None
+
+
+def is_sitemap(url: str):
+    try:
+        response = session.head(
+            url, timeout=SITEMAP_PROBE_TIMEOUT_SECONDS, allow_redirects=True)
+        if response.status_code not in HEAD_NOT_SUPPORTED:
+            if not response.ok:
+                return False
+            is_sitemap_type = is_sitemap_content_type(
+                response.headers.get("content-type", ""))
+            if is_sitemap_type is not None:
+                return is_sitemap_type
+
+        with session.get(url, timeout=SITEMAP_PROBE_TIMEOUT_SECONDS, stream=True,
+                         headers={"Range": f"bytes=0-{PROBE_RANGE_BYTES - 1}"}) as response:
+            if not response.ok:
+                return False
+            head = next(response.iter_content(PROBE_RANGE_BYTES), b"")
+            if head.lstrip().startswith(SITEMAP_PREFIXES):
+                return True
+            return bool(is_sitemap_content_type(response.headers.get("content-type", "")))
+    except requests.RequestException:
+        return False
+
+
+def get_robots_sitemaps(base_url: str):
+    # the `Sitemap:` directives of robots.txt, in order
+    try:
+        response = session.get(
+            f"{base_url}/robots.txt", timeout=SITEMAP_PROBE_TIMEOUT_SECONDS)
+        if not response.ok:
+            return []
+    except requests.RequestException:
+        return []
+
+    sitemaps = []
+    for line in response.text.splitlines():
+        key, _, value = line.partition(":")
+        if key.strip().lower() == "sitemap" and value.strip() != "":
+            sitemaps.append(urllib.parse.urljoin(base_url, value.strip()))
+
+    return sitemaps
+
+
+def probe_sitemap_url(base_url: str):
+    # the sitemaps declared in robots.txt win, then the first common path (in order) that
+    # is a sitemap. the probes run concurrently, the slowest one bounds the discovery
+    robots = probe_executor.submit(get_robots_sitemaps, base_url)
+    probes = [(f"{base_url}{path}", probe_executor.submit(is_sitemap, f"{base_url}{path}"))
+              for path in COMMON_SITEMAP_PATHS]
+
+    try:
+        sitemaps = robots.result()
+        if len(sitemaps) == 1:
+            return sitemaps[0]
+        if len(sitemaps) > 1:
+            # usp reads a robots.txt url as an index of all the sitemaps it declares
+            return f"{base_url}/robots.txt"
+
+        for url, probe in probes:
+            if probe.result():
+                return url
+    finally:
+        for _, probe in probes:
+            probe.cancel()
+
+    return None
 
 
 def get_sitemap_url(practice_url: str, logger: Logger):
     parsed_url = urllib.parse.urlparse(practice_url)
     base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
 
-    common_sitemap_paths = [
-        "/sitemap.xml",
-        "/sitemap_index.xml",
-        "/sitemap/sitemap.xml",
-        "/sitemap/sitemap_index.xml",
-        "/sitemap/sitemap.xml.gz",
-        "/sitemap/sitemap_index.xml.gz",
-    ]
-
-    for path in common_sitemap_paths:
-        url = f"{base_url}{path}"
-        try:
-            response = requests.get(url)
-            if response.ok and 'text/xml' in response.headers.get('content-type', '').lower():
-                return url
-        except:
-            pass
+    with sitemap_url_cache_lock:
+        cached = sitemap_url_cache.get(base_url)
+    if cached is not None and cached[1] > time.monotonic():
+        logger.info(f"Sitemap url for {base_url} found in the cache")
+        return cached[0]
+
+    sitemap_url = probe_sitemap_url(base_url)
+    if sitemap_url is None:
+        sitemap_url = get_sitemap_url_from_home_page(practice_url, logger)
+
+    # only found locations are cached, a site without a sitemap may add one
+    if sitemap_url is not None:
+        with sitemap_url_cache_lock:
+            sitemap_url_cache[base_url] = (
+                sitemap_url, time.monotonic() + SITEMAP_CACHE_TTL_SECONDS)
+
+    return sitemap_url
 
+
+def get_sitemap_url_from_home_page(practice_url: str, logger: Logger):
     logger.info(
-        "No sitemap found in the common paths. Trying to find sitemap url from the home page.")
+        "No sitemap found in robots.txt or the common paths. Trying to find sitemap url from the home page.")
     try:
         html = scrape_url_smartproxy(practice_url, logger)
         if html is None:
@@ -42,39 +160,24 @@ def get_sitemap_url(practice_url: str, logger: Logger):
         soup = BeautifulSoup(html, 'html.parser')
         link_tags = soup.find_all('link')
         for tag in link_tags:
-            if tag.get('rel') == 'sitemap':
-                return tag.get('href')
+            if 'sitemap' in (tag.get('rel') or []) and tag.get('href'):
+                return urllib.parse.urljoin(practice_url, tag.get('href'))
     except:
         return None
 
 
 def scrape_sitemap(sitemap_url: str):
-    s = sitemap_tree_for_homepage(sitemap_url)
-
-    urls = [p.url for p in s.all_pages()]
-
-    return list(set(urls))
-
-
-def scrape_url_smartproxy(url: str, logger: Logger):
-    payload = {
-        "headless": "html",
-        "target": "universal",
-        "url": url
-    }
-    headers = {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "authorization": f"Basic {SMARTPROXY_AUTH}"
-    }
-    t1 = time.time()
-    response = requests.post(
-        "https://scraper-api.smartproxy.com/v2/scrape", json=payload, headers=headers)
-    t2 = time.time()
-    data = response.json()
-    logger.info(f'url: {url}')
-    logger.info(f'smartproxy api response time: {t2-t1} seconds')
-    logger.info(f'smartproxy task_id: {data["results"][0]["task_id"]}')
-    if response.ok:
-        html = data['results'][0]['content']
-        return html
+    # {url: lastmod of the page in the sitemap, None when the sitemap has none}.
+    # the discovered sitemap is fetched as is, `sitemap_tree_for_homepage` would strip it
+    # back to the home page and go through robots.txt and the known paths again
+    web_client = RequestsWebClient()
+    web_client.set_timeout(SITEMAP_FETCH_TIMEOUT_SECONDS)
+    s = SitemapFetcher(url=sitemap_url, recursion_level=0,
+                       web_client=web_client).sitemap()
+
+    pages = {}
+    for p in s.all_pages():
+        if pages.get(p.url) is None:
+            pages[p.url] = p.last_modified.isoformat() if p.last_modified else None
+
+    return pages
@@ -35,11 +35,19 @@ channel.queue.declare(queue=INPUT_QUEUE_NAME, durable=True)
 channel.queue.declare(queue=OUTPUT_QUEUE_NAME, durable=True)
 
 
-def send_message_to_output_queue(bot_id: int, asset_id: int):
-    output_msg = json.dumps({
+def send_message_to_output_queue(bot_id: int, asset_id: int, lastmod: str = None, refresh: bool = False,
+                                 force: bool = False):
+    output_msg = {
         "bot_id": bot_id,
         "asset_id": asset_id
-    })
+    }
+    if lastmod is not None:
+        output_msg["lastmod"] = lastmod
+    if refresh:
+        output_msg["refresh"] = True
+    if force:
+        output_msg["force"] = True
+    output_msg = json.dumps(output_msg)
 
     message = Message.create(channel, output_msg, properties={
         'delivery_mode': 2
@@ -48,6 +56,142 @@ def send_message_to_output_queue(bot_id: int, asset_id: int):
     message.publish(OUTPUT_QUEUE_NAME)
 
 
+def create_child_assets(cur, bot_id: int, asset_id: int, urls: list):
+    asset_ids = []
+    for url in urls:
+        url = url.replace("'", "''")
+        cur.execute(
+            f"INSERT INTO public.asset (guid, type, value, status, parent_asset_id) VALUES ('{str(uuid.uuid4().hex)}', 'url', '{url}', 'PENDING', {asset_id}) RETURNING id;")
+        id = cur.fetchone()[0]
+        asset_ids.append(id)
+
+    for id in asset_ids:
+        cur.execute(
+            f"INSERT INTO public.bot_assets (bot_id, asset_id) VALUES ({bot_id}, {id});")
+
+    return asset_ids
+
+
+def release_blocks(cur, parent_asset_id: int, asset_ids: list):
+    # same as helpers/boilerplate.release_blocks of the asset processor: the pages do not
+    # count for their blocks anymore and their claims are cleared. returns how many blocks
+    # were claimed by them, i.e. are not stored for any page of the sitemap anymore
+    cur.execute("""
+        WITH visits AS (
+            DELETE FROM public.sitemap_block_asset
+            WHERE parent_asset_id = %(parent_asset_id)s AND asset_id = ANY(%(asset_ids)s)
+            RETURNING band, band_hash
+        ),
+        released AS (
+            SELECT band, band_hash, count(*) AS num_assets
+            FROM visits
+            GROUP BY band, band_hash
+        ),
+        locked AS (
+            SELECT b.band, b.band_hash, r.num_assets,
+                COALESCE(b.first_asset_id = ANY(%(asset_ids)s), FALSE) AS is_claimed
+            FROM public.sitemap_block b
+            JOIN released r ON r.band = b.band AND r.band_hash = b.band_hash
+            WHERE b.parent_asset_id = %(parent_asset_id)s
+            ORDER BY b.band, b.band_hash
+            FOR UPDATE OF b
+        )
+        UPDATE public.sitemap_block b
+        SET asset_count = GREATEST(b.asset_count - l.num_assets, 0),
+            first_asset_id = CASE WHEN l.is_claimed THEN NULL ELSE b.first_asset_id END
+        FROM locked l
+        WHERE b.parent_asset_id = %(parent_asset_id)s AND b.band = l.band AND b.band_hash = l.band_hash
+        RETURNING l.is_claimed;
+    """, {"parent_asset_id": parent_asset_id, "asset_ids": list(asset_ids)})
+
+    return sum(1 for row in cur.fetchall() if row[0])
+
+
+def refresh_sitemap(bot_id: int, asset_id: int, pages: dict):
+    # re-crawl of a processed sitemap: pages whose lastmod changed (or without one) are
+    # refreshed by the asset processor, which skips the ones whose http validators did not
+    # change either. failed pages are processed again, new pages are added and the ones that
+    # are not in the sitemap anymore are removed from the bot.
+    # blocks stored only with a removed page (site chrome) are stored again by re-processing
+    # one of the remaining pages
+    children = db.query(f"""
+                        SELECT a.id, a.status, a.value, a.asset_metadata
+                        FROM public.asset a
+                        JOIN public.bot_assets ba ON ba.asset_id = a.id
+                        WHERE a.parent_asset_id = {asset_id} AND a.deleted_at IS NULL
+                        AND ba.bot_id = {bot_id} AND ba.deleted_at IS NULL;""")
+
+    existing = {child["value"]: child for _, child in children.iterrows()}
+    gone = [int(child["id"])
+            for url, child in existing.items() if url not in pages]
+    new_urls = [url for url in pages if url not in existing]
+    new_urls = new_urls[:max(0, MAX_URLS_ALLOWED - len(existing) + len(gone))]
+
+    refreshed = []
+    retried = []
+    kept = []
+    for url, child in existing.items():
+        if url not in pages:
+            continue
+        if child["status"] == "FAILED":
+            retried.append(int(child["id"]))
+            continue
+        if child["status"] != "SUCCESS":
+            continue
+        kept.append(int(child["id"]))
+        metadata = child["asset_metadata"] if isinstance(
+            child["asset_metadata"], dict) else {}
+        if pages[url] is not None and metadata.get("lastmod") == pages[url]:
+            continue
+        refreshed.append(int(child["id"]))
+
+    num_released = 0
+    with db.connection:
+        with db.connection.cursor() as cur:
+            new_asset_ids = create_child_assets(cur, bot_id, asset_id, new_urls)
+            if len(retried) > 0:
+                cur.execute(
+                    "UPDATE public.asset SET status = 'PENDING' WHERE id = ANY(%s);", (retried,))
+            if len(gone) > 0:
+                cur.execute("""
+                    UPDATE public.bot_assets SET deleted_at = now()
+                    WHERE bot_id = %s AND asset_id = ANY(%s) AND deleted_at IS NULL;
+                """, (bot_id, gone))
+                num_released = release_blocks(cur, asset_id, gone)
+                # invalidates the bot's cached answers, see the asset processor
+                cur.execute(
+                    f"UPDATE public.bot SET updated_at = now() WHERE id = {bot_id};")
+            if len(new_asset_ids) > 0 or len(gone) > 0:
+                # the staging bot does not have the assets of its live bot anymore
+                cur.execute(
+                    f"UPDATE public.bot SET is_deviating_from_live = TRUE WHERE id = {bot_id} AND associated_bot_id IS NOT NULL;")
+
+    logger.info(
+        f"Refreshing sitemap: {len(refreshed)} pages changed, {len(retried)} failed pages retried, "
+        f"{len(new_asset_ids)} new pages, {len(gone)} pages removed, "
+        f"{len(existing) - len(gone) - len(refreshed) - len(retried)} unchanged")
+
+    # re-parsed even when it did not change, it claims the released blocks
+    forced = None
+    if num_released > 0 and len(kept) > 0:
+        forced = kept[0]
+        refreshed = [id for id in refreshed if id != forced]
+        logger.info(
+            f"{num_released} blocks were only stored with removed pages, re-processing asset {forced}")
+
+    id_to_url = {int(child["id"]): url for url, child in existing.items()}
+    if forced is not None:
+        send_message_to_output_queue(
+            bot_id, forced, lastmod=pages[id_to_url[forced]], refresh=True, force=True)
+    for id in refreshed:
+        send_message_to_output_queue(
+            bot_id, id, lastmod=pages[id_to_url[id]], refresh=True)
+    for id in retried:
+        send_message_to_output_queue(bot_id, id, lastmod=pages[id_to_url[id]])
+    for id, url in zip(new_asset_ids, new_urls):
+        send_message_to_output_queue(bot_id, id, lastmod=pages[url])
+
+
 def handle_message(message):
     try:
         input_msg = message.body
@@ -62,6 +206,8 @@ def handle_message(message):
 
     bot_id = parsed_msg['bot_id']
     asset_id = parsed_msg['asset_id']
+    # re-crawl of a sitemap processed before, see refresh_sitemap
+    refresh = parsed_msg.get('refresh', False)
     set_prefix(logger, f"bot_id={bot_id}, asset_id={asset_id}")
     try:
         # If the bot status is `FAILED`, do not process the asset.
@@ -105,17 +251,21 @@ def handle_message(message):
             raise Exception(f"Asset with id {asset_id} not found")
 
         asset_data = asset_data.iloc[0]
-        if asset_data["status"] != "PENDING":
+        # a refresh only re-crawls sitemaps that were processed successfully
+        if refresh and asset_data["status"] != "SUCCESS":
+            raise Exception(
+                f"Asset with id {asset_id} is not SUCCESS. Skipping refresh of asset {asset_id}")
+        if not refresh and asset_data["status"] != "PENDING":
             raise Exception(
                 f"Asset with id {asset_id} is not PENDING. Skipping processing of asset {asset_id}")
 
-        logger.info("Processing asset")
+        logger.info("Refreshing asset" if refresh else "Processing asset")
 
         if asset_data["type"] != "practice_url":
             logger.info(f"not processing asset of type {asset_data['type']}")
             return
 
-        if bot_data["status"] == "QUEUED":
+        if not refresh and bot_data["status"] == "QUEUED":
             db.execute(
                 f"UPDATE public.bot SET status = 'PROGRESS' WHERE id = {bot_id};")
             logger.info(f"Bot is in PROGRESS now")
@@ -124,6 +274,11 @@ def handle_message(message):
         logger.info(
             f"Sitemap for practice url {asset_data['value']} is {sitemap_url}")
 
+        if sitemap_url is None and refresh:
+            # the pages of the previous crawl stay as they are
+            raise Exception(
+                f"Failed to find sitemap url for practice url {asset_data['value']}. Skipping refresh.")
+
         if sitemap_url is None:
             # mark the asset as failed in the db
             db.execute(
@@ -134,7 +289,16 @@ def handle_message(message):
             raise Exception(
                 f"Failed to find sitemap url for practice url {asset_data['value']}. Marking the asset and bot as FAILED.")
 
-        urls = scrape_sitemap(sitemap_url)
+        pages = scrape_sitemap(sitemap_url)
+
+        if refresh:
+            if len(pages) == 0:
+                raise Exception(
+                    f"No urls found in the sitemap {sitemap_url}. Skipping refresh.")
+            refresh_sitemap(bot_id, asset_id, pages)
+            return
+
+        urls = list(pages)
 
         if len(urls) == 0:
             logger.info(f"No urls found in the sitemap {sitemap_url}")
@@ -152,17 +316,8 @@ def handle_message(message):
         try:
             with db.connection:
                 with db.connection.cursor() as cur:
-                    asset_ids = []
-                    for url in urls:
-                        url = url.replace("'", "''")
-                        cur.execute(
-                            f"INSERT INTO public.asset (guid, type, value, status, parent_asset_id) VALUES ('{str(uuid.uuid4().hex)}', 'url', '{url}', 'PENDING', {asset_id}) RETURNING id;")
-                        id = cur.fetchone()[0]
-                        asset_ids.append(id)
-
-                    for asset_id in asset_ids:
-                        cur.execute(
-                            f"INSERT INTO public.bot_assets (bot_id, asset_id) VALUES ({bot_id}, {asset_id});")
+                    asset_ids = create_child_assets(
+                        cur, bot_id, asset_id, urls)
         except Exception as e:
             capture_exception(
                 e, metadata={"bot_id": bot_id, "asset_id": asset_id})
@@ -178,8 +333,8 @@ def handle_message(message):
         logger.info(
             f"Successfully created {len(urls)} assets for the sitemap {sitemap_url}")
 
-        for asset_id in asset_ids:
-            send_message_to_output_queue(bot_id, asset_id)
+        for id, url in zip(asset_ids, urls):
+            send_message_to_output_queue(bot_id, id, lastmod=pages[url])
 
     except Exception as e:
         capture_exception(e, metadata={"bot_id": bot_id, "asset_id": asset_id})